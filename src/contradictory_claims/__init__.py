@@ -2,10 +2,35 @@
 
 """A package for finding contradictory claims related to COVID-19 drug treatments in the CORD-19 literature."""
 
-from .data.make_dataset import *  # noqa:F401,F403
-# from .extract_claims import  # noqa:F401,F403
-#  from .models import train_model  # noqa:F401
-from .models.train_model import *  # noqa:F401,F403
-from .models.sbert_models import train_sbert_model  # noqa:F401
-from .models.evaluate_model import *  # noqa:F401,F403
-from .models.analysis_utils import *  # noqa:F401,F403
+import importlib
+
+# Public functions re-exported from the submodules, by submodule. They are imported on first access, so that
+# importing the package does not pull in TensorFlow, PyTorch or spacy
+_LAZY_EXPORTS = {
+    '.data.make_dataset': ['load_multi_nli', 'load_med_nli', 'load_mancon_corpus_from_sent_pairs',
+                           'load_drug_virus_lexicons', 'SentencePairBatch'],
+    '.models.train_model': ['regular_encode', 'encode_sentence_pairs', 'build_model', 'save_model', 'load_model',
+                            'train_model'],
+    '.models.sbert_models': ['train_sbert_model'],
+    '.models.evaluate_model': ['read_data_from_excel', 'make_predictions', 'make_sbert_predictions', 'print_pair',
+                               'print_pair_2', 'custom_plot_confusion_matrix', 'create_report'],
+    '.models.analysis_utils': ['dates_to_proportions', 'make_timeline_plot'],
+}
+_EXPORT_MODULES = {name: module for module, names in _LAZY_EXPORTS.items() for name in names}
+
+__all__ = list(_EXPORT_MODULES)
+
+
+def __getattr__(name):
+    """Import a re-exported function from its submodule on first access."""
+    if name not in _EXPORT_MODULES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_EXPORT_MODULES[name], __name__), name)
+    globals()[name] = value
+
+    return value
+
+
+def __dir__():
+    """List the module attributes, including the re-exported functions not imported yet."""
+    return sorted(set(globals()) | set(__all__))
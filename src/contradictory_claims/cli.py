@@ -6,18 +6,6 @@ import os
 import shutil
 
 import click
-import pandas as pd
-
-from .data.make_dataset import \
-    load_drug_virus_lexicons, load_mancon_corpus_from_sent_pairs, load_med_nli, load_multi_nli
-from .data.preprocess_cord import clean_text, extract_json_to_dataframe,\
-    extract_section_from_text, filter_metadata_for_covid19,\
-    filter_section_with_drugs, merge_section_text
-from .data.process_claims import add_cord_metadata, initialize_nlp, pair_similar_claims,\
-    split_papers_on_claim_presence, tokenize_section_text
-from .models.evaluate_model import create_report, make_predictions, make_sbert_predictions, read_data_from_excel
-from .models.sbert_models import load_sbert_model, save_sbert_model, train_sbert_model
-from .models.train_model import load_model, save_model, train_model
 
 
 @click.command()
@@ -26,8 +14,26 @@ from .models.train_model import load_model, save_model, train_model
 @click.option('--report/--no-report', 'report', default=False)
 @click.option('--cord-version', 'cord_version', default='2020-08-10')
 @click.option('--sbert', 'sbert', default=False)
-def main(extract, train, report, cord_version, sbert):
+@click.option('--plan/--no-plan', 'plan', default=False, help='Report the cost of pairing the claims and exit')
+@click.option('--similarity-backend', 'similarity_backend', type=click.Choice(['scispacy', 'tfidf']),
+              default='scispacy', help='Claim vectors used to pair similar claims')
+@click.option('--collapse-duplicates/--no-collapse-duplicates', 'collapse_duplicates', default=False,
+              help='Pair one representative of each group of near-duplicate claims')
+def main(extract, train, report, cord_version, sbert, plan, similarity_backend, collapse_duplicates):
     """Run main function."""
+    # Import the pipeline inside main, so that --help does not load pandas, TensorFlow or spacy
+    import pandas as pd
+
+    from .data.deduplicate_claims import collapse_near_duplicate_claims
+    from .data.make_dataset import \
+        load_drug_virus_lexicons, load_mancon_corpus_from_sent_pairs, load_med_nli, load_multi_nli
+    from .data.preprocess_cord import clean_text, extract_json_to_dataframe,\
+        extract_section_from_text, filter_metadata_for_covid19,\
+        filter_section_with_drugs, merge_section_text
+    from .data.pairing_plan import plan_claim_pairing
+    from .data.process_claims import add_cord_metadata, detect_abbreviations, initialize_nlp, pair_similar_claims,\
+        split_papers_on_claim_presence, tokenize_section_text
+
     # Model parameters
     model_name = "allenai/biomed_roberta_base"
     model_id = "biomed_roberta"
@@ -116,50 +122,69 @@ def main(extract, train, report, cord_version, sbert):
     else:
         claims_data = pd.read_csv(claims_data_path)
 
-    # Initialize scispacy nlp object and add virus terms to the vocabulary
-    nlp = initialize_nlp(virus_lex_path)
+    if collapse_duplicates:
+        # Collapse claims repeated across papers (e.g. preprint and journal versions) so each is paired only once.
+        # Representatives keep the cord_uids of all their papers, which pairing checks for same-paper pairs
+        claims_data = collapse_near_duplicate_claims(claims_data)
+
+    if plan:
+        # Dry run: report the candidate pairs, memory and runtime of pairing the claims without running it
+        pairing_plan = plan_claim_pairing(claims_data)
+        click.echo(pairing_plan['drug_pairs'].head(20).to_string(index=False))
+        click.echo(f"Claims: {pairing_plan['num_claims']}, drug terms: {pairing_plan['num_drugs']}, "
+                   f"candidate pairs: {pairing_plan['candidate_pairs']}")
+        click.echo(f"Estimated memory: {pairing_plan['memory_bytes'] / 1e9:.2f} GB, "
+                   f"runtime: {pairing_plan['runtime_seconds'] / 60:.1f} min")
+        click.echo(f"Recommended strategy: {pairing_plan['strategy']}")
+        return
 
-    # Pair similar claims
-    claims_paired_df = pair_similar_claims(claims_data, nlp)
+    # Initialize scispacy nlp object and add virus terms to the vocabulary. The TF-IDF backend does not need it
+    nlp = initialize_nlp(virus_lex_path) if similarity_backend == 'scispacy' else None
+
+    # Detect abbreviations once per paper section, rather than in every claim
+    abbreviation_maps = detect_abbreviations(claims_data, nlp) if nlp is not None else None
+
+    # Pair similar claims. Pairs reference the claim and paper tables by id rather than copying their text
+    claim_pair_tables = pair_similar_claims(claims_data, nlp, return_tables=True, backend=similarity_backend,
+                                            abbreviation_maps=abbreviation_maps)
 
     # Add paper publish time and title info
-    claims_paired_df = add_cord_metadata(claims_paired_df, metadata_path)
+    claim_pair_tables = add_cord_metadata(claim_pair_tables, metadata_path)  # noqa: F841
 
     if train:
         # Load BERT train and test data
-        multi_nli_train_x, multi_nli_train_y, multi_nli_test_x, multi_nli_test_y = \
-            load_multi_nli(multinli_train_path, multinli_test_path)
-        med_nli_train_x, med_nli_train_y, med_nli_test_x, med_nli_test_y = \
-            load_med_nli(mednli_train_path, mednli_dev_path, mednli_test_path)
-        man_con_train_x, man_con_train_y, man_con_test_x, man_con_test_y = \
-            load_mancon_corpus_from_sent_pairs(mancon_sent_pairs)
+        multi_nli_train, multi_nli_test = load_multi_nli(multinli_train_path, multinli_test_path)
+        med_nli_train, med_nli_test = load_med_nli(mednli_train_path, mednli_dev_path, mednli_test_path)
+        man_con_train, man_con_test = load_mancon_corpus_from_sent_pairs(mancon_sent_pairs)
         drug_names, virus_names = load_drug_virus_lexicons(drug_lex_path, virus_lex_path)
 
+        # Tokenized sentence pairs are cached between training runs
+        token_cache_dir = os.path.join(root_dir, 'output/token_cache')
+
+        # The model modules import torch or TensorFlow, so only the one a run uses is imported
         if sbert:
+            from .models.sbert_models import save_sbert_model, train_sbert_model
+
             sbert_model = train_sbert_model(model_name,
                                             mancon_corpus=True,
                                             med_nli=True,
                                             multi_nli=True,
-                                            multi_nli_train_x=multi_nli_train_x,
-                                            multi_nli_train_y=multi_nli_train_y,
-                                            multi_nli_test_x=multi_nli_test_x,
-                                            multi_nli_test_y=multi_nli_test_y,
-                                            med_nli_train_x=med_nli_train_x,
-                                            med_nli_train_y=med_nli_train_y,
-                                            med_nli_test_x=med_nli_test_x,
-                                            med_nli_test_y=med_nli_test_y,
-                                            man_con_train_y=man_con_train_y,
-                                            man_con_train_x=man_con_train_x,
-                                            man_con_test_x=man_con_test_x,
-                                            man_con_test_y=man_con_test_y)
+                                            multi_nli_train=multi_nli_train,
+                                            multi_nli_test=multi_nli_test,
+                                            med_nli_train=med_nli_train,
+                                            med_nli_test=med_nli_test,
+                                            man_con_train=man_con_train,
+                                            man_con_test=man_con_test,
+                                            token_cache_dir=token_cache_dir)
             save_sbert_model(sbert_model)
         else:
+            from .models.train_model import save_model, train_model
+
             # Train model
-            trained_model, _ = train_model(multi_nli_train_x, multi_nli_train_y, multi_nli_test_x, multi_nli_test_y,
-                                           med_nli_train_x, med_nli_train_y, med_nli_test_x, med_nli_test_y,
-                                           man_con_train_x, man_con_train_y, man_con_test_x, man_con_test_y,
+            trained_model, _ = train_model(multi_nli_train, multi_nli_test, med_nli_train, med_nli_test,
+                                           man_con_train, man_con_test,
                                            drug_names, virus_names,
-                                           model_name=model_name)
+                                           model_name=model_name, token_cache_dir=token_cache_dir)
             save_model(trained_model)
         # Save model
         out_dir = 'output/working/'
@@ -168,14 +193,21 @@ def main(extract, train, report, cord_version, sbert):
         shutil.make_archive('biobert_output', 'zip', root_dir=out_dir)  # ok currently this seems to do nothing
     else:
         if sbert:
+            from .models.sbert_models import load_sbert_model
+
             sbert_dir = os.path.join(root_dir, sbert_trained_model_out_dir)
             sbert_model = load_sbert_model(sbert_dir, 'sigmoid.pickle')
         else:
+            from .models.train_model import load_model
+
             transformer_dir = os.path.join(root_dir, trained_model_out_dir)
             pickle_file = os.path.join(transformer_dir, 'sigmoid.pickle')
             trained_model = load_model(pickle_file, transformer_dir)
 
     if report:
+        from .models.evaluate_model import create_report, make_predictions, make_sbert_predictions,\
+            read_data_from_excel
+
         eval_data_dir = os.path.join(root_dir, "input")
         # eval_data_path = os.path.join(eval_data_dir, "drug_individual_claims_similarity_annotated.xlsx")
         # active_sheet = "drug_individual_claims_similari"
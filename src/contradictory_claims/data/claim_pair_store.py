@@ -0,0 +1,205 @@
+"""Functions for extending, rescoring and loading the claim pair stores written by pair_similar_claims."""
+
+# -*- coding: utf-8 -*-
+
+from typing import Dict, Iterable, List
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import issparse
+
+from .pair_scoring import iter_pairs_above_threshold, iter_pairs_in_parallel, pairing_paper_ids
+from .pair_store import PAIR_COLUMNS, append_claim_pairs, clear_claim_pairs, read_claim_pairs, read_claim_tables,\
+    read_claim_vectors, read_drugs, read_similarity_histogram, write_claim_tables, write_claim_vectors, write_drugs,\
+    write_similarity_histogram
+from .process_claims import ClaimPairTables, build_drug_claim_index, embed_claims, expand_abbreviations,\
+    extract_drug_terms, get_drug_terms_mention
+from .similarity_histogram import SimilarityHistogram, empty_similarity_histogram
+
+
+def pair_new_claims(new_claims_data: pd.DataFrame, nlp, out_dir: str, threshold: float = 0.5,
+                    chunk_size: int = 1000000, abbreviation_maps: Dict[str, Dict[str, str]] = None):
+    """
+    Pair newly arrived claims against the claims of a pair store written by pair_similar_claims.
+
+    Only new x old and new x new candidate pairs are scored, using the stored claim vectors for the old claims,
+    and appended to the stored pairs. Drug terms not seen before are the exception: all claims mentioning them
+    are paired in their blocks. Claims already in the store (same cord_uid and claim text) are skipped, and old
+    claims that were dropped for not mentioning any drug term are not revisited.
+
+    :param new_claims_data: pandas dataframe with new cord 19 claims
+    :param nlp: Scispacy nlp object
+    :param out_dir: directory of the pair store
+    :param threshold: minimum cosine similarity of a pair of claims; should match the one used for the store
+    :param chunk_size: approximate number of candidate pairs scored at a time
+    :param abbreviation_maps: if given, per cord_uid abbreviation maps of the new claims' papers. The stored
+        claims are matched to new drug terms in the text they were indexed by, expanded if they were
+    :return: Number of claim pairs appended to the store
+    """
+    claims, papers = read_claim_tables(out_dir)
+    drugs = read_drugs(out_dir)
+    num_old_claims, num_old_drugs = len(claims), len(drugs)
+    old_claim_vectors = read_claim_vectors(out_dir)
+    if issparse(old_claim_vectors):
+        raise ValueError('TF-IDF claim vectors are fitted to the claims of a pairing run and cannot be extended')
+
+    # Skip claims that are already in the store
+    old_claim_keys = pd.MultiIndex.from_arrays([papers.cord_uid.to_numpy()[claims.paper_id.to_numpy()],
+                                                claims.claims.to_numpy()])
+    is_new = ~pd.MultiIndex.from_arrays([new_claims_data.cord_uid.to_numpy(),
+                                         new_claims_data.claims.to_numpy()]).isin(old_claim_keys)
+    new_claims_data = new_claims_data[is_new]
+
+    # Drug terms not seen before get the next drug ids
+    new_drugs = sorted(set(extract_drug_terms(new_claims_data)) - set(drugs))
+
+    new_claim_texts = new_claims_data.claims.to_numpy()
+    if abbreviation_maps is not None:
+        new_claim_texts = np.array(expand_abbreviations(new_claim_texts, new_claims_data.cord_uid, abbreviation_maps),
+                                   dtype=object)
+
+    # Index the new claims by all drug terms, and the old claims by the new drug terms only
+    claim_positions, new_claims_index = build_drug_claim_index(new_claim_texts, drugs + new_drugs)
+    new_claims_data = new_claims_data.iloc[claim_positions].reset_index(drop=True)
+    new_claim_texts = new_claim_texts[claim_positions]
+    if len(new_claims_data) == 0:
+        return 0
+    old_claims_index = _index_drug_terms_mention(claims.drug_terms_mention, drugs + new_drugs)
+    if new_drugs:
+        # Match the old claims in the text they were indexed by, with their abbreviations expanded if they were
+        old_claim_texts = claims.expanded_claims if 'expanded_claims' in claims else claims.claims
+        old_positions, old_claims_new_drugs_index = build_drug_claim_index(old_claim_texts, new_drugs)
+        for drug, claim_ids in old_claims_new_drugs_index.items():
+            old_claims_index[drug] = old_positions[claim_ids].tolist()
+            for claim_id in old_claims_index[drug]:
+                claims.drug_terms_mention[claim_id].append(drug)
+
+    # Combine both indexes. New claims get the claim ids following the old ones
+    drug_claim_index = {}
+    for drug in drugs + new_drugs:
+        claim_ids = np.concatenate([np.array(old_claims_index[drug], dtype=np.int64),
+                                    new_claims_index.get(drug, np.zeros(0, dtype=np.int64)) + num_old_claims])
+        if len(claim_ids):
+            drug_claim_index[drug] = claim_ids
+
+    # Add the papers of the new claims to the papers table
+    new_cord_uids = pd.unique(new_claims_data.cord_uid[~new_claims_data.cord_uid.isin(papers.cord_uid)])
+    papers = pd.concat([papers, pd.DataFrame({'cord_uid': new_cord_uids})], ignore_index=True)
+    new_paper_ids = pd.Index(papers.cord_uid).get_indexer(new_claims_data.cord_uid).astype(np.int32)
+    new_claims = pd.DataFrame({'paper_id': new_paper_ids,
+                               'claims': new_claims_data.claims,
+                               'drug_terms_mention': get_drug_terms_mention(new_claims_index, len(new_claims_data))})
+    if 'cord_uids' in new_claims_data or 'cord_uids' in claims:
+        new_claims['cord_uids'] = list(new_claims_data.cord_uids) if 'cord_uids' in new_claims_data else \
+            [[cord_uid] for cord_uid in new_claims_data.cord_uid]
+        if 'cord_uids' not in claims:
+            # The old claims were not collapsed, so each appears in its own paper only
+            claims['cord_uids'] = [[cord_uid] for cord_uid in papers.cord_uid.to_numpy()[claims.paper_id.to_numpy()]]
+    if abbreviation_maps is not None or 'expanded_claims' in claims:
+        new_claims['expanded_claims'] = new_claim_texts
+        if 'expanded_claims' not in claims:
+            # The old claims were matched without expanding abbreviations
+            claims['expanded_claims'] = claims.claims
+    claims = pd.concat([claims, new_claims], ignore_index=True)
+
+    # Only the new claims need to be embedded
+    claim_vectors = np.vstack([old_claim_vectors, embed_claims(new_claim_texts, nlp)])
+
+    # Extend the similarity histogram with the new drug terms
+    similarity_histogram = read_similarity_histogram(out_dir)
+    if similarity_histogram is not None:
+        new_counts = empty_similarity_histogram(list(drug_claim_index)[num_old_drugs:]).counts
+        similarity_histogram = SimilarityHistogram(drugs=list(drug_claim_index),
+                                                   counts=np.vstack([similarity_histogram.counts, new_counts]))
+
+    num_new_pairs = 0
+    drugs = np.array(list(drug_claim_index), dtype=object)
+    paper_ids = pairing_paper_ids(claims.paper_id, claims.get('cord_uids'))
+    for drug_ids, claim_i, claim_j, similarities in iter_pairs_above_threshold(
+            drug_claim_index, paper_ids, claim_vectors, threshold, chunk_size, similarity_histogram,
+            new_claims_start=num_old_claims, new_drugs_start=num_old_drugs):
+        append_claim_pairs(out_dir, drugs[drug_ids], claim_i, claim_j, similarities)
+        num_new_pairs += len(claim_i)
+
+    if similarity_histogram is not None:
+        write_similarity_histogram(out_dir, similarity_histogram)
+    write_claim_tables(out_dir, claims, papers)
+    write_claim_vectors(out_dir, claim_vectors)
+    write_drugs(out_dir, list(drugs))
+
+    return num_new_pairs
+
+
+def _index_drug_terms_mention(drug_terms_mention: Iterable[List[str]], drugs: List[str]):
+    """
+    Rebuild the drug claim index from the drug terms mentioned by each claim.
+
+    :param drug_terms_mention: list of drug terms mentioned by each claim, in claim id order
+    :param drugs: drug terms in drug id order
+    :return: Dictionary mapping each drug term to a list of sorted claim ids
+    """
+    drug_claim_index = {drug: [] for drug in drugs}
+    for claim_id, claim_drugs in enumerate(drug_terms_mention):
+        for drug in claim_drugs:
+            drug_claim_index[drug].append(claim_id)
+
+    return drug_claim_index
+
+
+def rematerialize_claim_pairs(out_dir: str, threshold: float, chunk_size: int = 1000000, num_workers: int = None):
+    """
+    Replace the pairs of a pair store by those at or above a new similarity threshold, without re-embedding.
+
+    The pairs are rescored from the stored claim vectors and drug terms. For a higher threshold, reading the
+    stored pairs with load_claim_pair_tables(min_similarity=...) is cheaper; use the similarity histogram of the
+    store to choose the threshold first.
+
+    :param out_dir: directory of the pair store
+    :param threshold: minimum cosine similarity of a pair. If None, all candidate pairs are kept
+    :param chunk_size: approximate number of candidate pairs scored at a time
+    :param num_workers: if given, score the pairs of the drug terms across this many processes
+    :return: Number of stored claim pairs
+    """
+    claims, _ = read_claim_tables(out_dir)
+    drugs = read_drugs(out_dir)
+    drug_claim_index = {drug: np.array(claim_ids, dtype=np.int64)
+                        for drug, claim_ids in _index_drug_terms_mention(claims.drug_terms_mention, drugs).items()}
+    claim_vectors = read_claim_vectors(out_dir)
+    paper_ids = pairing_paper_ids(claims.paper_id, claims.get('cord_uids'))
+
+    # The candidate pairs do not change, so neither does their histogram
+    similarity_histogram = read_similarity_histogram(out_dir)
+    clear_claim_pairs(out_dir)
+    if similarity_histogram is not None:
+        write_similarity_histogram(out_dir, similarity_histogram)
+
+    if num_workers is not None:
+        pair_chunks = iter_pairs_in_parallel(drug_claim_index, paper_ids, claim_vectors, threshold, chunk_size,
+                                             num_workers)
+    else:
+        pair_chunks = iter_pairs_above_threshold(drug_claim_index, paper_ids, claim_vectors, threshold, chunk_size)
+    num_pairs = 0
+    drugs = np.array(drugs, dtype=object)
+    for drug_ids, claim_i, claim_j, similarities in pair_chunks:
+        append_claim_pairs(out_dir, drugs[drug_ids], claim_i, claim_j, similarities)
+        num_pairs += len(claim_i)
+
+    return num_pairs
+
+
+def load_claim_pair_tables(out_dir: str, drugs: list = None, min_similarity: float = None):
+    """
+    Load claim pairs written by pair_similar_claims to a pair store.
+
+    Only the partitions of the requested drugs and similarity range are read.
+
+    :param out_dir: directory of the pair store
+    :param drugs: if given, only load pairs generated for these drug terms
+    :param min_similarity: if given, only load pairs with at least this cosine similarity
+    :return: ClaimPairTables holding the stored claims, papers, selected pairs and similarity histogram
+    """
+    claims, papers = read_claim_tables(out_dir)
+    pairs = read_claim_pairs(out_dir, drugs=drugs, min_similarity=min_similarity, columns=PAIR_COLUMNS)
+
+    return ClaimPairTables(claims=claims, papers=papers, pairs=pairs,
+                           similarity_histogram=read_similarity_histogram(out_dir))
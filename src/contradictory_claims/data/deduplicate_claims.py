@@ -0,0 +1,155 @@
+"""Functions for collapsing near-duplicate claims before pairing."""
+
+# -*- coding: utf-8 -*-
+
+import re
+import zlib
+from typing import Iterable
+
+import numpy as np
+import pandas as pd
+
+MAX_HASH = np.uint64(0xffffffff)
+
+
+def _shingle_hashes(text: str, shingle_size: int):
+    """
+    Hash the word shingles of a text to 32-bit integers.
+
+    :param text: claim sentence
+    :param shingle_size: number of consecutive words per shingle
+    :return: List of shingle hashes; a single hash of the whole text if it is shorter than one shingle
+    """
+    words = re.findall(r'\w+', text.lower())
+    shingles = {' '.join(words[i:i + shingle_size]) for i in range(len(words) - shingle_size + 1)}
+    if not shingles:
+        shingles = {' '.join(words)}
+
+    return [zlib.crc32(shingle.encode('utf-8')) for shingle in shingles]
+
+
+def minhash_signatures(texts: Iterable[str], num_perm: int = 64, shingle_size: int = 3, seed: int = 0,
+                       chunk_size: int = 1000000):
+    """
+    Calculate the MinHash signature of each text over its word shingles.
+
+    Each of the num_perm hash functions is a multiply-shift hash of the 32-bit shingle hashes, applied to the
+    shingles of many texts at once.
+
+    :param texts: claim sentences
+    :param num_perm: number of hash functions, i.e. signature length
+    :param shingle_size: number of consecutive words per shingle
+    :param seed: random seed of the hash functions
+    :param chunk_size: approximate number of shingles hashed at a time
+    :return: Array of signatures, one uint32 row per text
+    """
+    shingle_hashes = [_shingle_hashes(text, shingle_size) for text in texts]
+    rng = np.random.RandomState(seed)
+    multipliers = rng.randint(1, 2 ** 62, size=num_perm, dtype=np.int64).astype(np.uint64) * np.uint64(2) + np.uint64(1)
+    increments = rng.randint(0, 2 ** 62, size=num_perm, dtype=np.int64).astype(np.uint64)
+
+    signatures = np.zeros((len(shingle_hashes), num_perm), dtype=np.uint32)
+    start = 0
+    while start < len(shingle_hashes):
+        # Take texts until about chunk_size shingles are gathered
+        end, num_shingles = start, 0
+        while end < len(shingle_hashes) and (end == start or num_shingles + len(shingle_hashes[end]) <= chunk_size):
+            num_shingles += len(shingle_hashes[end])
+            end += 1
+        lengths = np.array([len(h) for h in shingle_hashes[start:end]])
+        hashes = np.concatenate([np.array(h, dtype=np.uint64) for h in shingle_hashes[start:end]])
+        # Integer overflow wraps around, which is what the multiply-shift hash relies on
+        with np.errstate(over='ignore'):
+            permuted = (multipliers[:, None] * hashes[None, :] + increments[:, None]) >> np.uint64(32)
+        offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+        signatures[start:end] = np.minimum.reduceat(permuted & MAX_HASH, offsets, axis=1).T
+        start = end
+
+    return signatures
+
+
+def group_near_duplicates(signatures: np.ndarray, threshold: float = 0.8, bands: int = 16):
+    """
+    Group texts whose MinHash signatures agree, using locality-sensitive hashing on bands of the signatures.
+
+    Texts sharing a band are candidates for the first text of the band bucket, and match it if the fraction of
+    agreeing signature values (the estimated Jaccard similarity of their shingles) is at least the threshold.
+    Each text joins the group of the earliest text it matches that represents its own group, and otherwise
+    represents a new group. Every text is thus similar to its group's representative; matches are not chained,
+    so two texts that are only similar through a third are not grouped together.
+
+    :param signatures: MinHash signatures, one row per text
+    :param threshold: minimum estimated Jaccard similarity of near-duplicate texts
+    :param bands: number of bands the signatures are split into; must divide the signature length
+    :return: Array with the group id of each text; group ids are numbered in order of first appearance
+    """
+    num_texts, num_perm = signatures.shape
+    rows_per_band = num_perm // bands
+    link_i, link_j = [], []
+    for band in range(bands):
+        band_values = np.ascontiguousarray(signatures[:, band * rows_per_band:(band + 1) * rows_per_band])
+        _, first, bucket = np.unique(band_values.view(np.dtype((np.void, band_values.dtype.itemsize * rows_per_band))),
+                                     return_index=True, return_inverse=True)
+        bucket = bucket.ravel()
+        first_in_bucket = first[bucket]
+        candidates = np.flatnonzero(first_in_bucket != np.arange(num_texts))
+        if len(candidates) == 0:
+            continue
+        agreement = (signatures[candidates] == signatures[first_in_bucket[candidates]]).mean(axis=1)
+        is_duplicate = agreement >= threshold
+        link_i.append(first_in_bucket[candidates[is_duplicate]])
+        link_j.append(candidates[is_duplicate])
+
+    representatives = np.arange(num_texts)
+    if link_i:
+        link_i, link_j = np.concatenate(link_i), np.concatenate(link_j)
+        # The first text of a bucket comes before the others, so visiting the links in text order settles the
+        # group of each earlier text before the texts matching it
+        order = np.lexsort((link_i, link_j))
+        for i, j in zip(link_i[order].tolist(), link_j[order].tolist()):
+            if representatives[j] == j and representatives[i] == i:
+                representatives[j] = i
+    # Representatives come before their members, so numbering them in text order is the order of first appearance
+    _, groups = np.unique(representatives, return_inverse=True)
+
+    return groups.ravel()
+
+
+def collapse_near_duplicate_claims(claims_data: pd.DataFrame, threshold: float = 0.8, num_perm: int = 64,
+                                   bands: int = 16, shingle_size: int = 3):
+    """
+    Collapse near-identical claims (e.g. repeated in a preprint, its journal version and reviews) into one.
+
+    The first claim of each group of near-duplicates is kept as its representative, with the cord_uids of all
+    papers the claim appears in and the drug terms of all their sections, so that pairing and scoring only run on
+    the representatives. The cord_uid, section and section text stay those of the representative's own paper.
+
+    :param claims_data: pandas dataframe with cord 19 claims
+    :param threshold: minimum estimated Jaccard similarity of the word shingles of near-duplicate claims
+    :param num_perm: number of MinHash hash functions
+    :param bands: number of LSH bands; must divide num_perm
+    :param shingle_size: number of consecutive words per shingle
+    :return: Dataframe of representative claims, with a cord_uids column listing the papers of each claim and
+        drug_terms_used joining the drug terms of the whole group
+    """
+    if num_perm % bands != 0:
+        raise ValueError(f'The number of bands ({bands}) must divide the signature length ({num_perm})')
+
+    signatures = minhash_signatures(claims_data.claims, num_perm=num_perm, shingle_size=shingle_size)
+    groups = group_near_duplicates(signatures, threshold=threshold, bands=bands)
+
+    claims_data = claims_data.reset_index(drop=True)
+    cord_uids = claims_data.cord_uid.groupby(groups, sort=True).unique()
+    representatives = claims_data.groupby(groups, sort=True).head(1).reset_index(drop=True)
+    representatives['cord_uids'] = [list(uids) for uids in cord_uids]
+    if 'drug_terms_used' in claims_data.columns:
+        # Join the drug terms of the group in order of first appearance, so no drug loses the claim's pairs
+        terms = pd.DataFrame({'group': groups,
+                              'term': claims_data.drug_terms_used.fillna('').astype(str).str.split(',')})
+        terms = terms.explode('term')
+        terms = terms[terms.term != ''].drop_duplicates()
+        drug_terms_used = terms.groupby('group', sort=True).term.agg(','.join)
+        representatives['drug_terms_used'] = drug_terms_used.reindex(range(len(representatives)),
+                                                                     fill_value='').to_numpy()
+
+    return representatives
@@ -0,0 +1,94 @@
+"""Label spaces mapping NLI class names to the compact class ids each model consumes."""
+
+# -*- coding: utf-8 -*-
+
+from typing import Iterable, NamedTuple, Tuple
+
+import numpy as np
+
+
+class LabelSpace(NamedTuple):
+    """
+    Ordered NLI class names. The id of a class is its position in the names.
+
+    Class ids are stored as int8 and converted between label spaces with table lookups.
+    """
+
+    names: Tuple[str, ...]
+
+    @property
+    def num_classes(self):
+        """Number of classes in the label space."""
+        return len(self.names)
+
+    def class_id(self, name: str, default: str = None):
+        """
+        Get the class id of a class name.
+
+        :param name: class name
+        :param default: class name to use for names not in the label space. If None, unknown names raise a ValueError
+        :return: Class id
+        """
+        if name in self.names:
+            return self.names.index(name)
+        if default is None:
+            raise ValueError(f'{name!r} is not one of the classes {self.names}')
+
+        return self.names.index(default)
+
+    def class_ids(self, names: Iterable[str], default: str = None):
+        """
+        Get the class ids of class names.
+
+        :param names: class names
+        :param default: class name to use for names not in the label space. If None, unknown names raise a ValueError
+        :return: int8 array of class ids
+        """
+        names = np.asarray(names if isinstance(names, np.ndarray) else list(names), dtype=object)
+        # Start from the id of the default class and fill in the ids of the known classes
+        ids = np.full(len(names), -1 if default is None else self.class_id(default), dtype=np.int8)
+        for class_id, name in enumerate(self.names):
+            ids[names == name] = class_id
+        if default is None and (ids < 0).any():
+            raise ValueError(f'{names[ids < 0][0]!r} is not one of the classes {self.names}')
+
+        return ids
+
+    def names_of(self, class_ids: np.ndarray):
+        """
+        Get the class names of class ids.
+
+        :param class_ids: class ids
+        :return: Array of class names
+        """
+        return np.array(self.names, dtype=object)[class_ids]
+
+    def to(self, class_ids: np.ndarray, target: 'LabelSpace'):
+        """
+        Convert class ids to the ids of the same classes in another label space.
+
+        :param class_ids: class ids in this label space
+        :param target: label space to convert to
+        :return: int8 class ids in the target label space
+        """
+        table = np.array([target.class_id(name) for name in self.names], dtype=np.int8)
+        return table[class_ids]
+
+    def categorical(self, class_ids: np.ndarray, dtype=np.int8):
+        """
+        Get class ids as one-hot targets, for models trained with categorical crossentropy.
+
+        Models trained with sparse categorical crossentropy take the class ids as they are.
+
+        :param class_ids: class ids
+        :param dtype: data type of the targets
+        :return: (n x number of classes) array with a 1 in the column of each class id
+        """
+        return np.eye(self.num_classes, dtype=dtype)[class_ids]
+
+
+# Classes of the NLI datasets, in the order of the outputs of the Transformer model
+NLI_LABELS = LabelSpace(('neutral', 'entailment', 'contradiction'))
+
+# Classes in the order of the outputs of the SBERT model
+SBERT_LABELS = LabelSpace(('contradiction', 'neutral', 'entailment'))
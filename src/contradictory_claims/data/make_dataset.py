@@ -2,12 +2,60 @@
 
 # -*- coding: utf-8 -*-
 
+import hashlib
 import json
+import random
+from typing import Iterable, List, NamedTuple
 
 import numpy as np
 import pandas as pd
-from keras.utils import np_utils
-from sklearn.model_selection import train_test_split
+
+from .label_space import NLI_LABELS
+
+
+class SentencePairBatch(NamedTuple):
+    """
+    Columnar batch of NLI sentence pairs: premises, hypotheses and their labels.
+
+    Labels are class ids of NLI_LABELS: 2 for contradiction, 1 for entailment and 0 for neutral. The pairs are kept
+    apart, so that tokenizers can encode them in pair mode and insert their own special tokens.
+    """
+
+    premises: np.ndarray
+    hypotheses: np.ndarray
+    labels: np.ndarray = None
+
+    @property
+    def num_pairs(self):
+        """Number of sentence pairs in the batch."""
+        return len(self.premises)
+
+    def take(self, indices):
+        """
+        Select sentence pairs by position.
+
+        :param indices: positions (or boolean mask) of the pairs to select
+        :return: SentencePairBatch of the selected pairs
+        """
+        return SentencePairBatch(premises=self.premises[indices], hypotheses=self.hypotheses[indices],
+                                 labels=None if self.labels is None else self.labels[indices])
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, premise_column: str = 'sentence1', hypothesis_column: str = 'sentence2',
+                   label_column: str = None):
+        """
+        Make a batch from the sentence pair columns of a dataframe.
+
+        :param df: dataframe with a row per sentence pair
+        :param premise_column: column of the first sentences
+        :param hypothesis_column: column of the second sentences
+        :param label_column: column of the 'contradiction', 'entailment' or 'neutral' labels. If None, the batch is
+            unlabeled
+        :return: SentencePairBatch
+        """
+        labels = None if label_column is None else NLI_LABELS.class_ids(df[label_column], default='neutral')
+        return cls(premises=np.array([str(sen) for sen in df[premise_column]], dtype=object),
+                   hypotheses=np.array([str(sen) for sen in df[hypothesis_column]], dtype=object), labels=labels)
 
 
 def load_multi_nli(train_path: str, test_path: str):
@@ -16,28 +64,36 @@ def load_multi_nli(train_path: str, test_path: str):
 
     :param train_path: path to MultiNLI training data
     :param test_path: path to MultiNLI test data
-    :return: MultiNLI sentence pairs and labels for training and test sets, respectively
+    :return: MultiNLI SentencePairBatch for training and test sets, respectively
     """
-    multinli_train_data = pd.read_csv(train_path, sep='\t', error_bad_lines=False)
-    multinli_test_data = pd.read_csv(test_path, sep='\t', error_bad_lines=False)
+    multinli_columns = ['gold_label', 'sentence1', 'sentence2']
+    multinli_train_data = pd.read_csv(train_path, sep='\t', usecols=multinli_columns, on_bad_lines='skip')
+    multinli_test_data = pd.read_csv(test_path, sep='\t', usecols=multinli_columns, on_bad_lines='skip')
 
-    # Map labels to numerical (categorical) values
-    multinli_train_data['gold_label'] = [2 if label == 'contradiction' else 1 if label == 'entailment' else 0 for
-                                         label in multinli_train_data.gold_label]
-    multinli_test_data['gold_label'] = [2 if label == 'contradiction' else 1 if label == 'entailment' else 0 for
-                                        label in multinli_test_data.gold_label]
+    return (SentencePairBatch.from_frame(multinli_train_data, label_column='gold_label'),
+            SentencePairBatch.from_frame(multinli_test_data, label_column='gold_label'))
 
-    # Insert the CLS and SEP tokens
-    x_train = '[CLS]' + multinli_train_data.sentence1 + '[SEP]' + multinli_train_data.sentence2
-    x_train = x_train.to_numpy()
-    x_test = '[CLS]' + multinli_test_data.sentence1 + '[SEP]' + multinli_test_data.sentence2
-    x_test = x_test.to_numpy()
 
-    # Reformat to one-hot categorical variable (3 columns)
-    y_train = np_utils.to_categorical(multinli_train_data.gold_label, dtype='int')
-    y_test = np_utils.to_categorical(multinli_test_data.gold_label, dtype='int')
+def read_jsonl_columns(path: str, columns: List[str]):
+    """
+    Read selected fields of a JSON lines file into a dataframe, in a single pass over the file.
+
+    :param path: path to JSON lines file, with one JSON object per line
+    :param columns: fields to read. Fields missing from a line are read as None
+    :return: Dataframe with one row per line and one string column per field
+    """
+    values = {column: [] for column in columns}
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            for column in columns:
+                values[column].append(record.get(column))
 
-    return x_train, y_train, x_test, y_test
+    return pd.DataFrame({column: pd.Series(column_values, dtype=object) for column, column_values in values.items()},
+                        columns=columns)
 
 
 def load_med_nli(train_path: str, dev_path: str, test_path: str, num_training_pairs_per_class: int = None):
@@ -49,53 +105,23 @@ def load_med_nli(train_path: str, dev_path: str, test_path: str, num_training_pa
     :param test_path: path to MedNLI test data
     :param num_training_pairs_per_class: number of pairs of sentences to retrieve per class.
         If None, all sentence pairs are retrieved
-    :return: MedNLI sentence pairs and labels for training and test sets, respectively
+    :return: MedNLI SentencePairBatch for training and test sets, respectively
     """
-    # Question: how do you have long docstrings that violate character limit but not get flake8 on my case
-    # about splitting into 2 lines? TODO: Figure this out
-    mednli_data1 = pd.DataFrame()
-    mednli_data2 = pd.DataFrame()
-    mednli_test_data = pd.DataFrame()
-
-    with open(train_path, 'r', encoding='utf-8') as f:
-        for line in f:
-            mednli_data1 = mednli_data1.append(json.loads(line.rstrip('\n|\r')), ignore_index=True)
-    with open(dev_path, 'r', encoding='utf-8') as f:
-        for line in f:
-            mednli_data2 = mednli_data2.append(json.loads(line.rstrip('\n|\r')), ignore_index=True)
-
-    # Join together training and dev sets
-    mednli_data = mednli_data1.append(mednli_data2, ignore_index=True).reset_index(drop=True)
-
-    with open(test_path, 'r', encoding='utf-8') as f:
-        for line in f:
-            mednli_test_data = mednli_test_data.append(json.loads(line.rstrip('\n|\r')), ignore_index=True)
-
-    # Map labels to numerical (categorical) values
-    mednli_data['gold_label'] = [2 if label == 'contradiction' else 1 if label == 'entailment' else 0 for
-                                 label in mednli_data.gold_label]
-    mednli_test_data['gold_label'] = [2 if label == 'contradiction' else 1 if label == 'entailment' else 0 for
-                                      label in mednli_test_data.gold_label]
+    # Read only the sentence pairs and labels, training and dev sets joined together
+    mednli_columns = ['sentence1', 'sentence2', 'gold_label']
+    mednli_data = SentencePairBatch.from_frame(
+        pd.concat([read_jsonl_columns(train_path, mednli_columns), read_jsonl_columns(dev_path, mednli_columns)],
+                  ignore_index=True), label_column='gold_label')
+    mednli_test_data = SentencePairBatch.from_frame(read_jsonl_columns(test_path, mednli_columns),
+                                                    label_column='gold_label')
 
     # Number of training pairs per class to use. If None, use all training pairs
     if num_training_pairs_per_class is not None:
         print(f'Using only a subset of MedNLI for training: {num_training_pairs_per_class} training pairs per class')  # noqa: T001,E501
-        temp = mednli_data[mednli_data.gold_label == 2].head(num_training_pairs_per_class).append(
-            mednli_data[mednli_data.gold_label == 1].head(num_training_pairs_per_class)).reset_index(drop=True)
-        mednli_data = temp.append(mednli_data[mednli_data.gold_label == 0].head(num_training_pairs_per_class))\
-            .reset_index(drop=True)
+        mednli_data = mednli_data.take(np.concatenate([np.flatnonzero(mednli_data.labels == label)[
+            :num_training_pairs_per_class] for label in [2, 1, 0]]))
 
-    # Insert the CLS and SEP tokens
-    x_train = '[CLS]' + mednli_data.sentence1 + '[SEP]' + mednli_data.sentence2
-    x_train = x_train.to_numpy()
-    x_test = '[CLS]' + mednli_test_data.sentence1 + '[SEP]' + mednli_test_data.sentence2
-    x_test = x_test.to_numpy()
-
-    # Reformat to one-hot categorical variable (3 columns)
-    y_train = np_utils.to_categorical(mednli_data.gold_label)
-    y_test = np_utils.to_categorical(mednli_test_data.gold_label)
-
-    return x_train, y_train, x_test, y_test
+    return mednli_data, mednli_test_data
 
 
 def load_mancon_corpus_from_sent_pairs(mancon_sent_pair_path: str):  # noqa: D205,D400
@@ -104,26 +130,118 @@ def load_mancon_corpus_from_sent_pairs(mancon_sent_pair_path: str):  # noqa: D20
         columns: label, guid, text_a (sentence 1), and text_b (sentence 2).
 
     :param mancon_sent_pair_path: path to ManCon sentence pair file
-    :return: ManConCorpus sentence pairs and labels for training and test sets, respectively
+    :return: ManConCorpus SentencePairBatch for training and test sets, respectively
+    """
+    from sklearn.model_selection import train_test_split
+
+    mancon_data = SentencePairBatch.from_frame(pd.read_csv(mancon_sent_pair_path, sep='\t'), 'text_a', 'text_b',
+                                               label_column='label')
+    print(f"Number of contradiction pairs: {np.sum(mancon_data.labels == 2)}")  # noqa: T001
+    print(f"Number of entailment pairs: {np.sum(mancon_data.labels == 1)}")  # noqa: T001
+    print(f"Number of neutral pairs: {np.sum(mancon_data.labels == 0)}")  # noqa: T001
+
+    train_indices, test_indices = train_test_split(np.arange(mancon_data.num_pairs), test_size=0.2)
+
+    return mancon_data.take(train_indices), mancon_data.take(test_indices)
+
+
+def _iter_tsv_rows(path: str, columns: List[str], chunk_size: int = 10000):
+    """
+    Stream selected columns of a TSV file with a header, a chunk of rows at a time. Malformed rows are skipped.
+
+    :param path: path to TSV file
+    :param columns: columns to read
+    :param chunk_size: number of rows read at a time
+    :return: Iterator of tuples of the column values of each row
+    """
+    for chunk in pd.read_csv(path, sep='\t', usecols=columns, chunksize=chunk_size, on_bad_lines='skip'):
+        yield from zip(*(chunk[column] for column in columns))
+
+
+def iter_multi_nli(path: str, chunk_size: int = 10000):
+    """
+    Stream MultiNLI sentence pairs and labels from a file, without loading the whole file.
+
+    :param path: path to MultiNLI training or test data
+    :param chunk_size: number of rows read at a time
+    :return: Iterator of (sentence1, sentence2, label) tuples, with NLI_LABELS class ids
+    """
+    for label, sentence1, sentence2 in _iter_tsv_rows(path, ['gold_label', 'sentence1', 'sentence2'], chunk_size):
+        yield sentence1, sentence2, NLI_LABELS.class_id(label, default='neutral')
+
+
+def iter_med_nli(*paths: str):
+    """
+    Stream MedNLI sentence pairs and labels from one or more JSON lines files, without loading the whole files.
+
+    :param paths: paths to MedNLI data, e.g. the training and dev data to train on both
+    :return: Iterator of (sentence1, sentence2, label) tuples, with NLI_LABELS class ids
+    """
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    record = json.loads(line)
+                    label = NLI_LABELS.class_id(record.get('gold_label'), default='neutral')
+                    yield record.get('sentence1'), record.get('sentence2'), label
+
+
+def _in_test_split(key: str, test_size: float):
+    """
+    Assign an example to the test split by hashing its key, so that the split is the same on every pass.
+
+    :param key: key identifying the example
+    :param test_size: fraction of examples in the test split
+    :return: True if the example is in the test split
+    """
+    digest = hashlib.blake2b(str(key).encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') / 2 ** 64 < test_size
+
+
+def iter_mancon_corpus_from_sent_pairs(mancon_sent_pair_path: str, split: str = 'train', test_size: float = 0.2,
+                                       chunk_size: int = 10000):
+    """
+    Stream ManConCorpus sentence pairs and labels from a sentence pair file, without loading the whole file.
+
+    Unlike load_mancon_corpus_from_sent_pairs, the train/test split is made by hashing the guid of each pair, so
+    that the training and test streams never overlap.
+
+    :param mancon_sent_pair_path: path to ManCon sentence pair file
+    :param split: 'train' or 'test'
+    :param test_size: fraction of pairs in the test split
+    :param chunk_size: number of rows read at a time
+    :return: Iterator of (sentence1, sentence2, label) tuples, with NLI_LABELS class ids
     """
-    mancon_data = pd.read_csv(mancon_sent_pair_path, sep='\t')
-    mancon_data['label'] = [2 if label == 'contradiction' else 1 if label == 'entailment' else 0 for
-                            label in mancon_data.label]
-    print(f"Number of contradiction pairs: {len(mancon_data[mancon_data.label == 2])}")  # noqa: T001
-    print(f"Number of entailment pairs: {len(mancon_data[mancon_data.label == 1])}")  # noqa: T001
-    print(f"Number of neutral pairs: {len(mancon_data[mancon_data.label == 0])}")  # noqa: T001
+    if split not in ['train', 'test']:
+        raise ValueError(f"split must be 'train' or 'test', not {split!r}")
+    for label, guid, text_a, text_b in _iter_tsv_rows(mancon_sent_pair_path, ['label', 'guid', 'text_a', 'text_b'],
+                                                      chunk_size):
+        if _in_test_split(guid, test_size) == (split == 'test'):
+            yield text_a, text_b, NLI_LABELS.class_id(label, default='neutral')
 
-    # Insert the CLS and SEP tokens
-    x_train, x_test, y_train, y_test = train_test_split(
-        '[CLS]' + mancon_data.text_a + '[SEP]' + mancon_data.text_b, mancon_data['label'], test_size=0.2)
-    x_train = x_train.to_numpy()  # TODO: need to double check this is sufficient for not having TF complain
-    x_test = x_test.to_numpy()
 
-    # Reformat to one-hot categorical variable (3 columns)
-    y_train = np_utils.to_categorical(y_train)
-    y_test = np_utils.to_categorical(y_test)
+def shuffle_examples(examples: Iterable, buffer_size: int = 10000, seed: int = None):
+    """
+    Shuffle a stream of examples through a fixed-size buffer, so that memory use does not depend on the stream length.
 
-    return x_train, y_train, x_test, y_test
+    :param examples: examples to shuffle
+    :param buffer_size: number of examples held in the buffer. Larger buffers give a more uniform shuffle
+    :param seed: random seed
+    :return: Iterator of the examples, shuffled
+    """
+    rng = random.Random(seed)
+    buffer = []
+    for example in examples:
+        if len(buffer) < buffer_size:
+            buffer.append(example)
+            continue
+        # Emit a random buffered example and keep the new one in its place
+        position = rng.randrange(buffer_size)
+        yield buffer[position]
+        buffer[position] = example
+    rng.shuffle(buffer)
+    yield from buffer
 
 
 def load_drug_virus_lexicons(drug_lex_path: str, virus_lex_path: str):
@@ -143,27 +261,3 @@ def load_drug_virus_lexicons(drug_lex_path: str, virus_lex_path: str):
     virus_names = list(virus_names[0])
 
     return drug_names, virus_names
-
-
-def remove_tokens_get_sentence_sbert(x: np.ndarray, y: np.ndarray):
-    """Convert Data recieved as a single format by preprocessing multi_nli, med_nli or mancon.
-
-    :param x: array containing output from one of the above functions
-    :param y: array containing labels from one of the above functions
-
-    :return: dataframe containing sentences and labels as different columnn
-    """
-    x_df = pd.DataFrame(x, columns=["sentences"])
-    x_df["sentences"] = x_df["sentences"].astype(str)
-    x_df["sentences"] = x_df["sentences"].apply(lambda x: x.replace("[CLS]", ""))
-    x_df["sentence1"] = x_df["sentences"].apply(lambda x: x.split("[SEP]")[0])
-    x_df["sentence2"] = x_df["sentences"].apply(lambda x: x.split("[SEP]")[-1])
-    x_df.drop(["sentences"], axis=1, inplace=True)
-    y_transformed = np.argmax(y, axis=1)
-    # {"contradiction": 2, "entailment": 1, "neutral": 0},
-    # for sbert need to change this to entail:2, contra:0, neut:1
-    y_df = pd.DataFrame(y_transformed, columns=["label"])
-    convert_dict = {0: 1, 1: 2, 2: 0}
-    y_df["label"] = y_df["label"].apply(lambda x: convert_dict[x]).astype(int)
-    df = pd.concat([x_df, y_df], axis=1)
-    return df
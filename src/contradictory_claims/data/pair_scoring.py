@@ -0,0 +1,443 @@
+"""Functions for generating and scoring the cross-paper pairs of claims that share a drug term."""
+
+# -*- coding: utf-8 -*-
+
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, Iterable
+
+import numpy as np
+from scipy.sparse import csr_matrix, issparse
+
+from .similarity_histogram import SimilarityHistogram, add_similarities, empty_similarity_histogram
+
+
+def build_shared_drug_bitmap(drug_claim_index: Dict[str, np.ndarray], num_claims: int):
+    """
+    Build a bit-packed claim x drug membership matrix for the claims that mention more than one drug term.
+
+    :param drug_claim_index: dictionary mapping drug terms to sorted arrays of claim ids
+    :param num_claims: number of indexed claims
+    :return: Array mapping each claim id to its bitmap row (-1 for claims mentioning a single drug term),
+        and the packed bitmap with one bit per drug id
+    """
+    num_mentions = np.zeros(num_claims, dtype=np.int64)
+    for claim_ids in drug_claim_index.values():
+        num_mentions[claim_ids] += 1
+    multi_drug_claims = np.flatnonzero(num_mentions > 1)
+
+    bitmap_rows = np.full(num_claims, -1, dtype=np.int64)
+    bitmap_rows[multi_drug_claims] = np.arange(len(multi_drug_claims))
+    bitmap = np.zeros((len(multi_drug_claims), (len(drug_claim_index) + 7) // 8), dtype=np.uint8)
+    for drug_id, claim_ids in enumerate(drug_claim_index.values()):
+        rows = bitmap_rows[claim_ids]
+        bitmap[rows[rows >= 0], drug_id // 8] |= np.uint8(0x80 >> (drug_id % 8))
+
+    return bitmap_rows, bitmap
+
+
+def _share_lower_drug(bitmap_rows: np.ndarray, bitmap: np.ndarray, claim_i: np.ndarray, claim_j: np.ndarray,
+                      drug_id: int):
+    """
+    Flag claim pairs that both mention a drug term with a smaller drug id than the given one.
+
+    :param bitmap_rows: claim id to bitmap row mapping, as returned by build_shared_drug_bitmap
+    :param bitmap: packed claim x drug bitmap, as returned by build_shared_drug_bitmap
+    :param claim_i: claim ids of the first claim of each pair
+    :param claim_j: claim ids of the second claim of each pair
+    :param drug_id: drug id of the block the pairs were generated from
+    :return: Boolean array, True for pairs already generated from the block of a smaller drug id
+    """
+    shared = np.zeros(len(claim_i), dtype=bool)
+    row_i, row_j = bitmap_rows[claim_i], bitmap_rows[claim_j]
+    both_multi = (row_i >= 0) & (row_j >= 0)
+    if drug_id == 0 or not both_multi.any():
+        return shared
+
+    row_i, row_j = row_i[both_multi], row_j[both_multi]
+    full_bytes, remaining_bits = divmod(drug_id, 8)
+    shared_multi = np.zeros(len(row_i), dtype=bool)
+    if full_bytes:
+        shared_multi |= (bitmap[row_i, :full_bytes] & bitmap[row_j, :full_bytes]).any(axis=1)
+    if remaining_bits:
+        lower_bits = np.uint8((0xFF << (8 - remaining_bits)) & 0xFF)
+        shared_multi |= (bitmap[row_i, full_bytes] & bitmap[row_j, full_bytes] & lower_bits) != 0
+    shared[both_multi] = shared_multi
+
+    return shared
+
+
+def _iter_block_pairs(block_size: int, chunk_size: int, first_column: int = 0, row_start: int = 0,
+                      row_end: int = None):
+    """
+    Enumerate the upper triangle of a block of claims in chunks of whole rows.
+
+    :param block_size: number of claims in the block
+    :param chunk_size: maximum number of pairs per chunk (a single row may exceed it)
+    :param first_column: only enumerate pairs whose column is at least this position
+    :param row_start: first row to enumerate
+    :param row_end: row to stop before. Defaults to the end of the block
+    :return: Generator of (row, column) position arrays with row < column
+    """
+    row_end_of_range = block_size if row_end is None else row_end
+    column_starts = np.clip(np.arange(1, block_size + 1, dtype=np.int64), first_column, block_size)
+    pairs_per_row = block_size - column_starts
+    pairs_before_row = np.cumsum(pairs_per_row) - pairs_per_row
+    while row_start < row_end_of_range:
+        # Take as many whole rows as fit in the chunk, but always at least one
+        row_end = int(np.searchsorted(pairs_before_row, pairs_before_row[row_start] + chunk_size, side='right'))
+        row_end = min(max(row_end, row_start + 1), row_end_of_range)
+        lengths = pairs_per_row[row_start:row_end]
+        rows = np.repeat(np.arange(row_start, row_end, dtype=np.int64), lengths)
+        # Column offsets restart at the first column of every row
+        offsets = np.arange(len(rows), dtype=np.int64) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        if len(rows):
+            yield rows, np.repeat(column_starts[row_start:row_end], lengths) + offsets
+        row_start = row_end
+
+
+def pairing_paper_ids(paper_ids: np.ndarray, cord_uids: Iterable[list] = None):
+    """
+    Get the paper id each claim is compared by when pairs of claims from the same paper are dropped.
+
+    A claim collapsed from several papers by collapse_near_duplicate_claims stands for its copy in each of them,
+    and one of these copies is from another paper than any other claim. Such claims get a negative id of their
+    own, so that none of their pairs is dropped; other claims keep their paper id.
+
+    :param paper_ids: integer paper id of each claim
+    :param cord_uids: if given, the cord_uids of all papers each claim appears in
+    :return: Array of paper ids to compare claims by
+    """
+    paper_ids = np.asarray(paper_ids, dtype=np.int64)
+    if cord_uids is None:
+        return paper_ids
+    multi_paper_claims = np.flatnonzero([len(claim_cord_uids) > 1 for claim_cord_uids in cord_uids])
+    paper_ids = paper_ids.copy()
+    paper_ids[multi_paper_claims] = -1 - multi_paper_claims
+
+    return paper_ids
+
+
+def iter_cross_paper_pairs(drug_claim_index: Dict[str, np.ndarray], paper_ids: np.ndarray,
+                           chunk_size: int = 1000000, new_claims_start: int = 0, new_drugs_start: int = None):
+    """
+    Stream the pairs of claims that share a drug term and come from different papers.
+
+    Each pair is generated once, from the block of the first drug term (in drug id order) both claims mention,
+    so no pair list has to be kept around to remove duplicates.
+
+    :param drug_claim_index: dictionary mapping drug terms to sorted arrays of claim ids
+    :param paper_ids: integer paper id of each claim
+    :param chunk_size: approximate maximum number of candidate pairs per chunk
+    :param new_claims_start: for incremental pairing, the first claim id of the newly added claims. Only pairs
+        involving a new claim are generated, except in the blocks of new drug terms
+    :param new_drugs_start: for incremental pairing, the first drug id (position in the index) of the drug terms
+        not seen before. All pairs are generated in their blocks
+    :return: Generator of (drug term, first claim ids, second claim ids) chunks, with first < second
+    """
+    bitmap_rows, bitmap = build_shared_drug_bitmap(drug_claim_index, len(paper_ids))
+    for drug_id, (drug, claims_with_drug) in enumerate(drug_claim_index.items()):
+        if new_drugs_start is not None and drug_id >= new_drugs_start:
+            first_column = 0
+        else:
+            first_column = int(np.searchsorted(claims_with_drug, new_claims_start))
+        for claim_i, claim_j in iter_block_cross_paper_pairs(claims_with_drug, drug_id, paper_ids, bitmap_rows,
+                                                             bitmap, chunk_size, first_column):
+            yield drug, claim_i, claim_j
+
+
+def iter_block_cross_paper_pairs(claims_with_drug: np.ndarray, drug_id: int, paper_ids: np.ndarray,
+                                 bitmap_rows: np.ndarray, bitmap: np.ndarray, chunk_size: int,
+                                 first_column: int = 0, row_start: int = 0, row_end: int = None):
+    """
+    Stream the cross-paper pairs of the block of one drug term that are not generated for an earlier drug term.
+
+    :param claims_with_drug: sorted claim ids of the claims mentioning the drug term
+    :param drug_id: drug id (position in the index) of the drug term
+    :param paper_ids: integer paper id of each claim
+    :param bitmap_rows: claim id to bitmap row mapping, as returned by build_shared_drug_bitmap
+    :param bitmap: packed claim x drug bitmap, as returned by build_shared_drug_bitmap
+    :param chunk_size: approximate maximum number of candidate pairs per chunk
+    :param first_column: only generate pairs whose second claim is at least this position in the block
+    :param row_start: first position in the block of the first claims of the pairs
+    :param row_end: position in the block to stop the first claims before. Defaults to the end of the block
+    :return: Generator of (first claim ids, second claim ids) chunks, with first < second
+    """
+    for rows, columns in _iter_block_pairs(len(claims_with_drug), chunk_size, first_column, row_start, row_end):
+        claim_i, claim_j = claims_with_drug[rows], claims_with_drug[columns]
+        # Filter to claim pairs that come from different papers
+        keep = paper_ids[claim_i] != paper_ids[claim_j]
+        claim_i, claim_j = claim_i[keep], claim_j[keep]
+        # Drop pairs already generated for a drug term earlier in the index
+        keep = ~_share_lower_drug(bitmap_rows, bitmap, claim_i, claim_j, drug_id)
+        if keep.any():
+            yield claim_i[keep], claim_j[keep]
+
+
+def normalize_rows(vectors: np.ndarray):
+    """
+    Scale vectors to unit length so that dot products are cosine similarities.
+
+    :param vectors: 2-D array with one vector per row
+    :return: Row-normalized array. All-zero rows are left as zeros
+    """
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+
+    return vectors / norms
+
+
+def _score_pairs(claim_vectors, claims_with_drug: np.ndarray, claim_i: np.ndarray, claim_j: np.ndarray):
+    """
+    Calculate the cosine similarity of pairs of claims from the block of a drug term.
+
+    Dense vectors are multiplied pair by pair. Sparse vectors are multiplied as the sparse matrix product of the
+    rows and columns of the block that the pairs span, from which the similarities of the pairs are picked.
+
+    :param claim_vectors: unit-length claim vectors (dense or sparse), one row per claim id
+    :param claims_with_drug: sorted claim ids of the block
+    :param claim_i: claim ids of the first claim of each pair
+    :param claim_j: claim ids of the second claim of each pair
+    :return: Array of cosine similarities
+    """
+    if not issparse(claim_vectors):
+        return np.einsum('ij,ij->i', claim_vectors[claim_i], claim_vectors[claim_j])
+
+    rows, columns = np.searchsorted(claims_with_drug, claim_i), np.searchsorted(claims_with_drug, claim_j)
+    row_start, column_start = rows.min(), columns.min()
+    block_similarities = (claim_vectors[claims_with_drug[row_start:rows.max() + 1]]
+                          @ claim_vectors[claims_with_drug[column_start:columns.max() + 1]].T).toarray()
+
+    return block_similarities[rows - row_start, columns - column_start]
+
+
+def iter_pairs_above_threshold(drug_claim_index: Dict[str, np.ndarray], paper_ids: np.ndarray,
+                               claim_vectors: np.ndarray, threshold: float = None, chunk_size: int = 1000000,
+                               histogram: SimilarityHistogram = None, **kwargs):
+    """
+    Score every candidate pair and keep those at or above a similarity threshold, a chunk at a time.
+
+    :param drug_claim_index: dictionary mapping drug terms to sorted arrays of claim ids
+    :param paper_ids: integer paper id of each claim
+    :param claim_vectors: unit-length claim vectors (dense or sparse), one row per claim id
+    :param threshold: minimum cosine similarity of a pair. If None, all candidate pairs are kept
+    :param chunk_size: approximate number of candidate pairs scored at a time
+    :param histogram: if given, count the similarities of all candidate pairs in this histogram
+    :param kwargs: incremental pairing arguments passed on to iter_cross_paper_pairs
+    :return: Generator of arrays of drug ids (positions in the index), first claim ids, second claim ids and
+        similarities of the kept pairs
+    """
+    drug_ids = {drug: drug_id for drug_id, drug in enumerate(drug_claim_index)}
+    for drug, claim_i, claim_j in iter_cross_paper_pairs(drug_claim_index, paper_ids, chunk_size, **kwargs):
+        cos_sim = _score_pairs(claim_vectors, drug_claim_index[drug], claim_i, claim_j)
+        if histogram is not None:
+            add_similarities(histogram, drug_ids[drug], cos_sim)
+        if threshold is not None:
+            keep = cos_sim >= threshold
+            claim_i, claim_j, cos_sim = claim_i[keep], claim_j[keep], cos_sim[keep]
+        yield np.full(len(claim_i), drug_ids[drug], dtype=np.int32), claim_i, claim_j, cos_sim
+
+
+def _plan_block_tasks(drug_claim_index: Dict[str, np.ndarray], num_tasks: int):
+    """
+    Split the drug blocks into tasks of whole rows, largest first, so that no task dominates a parallel run.
+
+    Blocks with more candidate pairs than an even share of num_tasks tasks are split into row ranges with about
+    that many pairs each.
+
+    :param drug_claim_index: dictionary mapping drug terms to sorted arrays of claim ids
+    :param num_tasks: approximate number of tasks to split the pairs into
+    :return: List of (number of pairs, drug id, first row, row to stop before) tasks, largest first
+    """
+    block_sizes = np.array([len(claim_ids) for claim_ids in drug_claim_index.values()], dtype=np.int64)
+    max_task_pairs = max(int((block_sizes * (block_sizes - 1) // 2).sum()) // max(num_tasks, 1), 1)
+
+    tasks = []
+    for drug_id, block_size in enumerate(block_sizes.tolist()):
+        # Number of pairs before each row of the upper triangle, and in total
+        pairs_before_row = np.arange(block_size + 1, dtype=np.int64)
+        pairs_before_row = pairs_before_row * (2 * block_size - pairs_before_row - 1) // 2
+        splits = np.arange(max_task_pairs, pairs_before_row[-1], max_task_pairs)
+        row_bounds = np.unique(np.concatenate([[0], np.searchsorted(pairs_before_row, splits), [block_size]]))
+        for row_start, row_end in zip(row_bounds[:-1].tolist(), row_bounds[1:].tolist()):
+            num_pairs = int(pairs_before_row[row_end] - pairs_before_row[row_start])
+            if num_pairs:
+                tasks.append((num_pairs, drug_id, row_start, row_end))
+
+    return sorted(tasks, key=lambda task: -task[0])
+
+
+_pairing_worker_data = {}
+
+
+def _init_pairing_worker(shared_dir: str):
+    """
+    Attach a pairing worker process to the memory-mapped claim data shared by all workers.
+
+    :param shared_dir: directory the shared claim data was written to
+    """
+    for file_name in os.listdir(shared_dir):
+        name = os.path.splitext(file_name)[0]
+        _pairing_worker_data[name] = np.load(os.path.join(shared_dir, file_name), mmap_mode='r')
+    if 'claim_vectors_indptr' in _pairing_worker_data:
+        # Sparse claim vectors are shared as their compressed sparse row arrays
+        _pairing_worker_data['claim_vectors'] = csr_matrix(
+            (_pairing_worker_data['claim_vectors_data'], _pairing_worker_data['claim_vectors_indices'],
+             _pairing_worker_data['claim_vectors_indptr']), shape=tuple(_pairing_worker_data['claim_vectors_shape']))
+
+
+def _score_block_task(drug_id: int, row_start: int, row_end: int, threshold: float, chunk_size: int):
+    """
+    Score the candidate pairs of a row range of a drug block in a pairing worker process.
+
+    :param drug_id: drug id (position in the index) of the block
+    :param row_start: first row of the task
+    :param row_end: row to stop before
+    :param threshold: minimum cosine similarity of a pair. If None, all candidate pairs are kept
+    :param chunk_size: approximate number of candidate pairs scored at a time
+    :return: Arrays of drug ids, first claim ids, second claim ids and similarities of the kept pairs, and the
+        similarity histogram counts of all candidate pairs of the task
+    """
+    data = _pairing_worker_data
+    task_histogram = empty_similarity_histogram([drug_id])
+    offsets = data['index_offsets']
+    claims_with_drug = np.asarray(data['index_claims'][offsets[drug_id]:offsets[drug_id + 1]])
+    pairs_i, pairs_j, similarities = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int64)], [np.zeros(0)]
+    for claim_i, claim_j in iter_block_cross_paper_pairs(claims_with_drug, drug_id, data['paper_ids'],
+                                                         data['bitmap_rows'], data['bitmap'], chunk_size,
+                                                         row_start=row_start, row_end=row_end):
+        cos_sim = _score_pairs(data['claim_vectors'], claims_with_drug, claim_i, claim_j)
+        add_similarities(task_histogram, 0, cos_sim)
+        if threshold is not None:
+            keep = cos_sim >= threshold
+            claim_i, claim_j, cos_sim = claim_i[keep], claim_j[keep], cos_sim[keep]
+        pairs_i.append(claim_i)
+        pairs_j.append(claim_j)
+        similarities.append(cos_sim)
+    claim_i = np.concatenate(pairs_i)
+
+    return np.full(len(claim_i), drug_id, dtype=np.int32), claim_i, np.concatenate(pairs_j),\
+        np.concatenate(similarities), task_histogram.counts[0]
+
+
+def iter_pairs_in_parallel(drug_claim_index: Dict[str, np.ndarray], paper_ids: np.ndarray,
+                           claim_vectors: np.ndarray, threshold: float = None, chunk_size: int = 1000000,
+                           num_workers: int = 2, histogram: SimilarityHistogram = None):
+    """
+    Score the candidate pairs across a pool of processes, partitioned by drug term.
+
+    The claim vectors and index are written once to memory-mapped files that all workers share. Drug blocks
+    are scheduled largest first and large blocks are split into row ranges, so that one dominant drug term
+    does not leave a single worker running long after the others finish. Pairs shared by several drug terms
+    are only kept in the block of the first of them, so no duplicates are left to merge.
+
+    :param drug_claim_index: dictionary mapping drug terms to sorted arrays of claim ids
+    :param paper_ids: integer paper id of each claim
+    :param claim_vectors: unit-length claim vectors, one row per claim id
+    :param threshold: minimum cosine similarity of a pair. If None, all candidate pairs are kept
+    :param chunk_size: approximate number of candidate pairs scored at a time
+    :param num_workers: number of worker processes
+    :param histogram: if given, count the similarities of all candidate pairs in this histogram
+    :return: Generator of arrays of drug ids, first claim ids, second claim ids and similarities of the kept
+        pairs, in order of task completion
+    """
+    bitmap_rows, bitmap = build_shared_drug_bitmap(drug_claim_index, len(paper_ids))
+    index_claims = [np.zeros(0, dtype=np.int64)] + list(drug_claim_index.values())
+    shared_data = {'paper_ids': np.asarray(paper_ids),
+                   'bitmap_rows': bitmap_rows,
+                   'bitmap': bitmap,
+                   'index_claims': np.concatenate(index_claims),
+                   'index_offsets': np.cumsum([len(claim_ids) for claim_ids in index_claims])}
+    if issparse(claim_vectors):
+        claim_vectors = claim_vectors.tocsr()
+        shared_data.update({'claim_vectors_data': claim_vectors.data,
+                            'claim_vectors_indices': claim_vectors.indices,
+                            'claim_vectors_indptr': claim_vectors.indptr,
+                            'claim_vectors_shape': np.array(claim_vectors.shape)})
+    else:
+        shared_data['claim_vectors'] = claim_vectors
+
+    with tempfile.TemporaryDirectory() as shared_dir:
+        for name, array in shared_data.items():
+            np.save(os.path.join(shared_dir, name + '.npy'), array)
+        with ProcessPoolExecutor(num_workers, initializer=_init_pairing_worker, initargs=(shared_dir,)) as executor:
+            futures = {executor.submit(_score_block_task, drug_id, row_start, row_end, threshold, chunk_size): drug_id
+                       for _, drug_id, row_start, row_end in _plan_block_tasks(drug_claim_index, num_workers * 4)}
+            for future in as_completed(futures):
+                drug_ids, claim_i, claim_j, cos_sim, histogram_counts = future.result()
+                if histogram is not None:
+                    histogram.counts[futures[future]] += histogram_counts
+                yield drug_ids, claim_i, claim_j, cos_sim
+
+
+def pair_top_k(drug_claim_index: Dict[str, np.ndarray], paper_ids: np.ndarray, claim_vectors: np.ndarray,
+               top_k: int, threshold: float = None, chunk_size: int = 1000000):
+    """
+    Keep, for each claim, only its top-k most similar candidate partners.
+
+    Similarities are computed block by block, a few rows of a drug block at a time, and each row is reduced to
+    its k best partners with a partial sort before being merged into a running (claims x k) selection.
+
+    :param drug_claim_index: dictionary mapping drug terms to sorted arrays of claim ids
+    :param paper_ids: integer paper id of each claim
+    :param claim_vectors: unit-length claim vectors, one row per claim id
+    :param top_k: number of partners to keep per claim
+    :param threshold: minimum cosine similarity of a pair. If None, no threshold is applied
+    :param chunk_size: approximate number of similarities computed at a time
+    :return: Arrays of drug ids (positions in the index), first claim ids, second claim ids and similarities
+        of the kept pairs
+    """
+    num_claims = len(paper_ids)
+    best_similarities = np.full((num_claims, top_k), -np.inf, dtype=np.float32)
+    best_partners = np.full((num_claims, top_k), -1, dtype=np.int64)
+    best_drugs = np.full((num_claims, top_k), -1, dtype=np.int32)
+    bitmap_rows, bitmap = build_shared_drug_bitmap(drug_claim_index, num_claims)
+
+    for drug_id, claims_with_drug in enumerate(drug_claim_index.values()):
+        block_size = len(claims_with_drug)
+        rows_per_chunk = max(1, chunk_size // block_size)
+        for row_start in range(0, block_size, rows_per_chunk):
+            row_claims = claims_with_drug[row_start:row_start + rows_per_chunk]
+            cos_sim = claim_vectors[row_claims] @ claim_vectors[claims_with_drug].T
+            if issparse(cos_sim):
+                cos_sim = cos_sim.toarray()
+
+            # Mask pairs from the same paper (including each claim with itself), pairs already scored for
+            # another drug term and, if given, pairs below the threshold
+            claim_i = np.repeat(row_claims, block_size)
+            claim_j = np.tile(claims_with_drug, len(row_claims))
+            invalid = (paper_ids[claim_i] == paper_ids[claim_j]) \
+                | _share_lower_drug(bitmap_rows, bitmap, claim_i, claim_j, drug_id)
+            cos_sim[invalid.reshape(cos_sim.shape)] = -np.inf
+            if threshold is not None:
+                cos_sim[cos_sim < threshold] = -np.inf
+
+            # Partially sort each row to get its top-k candidates within the block
+            if block_size > top_k:
+                candidates = np.argpartition(-cos_sim, top_k - 1, axis=1)[:, :top_k]
+            else:
+                candidates = np.broadcast_to(np.arange(block_size), cos_sim.shape)
+            candidate_similarities = np.take_along_axis(cos_sim, candidates, axis=1)
+            candidate_partners = claims_with_drug[candidates]
+
+            # Merge with the best partners found so far in other drug blocks
+            merged_similarities = np.hstack([best_similarities[row_claims], candidate_similarities])
+            merged_partners = np.hstack([best_partners[row_claims], candidate_partners])
+            merged_drugs = np.hstack([best_drugs[row_claims], np.full(candidates.shape, drug_id, dtype=np.int32)])
+            best = np.argpartition(-merged_similarities, top_k - 1, axis=1)[:, :top_k]
+            best_similarities[row_claims] = np.take_along_axis(merged_similarities, best, axis=1)
+            best_partners[row_claims] = np.take_along_axis(merged_partners, best, axis=1)
+            best_drugs[row_claims] = np.take_along_axis(merged_drugs, best, axis=1)
+
+    # A pair is kept if either claim has the other among its top-k partners
+    claim_i = np.repeat(np.arange(num_claims), top_k)
+    claim_j = best_partners.ravel()
+    similarities = best_similarities.ravel()
+    drug_ids = best_drugs.ravel()
+    found = np.isfinite(similarities)
+    claim_i, claim_j, similarities, drug_ids = claim_i[found], claim_j[found], similarities[found], drug_ids[found]
+    pair_keys = np.minimum(claim_i, claim_j) * num_claims + np.maximum(claim_i, claim_j)
+    pair_keys, first = np.unique(pair_keys, return_index=True)
+
+    return drug_ids[first], pair_keys // num_claims, pair_keys % num_claims, similarities[first]
@@ -0,0 +1,216 @@
+"""Functions for storing claim pairs as a partitioned columnar dataset on disk."""
+
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from scipy.sparse import issparse, load_npz, save_npz
+
+from .similarity_histogram import SimilarityHistogram
+
+CLAIMS_FILE = 'claims.parquet'
+PAPERS_FILE = 'papers.parquet'
+VECTORS_FILE = 'claim_vectors.npy'
+SPARSE_VECTORS_FILE = 'claim_vectors.npz'
+DRUGS_FILE = 'drugs.json'
+HISTOGRAM_FILE = 'similarity_histogram.npy'
+PAIRS_DIR = 'pairs'
+PAIR_COLUMNS = ['claim_i', 'claim_j', 'similarity']
+
+
+def similarity_bucket(similarity):
+    """
+    Get the similarity bucket (the tenth of the cosine similarity range) that pairs are partitioned by.
+
+    :param similarity: cosine similarity, or array of similarities
+    :return: Bucket number(s), e.g. 7 for similarities in [0.7, 0.8)
+    """
+    return np.floor(np.asarray(similarity, dtype=np.float64) * 10).astype(np.int8)
+
+
+def init_pair_store(out_dir: str, claims: pd.DataFrame, papers: pd.DataFrame, claim_vectors: np.ndarray,
+                    drugs: list):
+    """
+    Create a claim pair store, writing the claim and paper tables and removing any previously stored pairs.
+
+    :param out_dir: directory of the pair store
+    :param claims: claims table, indexed by claim id
+    :param papers: papers table, indexed by paper id
+    :param claim_vectors: unit-length claim vectors, one row per claim id
+    :param drugs: drug terms in drug id order
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    clear_claim_pairs(out_dir)
+    write_claim_tables(out_dir, claims, papers)
+    write_claim_vectors(out_dir, claim_vectors)
+    write_drugs(out_dir, drugs)
+
+
+def write_claim_tables(out_dir: str, claims: pd.DataFrame, papers: pd.DataFrame):
+    """
+    Write the claim and paper tables of a claim pair store.
+
+    :param out_dir: directory of the pair store
+    :param claims: claims table, indexed by claim id
+    :param papers: papers table, indexed by paper id
+    """
+    claims.reset_index(drop=True).to_parquet(os.path.join(out_dir, CLAIMS_FILE))
+    papers.reset_index(drop=True).to_parquet(os.path.join(out_dir, PAPERS_FILE))
+
+
+def read_claim_tables(out_dir: str):
+    """
+    Read the claim and paper tables of a claim pair store.
+
+    :param out_dir: directory of the pair store
+    :return: Claims table and papers table, indexed by claim id and paper id respectively
+    """
+    claims = pd.read_parquet(os.path.join(out_dir, CLAIMS_FILE))
+    claims['drug_terms_mention'] = [list(drugs) for drugs in claims.drug_terms_mention]
+    papers = pd.read_parquet(os.path.join(out_dir, PAPERS_FILE))
+
+    return claims, papers
+
+
+def write_claim_vectors(out_dir: str, claim_vectors: np.ndarray):
+    """
+    Write the claim vectors of a claim pair store.
+
+    :param out_dir: directory of the pair store
+    :param claim_vectors: unit-length claim vectors, one row per claim id. Sparse (TF-IDF) vectors are stored
+        in compressed sparse row format
+    """
+    for vectors_file in [VECTORS_FILE, SPARSE_VECTORS_FILE]:
+        if os.path.exists(os.path.join(out_dir, vectors_file)):
+            os.remove(os.path.join(out_dir, vectors_file))
+    if issparse(claim_vectors):
+        save_npz(os.path.join(out_dir, SPARSE_VECTORS_FILE), claim_vectors.tocsr())
+    else:
+        np.save(os.path.join(out_dir, VECTORS_FILE), np.asarray(claim_vectors, dtype=np.float32))
+
+
+def read_claim_vectors(out_dir: str, mmap_mode: str = 'r'):
+    """
+    Read the claim vectors of a claim pair store, memory-mapped by default.
+
+    :param out_dir: directory of the pair store
+    :param mmap_mode: numpy memory-map mode, or None to read the vectors into memory. Sparse vectors are always
+        read into memory
+    :return: Array (or sparse matrix) of claim vectors, one row per claim id
+    """
+    if os.path.exists(os.path.join(out_dir, SPARSE_VECTORS_FILE)):
+        return load_npz(os.path.join(out_dir, SPARSE_VECTORS_FILE)).tocsr()
+
+    return np.load(os.path.join(out_dir, VECTORS_FILE), mmap_mode=mmap_mode)
+
+
+def write_drugs(out_dir: str, drugs: list):
+    """
+    Write the drug terms of a claim pair store, in drug id order.
+
+    :param out_dir: directory of the pair store
+    :param drugs: drug terms in drug id order
+    """
+    with open(os.path.join(out_dir, DRUGS_FILE), 'w') as f:
+        json.dump(list(drugs), f)
+
+
+def read_drugs(out_dir: str):
+    """
+    Read the drug terms of a claim pair store, in drug id order.
+
+    :param out_dir: directory of the pair store
+    :return: List of drug terms
+    """
+    with open(os.path.join(out_dir, DRUGS_FILE)) as f:
+        return json.load(f)
+
+
+def write_similarity_histogram(out_dir: str, histogram: SimilarityHistogram):
+    """
+    Write the similarity histogram of the candidate pairs of a claim pair store.
+
+    :param out_dir: directory of the pair store
+    :param histogram: SimilarityHistogram, with the drug terms of the store in drug id order
+    """
+    np.save(os.path.join(out_dir, HISTOGRAM_FILE), histogram.counts)
+
+
+def read_similarity_histogram(out_dir: str):
+    """
+    Read the similarity histogram of the candidate pairs of a claim pair store.
+
+    :param out_dir: directory of the pair store
+    :return: SimilarityHistogram, or None if the pairs were stored without one (e.g. by a top-k pairing)
+    """
+    histogram_path = os.path.join(out_dir, HISTOGRAM_FILE)
+    if not os.path.exists(histogram_path):
+        return None
+
+    return SimilarityHistogram(drugs=read_drugs(out_dir), counts=np.load(histogram_path))
+
+
+def clear_claim_pairs(out_dir: str):
+    """
+    Remove the stored claim pairs and their similarity histogram, keeping the claims, papers and vectors.
+
+    :param out_dir: directory of the pair store
+    """
+    shutil.rmtree(os.path.join(out_dir, PAIRS_DIR), ignore_errors=True)
+    if os.path.exists(os.path.join(out_dir, HISTOGRAM_FILE)):
+        os.remove(os.path.join(out_dir, HISTOGRAM_FILE))
+
+
+def append_claim_pairs(out_dir: str, drugs: np.ndarray, claim_i: np.ndarray, claim_j: np.ndarray,
+                       similarity: np.ndarray):
+    """
+    Append a chunk of claim pairs to the store, partitioned by drug and similarity bucket.
+
+    :param out_dir: directory of the pair store
+    :param drugs: drug term each pair was generated for
+    :param claim_i: claim ids of the first claim of each pair
+    :param claim_j: claim ids of the second claim of each pair
+    :param similarity: cosine similarity of each pair
+    """
+    if len(claim_i) == 0:
+        return
+    table = pa.table({'claim_i': np.asarray(claim_i, dtype=np.int32),
+                      'claim_j': np.asarray(claim_j, dtype=np.int32),
+                      'similarity': np.asarray(similarity, dtype=np.float32),
+                      'drug': np.asarray(drugs, dtype=object),
+                      'similarity_bucket': similarity_bucket(similarity)})
+    pq.write_to_dataset(table, os.path.join(out_dir, PAIRS_DIR), partition_cols=['drug', 'similarity_bucket'])
+
+
+def read_claim_pairs(out_dir: str, drugs: list = None, min_similarity: float = None, columns: list = None):
+    """
+    Read claim pairs from the store, scanning only the partitions and columns that are needed.
+
+    :param out_dir: directory of the pair store
+    :param drugs: if given, only read pairs generated for these drug terms
+    :param min_similarity: if given, only read pairs with at least this cosine similarity
+    :param columns: columns to read, out of claim_i, claim_j, similarity, drug and similarity_bucket.
+        Defaults to claim_i, claim_j and similarity
+    :return: Dataframe of claim pairs
+    """
+    columns = PAIR_COLUMNS if columns is None else columns
+    pairs_dir = os.path.join(out_dir, PAIRS_DIR)
+    if not os.path.isdir(pairs_dir):
+        return pd.DataFrame({c: pd.Series(dtype=np.int32 if c.startswith('claim') else np.float32)
+                             for c in columns})
+
+    filters = []
+    if drugs is not None:
+        filters.append(('drug', 'in', list(drugs)))
+    if min_similarity is not None:
+        filters.append(('similarity_bucket', '>=', int(similarity_bucket(min_similarity))))
+        filters.append(('similarity', '>=', min_similarity))
+    table = pq.read_table(pairs_dir, columns=columns, filters=filters or None)
+
+    return table.to_pandas()
@@ -0,0 +1,113 @@
+"""Functions for planning a claim pairing run before any claims are embedded."""
+
+# -*- coding: utf-8 -*-
+
+import time
+
+import numpy as np
+import pandas as pd
+
+from .pair_scoring import build_shared_drug_bitmap, iter_block_cross_paper_pairs, normalize_rows, pairing_paper_ids
+from .process_claims import build_drug_claim_index, extract_drug_terms
+
+
+def _measure_scoring_rate(vector_dim: int, num_pairs: int = 10000, num_claims: int = 1000):
+    """
+    Measure how many candidate pairs per second this machine scores, on random unit vectors.
+
+    The sample is kept small (about 16MB of gathered vectors at dimension 200), so planning stays cheap.
+
+    :param vector_dim: dimension of the claim vectors
+    :param num_pairs: number of pairs to score for the measurement
+    :param num_claims: number of random claim vectors the pairs are drawn from
+    :return: Scored pairs per second
+    """
+    rng = np.random.RandomState(0)
+    claim_vectors = normalize_rows(rng.standard_normal((num_claims, vector_dim)).astype(np.float32))
+    claim_i, claim_j = rng.randint(0, num_claims, num_pairs), rng.randint(0, num_claims, num_pairs)
+    start = time.perf_counter()
+    np.flatnonzero(np.einsum('ij,ij->i', claim_vectors[claim_i], claim_vectors[claim_j]) >= 0.5)
+    elapsed = time.perf_counter() - start
+
+    return num_pairs / max(elapsed, 1e-9)
+
+
+def _count_cross_paper_pairs(paper_ids: np.ndarray):
+    """
+    Count the pairs of claims from different papers among a set of claims.
+
+    :param paper_ids: integer paper id of each claim
+    :return: Number of cross-paper pairs
+    """
+    paper_counts = np.unique(paper_ids, return_counts=True)[1].astype(np.int64)
+    num_claims = len(paper_ids)
+
+    # All pairs, minus those of claims from the same paper
+    return num_claims * (num_claims - 1) // 2 - int((paper_counts * (paper_counts - 1) // 2).sum())
+
+
+def plan_claim_pairing(claims_data: pd.DataFrame, top_k: int = None, chunk_size: int = 1000000,
+                       vector_dim: int = 200, seconds_per_claim: float = 0.005, memory_budget: float = 8e9):
+    """
+    Plan a run of pair_similar_claims without embedding or scoring any claims.
+
+    Candidate pairs are counted exactly as pair_similar_claims generates them: a pair of claims sharing several
+    drug terms only in the block of the first one. The pairs of a block are counted from its claim and paper
+    counts, and only the pairs of claims mentioning more than one drug term are enumerated, to drop those
+    counted in an earlier block. Memory and runtime are estimated from the counts, with the scoring rate
+    measured on this machine. The recommended strategy is "exact blocked" if all candidate pairs can be kept,
+    and "top-k" if keeping them would exceed the memory budget.
+
+    :param claims_data: pandas dataframe with cord 19 claims
+    :param top_k: if given, plan a top_k run, which keeps at most top_k partners per claim
+    :param chunk_size: approximate number of candidate pairs scored at a time
+    :param vector_dim: dimension of the claim vectors (200 for en_core_sci_lg)
+    :param seconds_per_claim: estimated time to embed a claim with the scispacy model
+    :param memory_budget: memory available to the run, in bytes
+    :return: Dictionary with the number of claims and drug terms, a dataframe of per drug term claim, paper and
+        candidate pair counts (largest first), the total candidate pairs, the estimated peak memory (bytes) and
+        runtime (seconds), and the recommended strategy
+    """
+    drug_terms = extract_drug_terms(claims_data)
+    claim_positions, drug_claim_index = build_drug_claim_index(claims_data.claims, drug_terms)
+    paper_ids, _ = pd.factorize(claims_data.cord_uid.iloc[claim_positions])
+    num_papers = [len(np.unique(paper_ids[claim_ids])) for claim_ids in drug_claim_index.values()]
+    if 'cord_uids' in claims_data:
+        paper_ids = pairing_paper_ids(paper_ids, claims_data.cord_uids.iloc[claim_positions])
+
+    bitmap_rows, bitmap = build_shared_drug_bitmap(drug_claim_index, len(paper_ids))
+    drug_rows = []
+    for drug_id, (drug, claim_ids) in enumerate(drug_claim_index.items()):
+        candidate_pairs = _count_cross_paper_pairs(paper_ids[claim_ids])
+        # Only pairs of claims that both mention several drug terms can share an earlier one
+        multi_drug_claims = claim_ids[bitmap_rows[claim_ids] >= 0]
+        if drug_id > 0 and len(multi_drug_claims) > 1:
+            candidate_pairs -= _count_cross_paper_pairs(paper_ids[multi_drug_claims])
+            for claim_i, _ in iter_block_cross_paper_pairs(multi_drug_claims, drug_id, paper_ids, bitmap_rows,
+                                                           bitmap, chunk_size):
+                candidate_pairs += len(claim_i)
+        drug_rows.append({'drug': drug, 'num_claims': len(claim_ids), 'num_papers': num_papers[drug_id],
+                          'candidate_pairs': candidate_pairs})
+    drug_pairs = pd.DataFrame(drug_rows, columns=['drug', 'num_claims', 'num_papers', 'candidate_pairs'])
+    drug_pairs = drug_pairs.sort_values('candidate_pairs', ascending=False).reset_index(drop=True)
+
+    num_claims = len(claim_positions)
+    candidate_pairs = int(drug_pairs.candidate_pairs.sum())
+    # Claim vectors, one chunk of gathered vector pairs, and the kept pairs (two int32 ids and a float32 each)
+    vectors_bytes = num_claims * vector_dim * 4
+    chunk_bytes = min(chunk_size, candidate_pairs) * (2 * vector_dim * 4 + 3 * 8)
+    kept_pairs = candidate_pairs if top_k is None else min(candidate_pairs, num_claims * top_k)
+    exact_memory = vectors_bytes + chunk_bytes + candidate_pairs * 12
+    memory = vectors_bytes + chunk_bytes + kept_pairs * 12
+    scoring_runtime = candidate_pairs / _measure_scoring_rate(vector_dim)
+    runtime = num_claims * seconds_per_claim + scoring_runtime
+
+    strategy = 'top-k' if exact_memory > memory_budget else 'exact blocked'
+
+    return {'num_claims': num_claims,
+            'num_drugs': len(drug_claim_index),
+            'drug_pairs': drug_pairs,
+            'candidate_pairs': candidate_pairs,
+            'memory_bytes': memory,
+            'runtime_seconds': runtime,
+            'strategy': strategy}
@@ -2,40 +2,52 @@
 
 # -*- coding: utf-8 -*-
 
-from itertools import combinations
-
-# import en_core_sci_lg
-import nltk
-nltk.download('punkt')
-import pandas as pd  # noqa: E402
-import spacy  # noqa: E402
-from nltk import sent_tokenize  # noqa: E402
-from numba import jit  # noqa: E402
-# import scispacy  # noqa: F401
-from scispacy.abbreviation import AbbreviationDetector  # noqa: E402
-from scispacy.umls_linking import UmlsEntityLinker  # noqa: E402
-from sklearn.metrics.pairwise import cosine_similarity  # noqa: E402
+import re
+from typing import Dict, Iterable, List, NamedTuple
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+
+from .pair_scoring import iter_pairs_above_threshold, iter_pairs_in_parallel, normalize_rows, pair_top_k,\
+    pairing_paper_ids
+from .pair_store import append_claim_pairs, init_pair_store, write_similarity_histogram
+from .sentence_tokenizer import sentence_spans
+from .shared_vectors import attach_shared_vectors, export_shared_vectors, has_shared_vectors,\
+    load_model_with_shared_vectors
+from .similarity_histogram import SimilarityHistogram, empty_similarity_histogram
 # from spacy.vocab import Vocab
 
 
-def initialize_nlp(virus_lex_path: str, scispacy_model_name: str = "en_core_sci_lg"):
+def initialize_nlp(virus_lex_path: str, scispacy_model_name: str = "en_core_sci_lg", shared_vectors_dir: str = None):
     """
     Initialize scispacy nlp object and virus terms to the vocabulary.
 
     :param virus_lex_path: path to virus lexicon
     :param scispacy_model_name: name of scispacy model to use for w2v vectors
+    :param shared_vectors_dir: if given, share the vector table (with the virus terms) between processes through
+        a memory-mapped file in this directory. The first process exports it, later ones attach to it
     :return: Scispacy nlp object
     """
+    # spacy and scispacy are slow to import, so only import them when a model is loaded
+    import spacy
+    from scispacy.abbreviation import AbbreviationDetector
+
     # Load the scispacy large model
-    # nlp = en_core_sci_lg.load(disable='parser')
     # I believe this should work, I wonder if it's not recommended for  memory reasons though in a v env like Travis...
-    nlp = spacy.load(scispacy_model_name, disable='parser')
-    # Enable umls entity detection and abbreviation detection
-    linker = UmlsEntityLinker(resolve_abbreviations=True)
-    nlp.add_pipe(linker)
+    shared = shared_vectors_dir is not None and has_shared_vectors(shared_vectors_dir)
+    if shared:
+        # Skip the model's own vector table: the exported one already has the virus terms
+        nlp = load_model_with_shared_vectors(scispacy_model_name, shared_vectors_dir, disable=['parser'])
+    else:
+        nlp = spacy.load(scispacy_model_name, disable=['parser'])
+    # Enable abbreviation detection. Claims are embedded from their tokens only, so no UMLS entity linker is loaded
     abbreviation_pipe = AbbreviationDetector(nlp)
     nlp.add_pipe(abbreviation_pipe)
 
+    if shared:
+        return nlp
+
     # Create a new vector to assign to the virus terms
     new_vector = nlp("""Positive-sense single‐stranded ribonucleic acid virus, subgenus """
                      """sarbecovirus of the genus Betacoronavirus. """
@@ -51,6 +63,10 @@ def initialize_nlp(virus_lex_path: str, scispacy_model_name: str = "en_core_sci_
     for virus_word in virus_words[0]:
         nlp.vocab.set_vector(virus_word, new_vector)
 
+    if shared_vectors_dir is not None:
+        export_shared_vectors(nlp, shared_vectors_dir)
+        attach_shared_vectors(nlp, shared_vectors_dir)
+
     return nlp
 
 
@@ -70,110 +86,363 @@ def split_papers_on_claim_presence(claims_df: pd.DataFrame):
     return claims_data, no_claims_data
 
 
-def tokenize_section_text(input_data: pd.DataFrame):
+def tokenize_section_text(input_data: pd.DataFrame, num_workers: int = None):
     """
     Tokenize section text to sentences.
 
     :param input_data: pandas dataframe with publication text
-    :retunr: Dataframe with section text tokenized to sentences
+    :param num_workers: if given, tokenize the sections across this many processes
+    :return: Dataframe with section text tokenized to sentences
     """
-    # Empty dictonary to store the tokenized text
-    text_dict = {}
-    # Dictionary iterator
-    k = 0
+    texts = input_data.text.tolist()
+    text_spans = sentence_spans(texts, num_workers)
 
-    # Loop through the sections and tokenize text to sentences
-    for i, text in enumerate(input_data.text):
-        for sent in sent_tokenize(text):
-            text_dict[k] = {'cord_uid': input_data.cord_uid[i],
-                            'section': input_data.section[i],
-                            'text': input_data.text[i],
-                            'drug_terms_used': input_data.drug_terms_used[i],
-                            'claims': sent}
-            k = k + 1
+    # Repeat each section row once per sentence, and slice the sentences out of the section text
+    rows = np.repeat(np.arange(len(input_data)), [len(spans) for spans in text_spans])
+    tokenized_data = input_data.iloc[rows][['cord_uid', 'section', 'text', 'drug_terms_used']].reset_index(drop=True)
+    tokenized_data['claims'] = [text[start:end] for text, spans in zip(texts, text_spans)
+                                for start, end in spans.tolist()]
 
-    return pd.DataFrame.from_dict(text_dict, "index")
+    return tokenized_data
 
 
-def pair_similar_claims(claims_data: pd.DataFrame, nlp):
+class ClaimPairTables(NamedTuple):
     """
-    Pair similar claims.
+    Normalized claim pairs: claim and paper tables plus a compact table of pairs referencing them by id.
+
+    The claims table is indexed by claim id and holds the claim text, the drug terms it mentions and the paper id
+    (plus the cord_uids of all papers the claim appears in, if near-duplicate claims were collapsed, and the
+    claim text with its abbreviations expanded, if they were).
+    The papers table is indexed by paper id and holds the cord_uid and any paper metadata. The pairs table holds
+    only the two claim ids (int32) and the similarity (float32) of each pair. The similarity histogram, if
+    given, counts the similarities of all candidate pairs per drug term, whatever threshold was applied.
+    """
+
+    claims: pd.DataFrame
+    papers: pd.DataFrame
+    pairs: pd.DataFrame
+    similarity_histogram: SimilarityHistogram = None
+
+    def iter_frames(self, chunk_size: int = 100000):
+        """
+        Lazily join the pairs with their claim and paper attributes, a chunk of pairs at a time.
+
+        :param chunk_size: number of pairs per joined chunk
+        :return: Generator of dataframes of paired claims, with the columns returned by pair_similar_claims
+            followed by paper metadata columns (e.g. title1/title2) if add_cord_metadata was applied
+        """
+        claim_papers = self.claims.paper_id.to_numpy()
+        claims = self.claims.claims.to_numpy()
+        drug_terms_mention = self.claims.drug_terms_mention.to_numpy()
+        cord_uids = self.papers.cord_uid.to_numpy()
+        metadata_columns = [c for c in self.papers.columns if c != 'cord_uid']
+
+        for start in range(0, max(len(self.pairs), 1), chunk_size):
+            chunk = self.pairs.iloc[start:start + chunk_size]
+            claim_i, claim_j = chunk.claim_i.to_numpy(), chunk.claim_j.to_numpy()
+            paper_i, paper_j = claim_papers[claim_i], claim_papers[claim_j]
+            frame = pd.DataFrame({'paper1_cord_uid': cord_uids[paper_i],
+                                  'paper2_cord_uid': cord_uids[paper_j],
+                                  'text1': claims[claim_i],
+                                  'text2': claims[claim_j],
+                                  'similarity_score': chunk.similarity.to_numpy(),
+                                  'drugs1': drug_terms_mention[claim_i],
+                                  'drugs2': drug_terms_mention[claim_j]})
+            for suffix, papers in [('1', paper_i), ('2', paper_j)]:
+                for column in metadata_columns:
+                    frame[column + suffix] = self.papers[column].to_numpy()[papers]
+            yield frame
+
+    def to_frame(self):
+        """
+        Join the pairs with their claim and paper attributes into a single dataframe.
+
+        :return: Dataframe of paired claims, as yielded by iter_frames
+        """
+        return pd.concat(self.iter_frames(), ignore_index=True)
+
+
+def detect_abbreviations(claims_data: pd.DataFrame, nlp):
+    """
+    Detect the abbreviations defined in the section text of each paper, running the detector once per section.
+
+    :param claims_data: pandas dataframe with cord 19 claims and the text of the section each claim is from
+    :param nlp: Scispacy nlp object with the abbreviation detector, as returned by initialize_nlp
+    :return: Dictionary mapping each cord_uid to a dictionary of its abbreviations and their long forms
+    """
+    from scispacy.abbreviation import AbbreviationDetector
+
+    detector = next(pipe for _, pipe in nlp.pipeline if isinstance(pipe, AbbreviationDetector))
+    sections = claims_data.drop_duplicates(['cord_uid', 'text'])
+
+    abbreviation_maps = {}
+    for cord_uid, text in zip(sections.cord_uid, sections.text):
+        if not isinstance(text, str):
+            continue
+        paper_abbreviations = abbreviation_maps.setdefault(cord_uid, {})
+        for abbreviation in detector(nlp.make_doc(text))._.abbreviations:
+            # The first definition in the paper wins
+            paper_abbreviations.setdefault(abbreviation.text, abbreviation._.long_form.text)
+
+    return abbreviation_maps
+
+
+def expand_abbreviations(claims: Iterable[str], cord_uids: Iterable[str], abbreviation_maps: Dict[str, Dict[str, str]]):
+    """
+    Replace the abbreviations in claims by their long forms, using the abbreviation map of the paper of each claim.
+
+    :param claims: claim sentences
+    :param cord_uids: cord_uid of the paper of each claim
+    :param abbreviation_maps: dictionary mapping cord_uids to dictionaries of abbreviations and long forms, as
+        returned by detect_abbreviations
+    :return: List of claims with their abbreviations expanded
+    """
+    patterns = {}
+    expanded_claims = []
+    for claim, cord_uid in zip(claims, cord_uids):
+        paper_abbreviations = abbreviation_maps.get(cord_uid)
+        if not paper_abbreviations:
+            expanded_claims.append(claim)
+            continue
+        if cord_uid not in patterns:
+            # Match whole abbreviations only, longest first
+            abbreviations = sorted(paper_abbreviations, key=len, reverse=True)
+            patterns[cord_uid] = re.compile(r'(?<!\w)(' + '|'.join(map(re.escape, abbreviations)) + r')(?!\w)')
+        expanded_claims.append(patterns[cord_uid].sub(
+            lambda match, long_forms=paper_abbreviations: long_forms[match.group(0)], claim))
+
+    return expanded_claims
+
+
+def extract_drug_terms(claims_data: pd.DataFrame):
+    """
+    Extract the list of drug terms present across all claims.
 
     :param claims_data: pandas dataframe with cord 19 claims
-    :param nlp: Scispacy nlp object
-    :return: Dataframe of paired claims
+    :return: Sorted list of unique drug terms. The position of a term in this list is its drug id
     """
-    # Extract list of drug terms present across all claims
     # Note: 'drug_terms_used' consists of drug terms present in the section in which the claim appears
-    drug_terms = []
+    drug_terms = {'acei/arb'}
     for drugs in claims_data.drug_terms_used:
-        drug_terms = drug_terms + str(drugs).split(',')
-    drug_terms = list(set(drug_terms))
-    drug_terms.append('acei/arb')
+        drug_terms.update(str(drugs).split(','))
+    # An empty term would match every claim, so drop it
+    drug_terms.discard('')
+
+    return sorted(drug_terms)
+
+
+def build_drug_claim_index(claims: Iterable[str], drug_terms: List[str]):
+    """
+    Build an inverted index from drug term to the claims mentioning it, in a single pass over the claims.
+
+    A claim mentions a drug term if the term appears anywhere in the claim text.
+
+    :param claims: claim sentences
+    :param drug_terms: list of drug terms, as returned by extract_drug_terms
+    :return: Positions of the claims mentioning at least one drug term, and a dictionary mapping each mentioned
+        drug term (in drug id order) to a sorted array of claim ids. Claim ids index into the returned positions
+    """
+    # Match the longest term starting at each position of a claim. Every other term starting at the same
+    # position is a prefix of that longest term, so all mentions are recovered from a single regex scan
+    terms_by_length = sorted(drug_terms, key=len, reverse=True)
+    pattern = re.compile('(?=(' + '|'.join(re.escape(d) for d in terms_by_length) + '))')
+    prefix_ids = {d: [i for i, d2 in enumerate(drug_terms) if d.startswith(d2)] for d in drug_terms}
+
+    claim_positions = []
+    claim_ids_by_drug = [[] for _ in drug_terms]
+    for position, claim in enumerate(claims):
+        drug_ids = set()
+        for match in pattern.finditer(claim):
+            drug_ids.update(prefix_ids[match.group(1)])
+        if drug_ids:
+            claim_id = len(claim_positions)
+            claim_positions.append(position)
+            for drug_id in drug_ids:
+                claim_ids_by_drug[drug_id].append(claim_id)
+
+    drug_claim_index = {drug_terms[drug_id]: np.array(claim_ids, dtype=np.int64)
+                        for drug_id, claim_ids in enumerate(claim_ids_by_drug) if claim_ids}
+
+    return np.array(claim_positions, dtype=np.int64), drug_claim_index
+
+
+def get_drug_terms_mention(drug_claim_index: Dict[str, np.ndarray], num_claims: int):
+    """
+    Invert the drug-claim index to get the drug terms mentioned in each claim.
+
+    :param drug_claim_index: dictionary mapping drug terms to sorted arrays of claim ids
+    :param num_claims: number of indexed claims
+    :return: List holding, for each claim id, the list of drug terms mentioned in that claim
+    """
+    drug_terms_mention = [[] for _ in range(num_claims)]
+    for drug, claim_ids in drug_claim_index.items():
+        for claim_id in claim_ids:
+            drug_terms_mention[claim_id].append(drug)
+
+    return drug_terms_mention
+
+
+def embed_claims(claims: Iterable[str], nlp):
+    """
+    Calculate the unit-length scispacy vector of each claim.
 
-    # Filter to claims that contain drug terms
-    sentences_to_keep = [any(True for d in drug_terms if d in c) for c in claims_data.claims]
-    claims_data = claims_data[sentences_to_keep].reset_index(drop=True)
+    Only the tokenizer is run, since the pipeline components do not change the vectors; abbreviations are
+    resolved beforehand with detect_abbreviations and expand_abbreviations.
+
+    :param claims: claim sentences
+    :param nlp: Scispacy nlp object
+    :return: Array of claim vectors, one row per claim
+    """
+    claim_vectors = [nlp.make_doc(c).vector for c in claims]
+    if not claim_vectors:
+        return np.zeros((0, 1), dtype=np.float32)
+
+    return normalize_rows(np.vstack(claim_vectors).astype(np.float32))
+
+
+def _embed_claims_tfidf(claims: Iterable[str]):
+    """
+    Calculate the unit-length TF-IDF vector of each claim over its character n-grams.
+
+    :param claims: claim sentences
+    :return: Sparse matrix of claim vectors, one row per claim
+    """
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+    claims = list(claims)
+    if not claims:
+        return csr_matrix((0, 1), dtype=np.float32)
+    vectorizer = TfidfVectorizer(analyzer='char_wb', ngram_range=(3, 5), sublinear_tf=True, dtype=np.float32)
+
+    return vectorizer.fit_transform(claims).tocsr()
+
+
+def pair_similar_claims(claims_data: pd.DataFrame, nlp, threshold: float = 0.5, top_k: int = None,
+                        chunk_size: int = 1000000, return_tables: bool = False, out_dir: str = None,
+                        num_workers: int = None, backend: str = 'scispacy',
+                        abbreviation_maps: Dict[str, Dict[str, str]] = None):
+    """
+    Pair similar claims.
+
+    :param claims_data: pandas dataframe with cord 19 claims
+    :param nlp: Scispacy nlp object. Not used by the tfidf backend
+    :param threshold: minimum cosine similarity of a pair of claims. If None, no threshold is applied
+    :param top_k: if given, keep only the top_k most similar partners of each claim (combined with threshold)
+    :param chunk_size: approximate number of candidate pairs scored at a time
+    :param return_tables: if True, return the normalized ClaimPairTables instead of a dataframe
+    :param out_dir: if given, write the claim pairs to a pair store in this directory as they are produced,
+        partitioned by drug and similarity bucket, instead of keeping them in memory
+    :param num_workers: if given, score the pairs of the drug terms across this many processes. The order of
+        the pairs then depends on which drug blocks finish first. Not supported with top_k
+    :param backend: claim vectors to compare: "scispacy" for the mean word vectors of the nlp object, or
+        "tfidf" for sparse TF-IDF vectors of character n-grams, which skips the spacy pipeline
+    :param abbreviation_maps: if given, per cord_uid abbreviation maps (see detect_abbreviations). Claims are
+        matched to drug terms and embedded with their abbreviations expanded
+    :return: Dataframe of paired claims, or ClaimPairTables if return_tables is True. None if out_dir is given;
+        use load_claim_pair_tables to read the stored pairs
+    """
+    # Extract list of drug terms present across all claims
+    drug_terms = extract_drug_terms(claims_data)
+
+    # Expand abbreviations defined elsewhere in the paper of each claim
+    claim_texts = claims_data.claims.to_numpy()
+    if abbreviation_maps is not None:
+        claim_texts = np.array(expand_abbreviations(claim_texts, claims_data.cord_uid, abbreviation_maps),
+                               dtype=object)
+
+    # Filter to claims that contain drug terms, indexing them by the drug terms they mention
+    claim_positions, drug_claim_index = build_drug_claim_index(claim_texts, drug_terms)
+    claims_data = claims_data.iloc[claim_positions].reset_index(drop=True)
+    claim_texts = claim_texts[claim_positions]
     # Add a new column for storing the drug terms present in each claim
-    claims_data['drug_terms_mention'] = [[d for d in drug_terms if d in c] for c in claims_data.claims]
-
-    drug_terms_mentions_flat = [d for d_list in claims_data['drug_terms_mention'] for d in d_list]
-    drug_terms_mentions_flat = list(set(drug_terms_mentions_flat))
-
-    paper_pairs_filt = []
-    # Loop through drugs and filter to claims that mention the drug term
-    for d in drug_terms_mentions_flat:
-        claims_with_drug_index = [d in d_list for d_list in claims_data.drug_terms_mention]
-        claims_with_drug = claims_data[claims_with_drug_index]
-        # Pair all claims with the same drug mention
-        paper_pairs = list(combinations(claims_with_drug.index, 2))
-        # Filter to claim pairs that come from different papers
-        for i, j in paper_pairs:
-            if claims_with_drug.cord_uid[i] != claims_with_drug.cord_uid[j]:
-                # if any(d1 in claims_data.drug_terms_mention[i] for d1 in claims_data.drug_terms_mention[j]):
-                paper_pairs_filt.append((i, j))
-    paper_pairs_filt = list(set(paper_pairs_filt))
-
-    # Calculate scispacy vector for each claim
-    claims_data['w2vVector'] = [nlp(c).vector.reshape(1, -1) for c in claims_data.claims]
-
-    # Empty dictonary to store the similar claim pairs
-    claim_pairs_dict = {}
-    # Dictionary iterator
-    k = 0
-
-    # Initialize just-in-time compiler for efficient parallel processing
-    jit(nopython=True, parallel=True)
-
-    # For each pair of claims, calculate cosine similarity between the respective scispacy vectors
-    # and keep only those pairs with at least 50% similarity
-    for i, j in paper_pairs_filt:
-        cos_sim = cosine_similarity(claims_data.w2vVector[i], claims_data.w2vVector[j])[0][0]
-        if cos_sim >= 0.5:
-            claim_pairs_dict[k] = {'paper1_cord_uid': claims_data.cord_uid[i],
-                                   'paper2_cord_uid': claims_data.cord_uid[j],
-                                   'text1': claims_data.claims[i],
-                                   'text2': claims_data.claims[j],
-                                   'similarity_score': cos_sim,
-                                   'drugs1': claims_data.drug_terms_mention[i],
-                                   'drugs2': claims_data.drug_terms_mention[j]}
-            k = k + 1
-
-    return pd.DataFrame.from_dict(claim_pairs_dict, "index")
+    claims_data['drug_terms_mention'] = get_drug_terms_mention(drug_claim_index, len(claims_data))
+
+    # Calculate scispacy (or TF-IDF) vector for each claim
+    if backend == 'scispacy':
+        claim_vectors = embed_claims(claim_texts, nlp)
+    elif backend == 'tfidf':
+        claim_vectors = _embed_claims_tfidf(claim_texts)
+    else:
+        raise ValueError(f'Unknown similarity backend {backend}, expected scispacy or tfidf')
+
+    # For each pair of claims from different papers that mention the same drug, calculate cosine similarity
+    # between the respective scispacy vectors and keep only the similar pairs
+    paper_ids, paper_cord_uids = pd.factorize(claims_data.cord_uid)
+    compared_paper_ids = pairing_paper_ids(paper_ids, claims_data.cord_uids if 'cord_uids' in claims_data else None)
+    # Count the similarities of all candidate pairs, so that other thresholds can be evaluated afterwards
+    similarity_histogram = empty_similarity_histogram(list(drug_claim_index)) if top_k is None else None
+    if num_workers is not None:
+        if top_k is not None:
+            raise ValueError('top_k pairing cannot be split across worker processes')
+        pair_chunks = iter_pairs_in_parallel(drug_claim_index, compared_paper_ids, claim_vectors, threshold,
+                                             chunk_size, num_workers, similarity_histogram)
+    elif top_k is None:
+        pair_chunks = iter_pairs_above_threshold(drug_claim_index, compared_paper_ids, claim_vectors, threshold,
+                                                 chunk_size, similarity_histogram)
+    else:
+        pair_chunks = [pair_top_k(drug_claim_index, compared_paper_ids, claim_vectors, top_k, threshold,
+                                  chunk_size)]
+
+    claims_table = pd.DataFrame({'paper_id': paper_ids.astype(np.int32),
+                                 'claims': claims_data.claims,
+                                 'drug_terms_mention': claims_data.drug_terms_mention})
+    if 'cord_uids' in claims_data:
+        # Keep the provenance of claims collapsed by collapse_near_duplicate_claims
+        claims_table['cord_uids'] = claims_data.cord_uids
+    if abbreviation_maps is not None:
+        # Keep the text the claims were matched to drug terms in, so that pair_new_claims matches them the same way
+        claims_table['expanded_claims'] = claim_texts
+    papers_table = pd.DataFrame({'cord_uid': paper_cord_uids})
+
+    if out_dir is not None:
+        drugs = np.array(list(drug_claim_index), dtype=object)
+        init_pair_store(out_dir, claims_table, papers_table, claim_vectors, list(drugs))
+        for drug_ids, claim_i, claim_j, similarities in pair_chunks:
+            append_claim_pairs(out_dir, drugs[drug_ids], claim_i, claim_j, similarities)
+        if similarity_histogram is not None:
+            write_similarity_histogram(out_dir, similarity_histogram)
+        return None
+
+    pairs_i, pairs_j, similarities = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int64)], [np.zeros(0)]
+    for _, claim_i, claim_j, cos_sim in pair_chunks:
+        pairs_i.append(claim_i)
+        pairs_j.append(claim_j)
+        similarities.append(cos_sim)
+    claim_pair_tables = ClaimPairTables(
+        claims=claims_table,
+        papers=papers_table,
+        pairs=pd.DataFrame({'claim_i': np.concatenate(pairs_i).astype(np.int32),
+                            'claim_j': np.concatenate(pairs_j).astype(np.int32),
+                            'similarity': np.concatenate(similarities).astype(np.float32)}),
+        similarity_histogram=similarity_histogram)
+    if return_tables:
+        return claim_pair_tables
+
+    return claim_pair_tables.to_frame()
 
 
 def add_cord_metadata(input_data, metadata_path):
     """
     Add paper publish time and title metadata to the given cord claim pairs.
 
-    :param input_data: pandas dataframe with cord claim pairs
+    :param input_data: pandas dataframe with cord claim pairs, or ClaimPairTables
     :param metadata: path to cord metadata.csv
-    :return: Merged dataframe
+    :return: Merged dataframe, or ClaimPairTables with the metadata added to its papers table
     """
     # Read metadata
     metadata = pd.read_csv(metadata_path)
     metadata = metadata[['cord_uid', 'publish_time', 'title']]
 
+    if isinstance(input_data, ClaimPairTables):
+        # Add title and publish time once per paper, and drop pairs with a paper missing from the metadata
+        metadata = metadata.drop_duplicates('cord_uid')
+        papers = input_data.papers.merge(metadata, how='left', on='cord_uid', indicator=True)
+        paper_found = (papers.pop('_merge') == 'both').to_numpy()
+        claim_paper_found = paper_found[input_data.claims.paper_id.to_numpy()]
+        pairs = input_data.pairs
+        pairs = pairs[claim_paper_found[pairs.claim_i.to_numpy()] & claim_paper_found[pairs.claim_j.to_numpy()]]
+        return input_data._replace(papers=papers, pairs=pairs.reset_index(drop=True))
+
     # Add title and publish time for first claim's paper
     input_data = pd.merge(input_data, metadata, how='inner',
                           left_on='paper1_cord_uid',
@@ -0,0 +1,129 @@
+"""Batched sentence tokenization shared by claim processing and claim extraction."""
+
+# -*- coding: utf-8 -*-
+
+import hashlib
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, List
+
+import nltk
+import numpy as np
+
+# Number of texts whose sentence offsets are kept in the cache
+CACHE_SIZE = 100000
+
+# nltk 3.8.2 and later read the punkt model from the punkt_tab resource, earlier versions from the punkt pickle
+PUNKT_RESOURCE = 'punkt_tab' if hasattr(nltk.tokenize, 'PunktTokenizer') else 'punkt'
+
+_punkt_tokenizer = None
+_span_cache = OrderedDict()
+
+
+def _load_punkt():
+    """
+    Load the english punkt sentence tokenizer used by nltk.sent_tokenize, once per process.
+
+    :return: Punkt sentence tokenizer
+    """
+    global _punkt_tokenizer
+    if _punkt_tokenizer is None:
+        try:
+            _punkt_tokenizer = _load_punkt_model()
+        except LookupError:
+            # Download the punkt model on first use instead of on import
+            nltk.download(PUNKT_RESOURCE, quiet=True)
+            _punkt_tokenizer = _load_punkt_model()
+
+    return _punkt_tokenizer
+
+
+def _load_punkt_model():
+    """
+    Load the english punkt sentence tokenizer from the nltk data directory.
+
+    :return: Punkt sentence tokenizer
+    """
+    if PUNKT_RESOURCE == 'punkt_tab':
+        return nltk.tokenize.PunktTokenizer('english')
+
+    return nltk.data.load('tokenizers/punkt/english.pickle')
+
+
+def text_key(text: str):
+    """
+    Hash a text to its cache key, e.g. for the sentence offsets or the claims of a paragraph.
+
+    :param text: text to hash
+    :return: 16 byte digest of the text
+    """
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+
+
+def _span_tokenize_batch(texts: List[str]):
+    """
+    Find the sentence offsets of a batch of texts with punkt.
+
+    :param texts: texts to split into sentences
+    :return: List with an (n sentences x 2) array of start and end offsets per text
+    """
+    tokenizer = _load_punkt()
+    return [np.array(list(tokenizer.span_tokenize(text)), dtype=np.int64).reshape(-1, 2) for text in texts]
+
+
+def sentence_spans(texts: Iterable[str], num_workers: int = None, batch_size: int = 1000):
+    """
+    Find the sentence boundaries of many texts as character offsets, the same boundaries nltk.sent_tokenize finds.
+
+    Each distinct text is tokenized once: repeated texts and texts seen by earlier calls are looked up in a cache
+    keyed by the hash of the text.
+
+    :param texts: texts to split into sentences
+    :param num_workers: if given, tokenize the texts not found in the cache across this many processes
+    :param batch_size: number of texts tokenized per task in a process pool
+    :return: List with an (n sentences x 2) array of start and end offsets per text
+    """
+    texts = list(texts)
+    keys = [text_key(text) for text in texts]
+
+    # Tokenize each distinct text that is not cached yet
+    missing = {}
+    for key, text in zip(keys, texts):
+        if key not in _span_cache and key not in missing:
+            missing[key] = text
+    missing_texts = list(missing.values())
+    batches = [missing_texts[start:start + batch_size] for start in range(0, len(missing_texts), batch_size)]
+    if num_workers is not None and len(batches) > 1:
+        with ProcessPoolExecutor(num_workers) as executor:
+            batch_spans = list(executor.map(_span_tokenize_batch, batches))
+    else:
+        batch_spans = [_span_tokenize_batch(batch) for batch in batches]
+    found = dict(zip(missing, (spans for batch in batch_spans for spans in batch)))
+
+    text_spans = []
+    for key in keys:
+        if key in found:
+            spans = found[key]
+        else:
+            spans = _span_cache[key]
+            _span_cache.move_to_end(key)
+        text_spans.append(spans)
+    for key, spans in found.items():
+        _span_cache[key] = spans
+        if len(_span_cache) > CACHE_SIZE:
+            _span_cache.popitem(last=False)
+
+    return text_spans
+
+
+def split_sentences(texts: Iterable[str], num_workers: int = None):
+    """
+    Split many texts into sentences, as nltk.sent_tokenize would split each of them.
+
+    :param texts: texts to split into sentences
+    :param num_workers: if given, tokenize the texts not found in the cache across this many processes
+    :return: List of lists of sentences, one per text
+    """
+    texts = list(texts)
+    return [[text[start:end] for start, end in spans.tolist()]
+            for text, spans in zip(texts, sentence_spans(texts, num_workers))]
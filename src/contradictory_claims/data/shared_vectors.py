@@ -0,0 +1,122 @@
+"""Functions for sharing a word vector table between processes through a memory-mapped file."""
+
+# -*- coding: utf-8 -*-
+
+import json
+import os
+from typing import Iterable
+
+import numpy as np
+
+VECTORS_FILE = 'vectors.npy'
+VECTOR_KEYS_FILE = 'vector_keys.npy'
+VECTORS_META_FILE = 'vectors.json'
+
+
+def has_shared_vectors(vectors_dir: str):
+    """
+    Check whether a word vector table has been exported to a directory.
+
+    :param vectors_dir: directory of the exported vector table
+    :return: True if the vector table can be attached
+    """
+    return os.path.exists(os.path.join(vectors_dir, VECTORS_META_FILE))
+
+
+def export_shared_vectors(nlp, vectors_dir: str):
+    """
+    Export the word vector table of a spacy nlp object, including any vectors set after loading it.
+
+    Each file is written to a temporary file of this process and then renamed into place, so that processes
+    exporting concurrently never truncate a table another process has memory-mapped. The metadata file is
+    renamed last, so that processes attaching concurrently never see a partial export.
+
+    :param nlp: spacy nlp object
+    :param vectors_dir: directory to export the vector table to
+    """
+    os.makedirs(vectors_dir, exist_ok=True)
+    vectors = nlp.vocab.vectors
+    keys = np.fromiter(vectors.key2row.keys(), dtype=np.uint64, count=len(vectors.key2row))
+    rows = np.fromiter(vectors.key2row.values(), dtype=np.int64, count=len(vectors.key2row))
+    temp_suffix = f'.{os.getpid()}.tmp'
+    for file_name, array in [(VECTORS_FILE, np.asarray(vectors.data, dtype=np.float32)),
+                             (VECTOR_KEYS_FILE, np.stack([keys, rows.astype(np.uint64)]))]:
+        path = os.path.join(vectors_dir, file_name)
+        # Save to an open file, as np.save would add .npy to the temporary file name
+        with open(path + temp_suffix, 'wb') as f:
+            np.save(f, array)
+        os.replace(path + temp_suffix, path)
+
+    meta_path = os.path.join(vectors_dir, VECTORS_META_FILE)
+    with open(meta_path + temp_suffix, 'w') as f:
+        json.dump({'name': vectors.name, 'shape': list(vectors.data.shape)}, f)
+    os.replace(meta_path + temp_suffix, meta_path)
+
+
+def attach_shared_vectors(nlp, vectors_dir: str):
+    """
+    Replace the word vector table of a spacy nlp object with a read-only memory map of an exported table.
+
+    Processes attaching the same table share its pages instead of each holding a copy. The table loaded with
+    the model is released once the pipeline components are linked to the shared one.
+
+    :param nlp: spacy nlp object, loaded from the same model the table was exported from
+    :param vectors_dir: directory of the exported vector table
+    :return: The nlp object
+    """
+    from spacy._ml import link_vectors_to_models
+
+    vectors = nlp.vocab.vectors
+    with open(os.path.join(vectors_dir, VECTORS_META_FILE)) as f:
+        meta = json.load(f)
+    vectors.data = np.load(os.path.join(vectors_dir, VECTORS_FILE), mmap_mode='r')
+    keys, rows = np.load(os.path.join(vectors_dir, VECTOR_KEYS_FILE))
+    # Map the keys added after loading the model (e.g. the virus terms) to their rows
+    for key, row in zip(keys.tolist(), rows.tolist()):
+        if vectors.key2row.get(key) != row:
+            vectors.add(key, row=row)
+    vectors.name = meta['name']
+    # Register the table with thinc, where the components' static vectors look it up by name. spaCy 2.1 does
+    # this in Vocab.from_disk and has no public call for a table set afterwards; this pins spacy==2.1.9
+    link_vectors_to_models(nlp.vocab)
+
+    return nlp
+
+
+def load_model_with_shared_vectors(model_name: str, vectors_dir: str, disable: Iterable[str] = ()):
+    """
+    Load a spacy model without its own word vector table, attaching an exported table instead.
+
+    Unlike spacy.load followed by attach_shared_vectors, the process never reads the model's vector table into
+    memory, so its peak memory does not include a copy of the table.
+
+    :param model_name: name of an installed spacy model package, or path to a model directory
+    :param vectors_dir: directory of the vector table exported from the same model
+    :param disable: names of pipeline components not to load
+    :return: The nlp object
+    """
+    from spacy import util
+    from spacy.language import _fix_pretrained_vectors_name
+
+    if util.is_package(model_name):
+        package_path = util.get_package_path(model_name)
+        meta = util.get_model_meta(package_path)
+        model_path = package_path / f"{meta['lang']}_{meta['name']}-{meta['version']}"
+    else:
+        model_path = util.ensure_path(model_name)
+        meta = util.get_model_meta(model_path)
+
+    # Create the pipeline components as spacy.load does
+    nlp = util.get_lang_class(meta.get('lang_factory', meta['lang']))(meta=meta)
+    for name in meta.get('pipeline') or []:
+        if name not in disable:
+            nlp.add_pipe(nlp.create_pipe(name, config=meta.get('pipeline_args', {}).get(name, {})), name=name)
+
+    # Attach the vectors before loading the components, as their models look the vector table up by its name.
+    # Language.from_disk names the table from the model meta with _fix_pretrained_vectors_name once the vocab is
+    # loaded, so the same is done here (tested against the pinned spacy==2.1.9)
+    nlp.vocab.from_disk(model_path / 'vocab', exclude=['vectors'])
+    attach_shared_vectors(nlp, vectors_dir)
+    _fix_pretrained_vectors_name(nlp)
+
+    return nlp.from_disk(model_path, exclude=['vocab'])
@@ -0,0 +1,94 @@
+"""Per-drug histograms of candidate claim pair similarities, for choosing a similarity threshold."""
+
+# -*- coding: utf-8 -*-
+
+from typing import Iterable, List, NamedTuple
+
+import numpy as np
+import pandas as pd
+
+NUM_BINS = 2000
+
+
+class SimilarityHistogram(NamedTuple):
+    """
+    Counts of candidate pair similarities per drug term, in equal-width bins over [-1, 1].
+
+    Each candidate pair is counted once, for the drug term it was scored for, whatever threshold the pairing
+    kept. Pair counts are exact for thresholds on the bin edges (multiples of 0.001 by default), up to rounding
+    of similarities that fall right on an edge.
+    """
+
+    drugs: List[str]
+    counts: np.ndarray
+
+    @property
+    def bin_edges(self):
+        """Edges of the similarity bins."""
+        return np.linspace(-1, 1, self.counts.shape[1] + 1)
+
+    def count_pairs(self, threshold: float = None):
+        """
+        Count the candidate pairs of each drug term at or above a similarity threshold.
+
+        :param threshold: minimum cosine similarity. If None, all candidate pairs are counted
+        :return: Series of pair counts indexed by drug term
+        """
+        first_bin = 0 if threshold is None else similarity_bins(threshold, self.counts.shape[1])
+        return pd.Series(self.counts[:, first_bin:].sum(axis=1), index=pd.Index(self.drugs, name='drug'))
+
+    def sweep(self, thresholds: Iterable[float]):
+        """
+        Count the candidate pairs of each drug term at or above each of several similarity thresholds.
+
+        :param thresholds: minimum cosine similarities
+        :return: Dataframe of pair counts with a row per drug term and a column per threshold
+        """
+        # Pairs at or above each bin edge, from a reverse cumulative sum over the bins
+        pairs_from_bin = np.cumsum(self.counts[:, ::-1], axis=1)[:, ::-1]
+        pairs_from_bin = np.hstack([pairs_from_bin, np.zeros((len(self.drugs), 1), dtype=np.int64)])
+        thresholds = list(thresholds)
+        bins = similarity_bins(np.array(thresholds, dtype=np.float64), self.counts.shape[1])
+
+        return pd.DataFrame(pairs_from_bin[:, bins], index=pd.Index(self.drugs, name='drug'), columns=thresholds)
+
+
+def similarity_bins(similarity, num_bins: int = NUM_BINS):
+    """
+    Get the histogram bin of similarities.
+
+    :param similarity: cosine similarity, or array of similarities
+    :param num_bins: number of bins over [-1, 1]
+    :return: Bin number(s)
+    """
+    bins = np.floor((np.asarray(similarity, dtype=np.float64) + 1) * (num_bins / 2) + 1e-9).astype(np.int64)
+    return np.clip(bins, 0, num_bins - 1) if bins.ndim else int(min(max(bins, 0), num_bins - 1))
+
+
+def empty_similarity_histogram(drugs: List[str], num_bins: int = NUM_BINS):
+    """
+    Create a similarity histogram with no pairs counted.
+
+    :param drugs: drug terms in drug id order
+    :param num_bins: number of bins over [-1, 1]
+    :return: SimilarityHistogram
+    """
+    return SimilarityHistogram(drugs=list(drugs), counts=np.zeros((len(drugs), num_bins), dtype=np.int64))
+
+
+def add_similarities(histogram: SimilarityHistogram, drug_ids: np.ndarray, similarities: np.ndarray):
+    """
+    Count scored candidate pairs in a similarity histogram, in place.
+
+    :param histogram: SimilarityHistogram to add to
+    :param drug_ids: drug id each pair was scored for
+    :param similarities: cosine similarity of each pair
+    """
+    if len(similarities) == 0:
+        return
+    num_bins = histogram.counts.shape[1]
+    flat_bins = np.asarray(drug_ids, dtype=np.int64) * num_bins + similarity_bins(similarities, num_bins)
+    # Only count over the range of bins hit, as chunks usually hold the pairs of a single drug term
+    first_bin = flat_bins.min()
+    bin_counts = np.bincount(flat_bins - first_bin)
+    histogram.counts.reshape(-1)[first_bin:first_bin + len(bin_counts)] += bin_counts
@@ -0,0 +1,209 @@
+"""Cache of tokenized training corpora, stored as memory-mapped token id arrays."""
+
+# -*- coding: utf-8 -*-
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from typing import Iterable, NamedTuple
+
+import numpy as np
+
+TOKEN_IDS_FILE = 'token_ids.npy'
+OFFSETS_FILE = 'offsets.npy'
+CORPUS_META_FILE = 'corpus.json'
+
+
+class TokenizedCorpus(NamedTuple):
+    """
+    Token ids of a corpus of texts, unpadded.
+
+    The ids of all texts are concatenated in one flat array: the ids of text i are token_ids[offsets[i]:offsets[i + 1]].
+    """
+
+    token_ids: np.ndarray
+    offsets: np.ndarray
+    pad_token_id: int
+    padding_side: str = 'right'
+
+    @property
+    def num_texts(self):
+        """Number of texts in the corpus."""
+        return len(self.offsets) - 1
+
+    def sequence(self, index: int):
+        """
+        Get the token ids of one text, without copying them.
+
+        :param index: position of the text in the corpus
+        :return: Array of token ids
+        """
+        return self.token_ids[self.offsets[index]:self.offsets[index + 1]]
+
+    def padded_sequence(self, index: int, max_length: int):
+        """
+        Get the token ids of one text, padded to a fixed length.
+
+        :param index: position of the text in the corpus
+        :param max_length: length to pad to
+        :return: List of token ids, as the tokenizer returns them when padding to max_length
+        """
+        sequence = self.sequence(index).tolist()
+        padding = [self.pad_token_id] * (max_length - len(sequence))
+        return padding + sequence if self.padding_side == 'left' else sequence + padding
+
+    def padded(self, max_length: int):
+        """
+        Get the token ids of all texts, padded to a fixed length.
+
+        :param max_length: length to pad to
+        :return: (n texts x max_length) array of token ids, as regular_encode returns them
+        """
+        return self.padded_batch(np.arange(self.num_texts), max_length)
+
+    def padded_batch(self, indices: np.ndarray, max_length: int):
+        """
+        Get the token ids of some texts, padded to a fixed length. Only the token ids of these texts are read.
+
+        :param indices: positions of the texts in the corpus
+        :param max_length: length to pad to
+        :return: (n indices x max_length) array of token ids
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        starts = np.asarray(self.offsets[indices])
+        lengths = np.asarray(self.offsets[indices + 1]) - starts
+        padded = np.full((len(indices), max_length), self.pad_token_id, dtype=np.int32)
+        # Column of each token in the padded array
+        rows = np.repeat(np.arange(len(indices)), lengths)
+        columns = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        token_ids = self.token_ids[np.repeat(starts, lengths) + columns]
+        if self.padding_side == 'left':
+            columns += np.repeat(max_length - lengths, lengths)
+        padded[rows, columns] = token_ids
+
+        return padded
+
+
+def tokenized_corpus_key(texts: Iterable[str], tokenizer_name: str, max_length: int,
+                         text_pairs: Iterable[str] = None):
+    """
+    Get the cache key of a tokenized corpus.
+
+    :param texts: texts of the corpus
+    :param tokenizer_name: name of the tokenizer the corpus is tokenized with
+    :param max_length: length the token ids are truncated to
+    :param text_pairs: second text of each pair, if the texts are tokenized as pairs
+    :return: Hex digest identifying the tokenized corpus
+    """
+    corpus_hash = hashlib.blake2b(f'{tokenizer_name}\0{max_length}'.encode('utf-8'), digest_size=16)
+    for text in texts:
+        corpus_hash.update(text.encode('utf-8'))
+        corpus_hash.update(b'\0')
+    if text_pairs is not None:
+        corpus_hash.update(b'\1')
+        for text in text_pairs:
+            corpus_hash.update(text.encode('utf-8'))
+            corpus_hash.update(b'\0')
+
+    return corpus_hash.hexdigest()
+
+
+def _tokenizer_name(tokenizer):
+    """
+    Get the name a tokenizer was loaded from, e.g. allenai/biomed_roberta_base.
+
+    :param tokenizer: Huggingface tokenizer
+    :return: Name of the tokenizer
+    """
+    return getattr(tokenizer, 'name_or_path', None) or type(tokenizer).__name__
+
+
+def _tokenize_corpus(texts: list, tokenizer, max_length: int, text_pairs: list = None, batch_size: int = 10000):
+    """
+    Tokenize a corpus of texts, truncating each text to a maximum number of token ids.
+
+    :param texts: texts to tokenize
+    :param tokenizer: Huggingface tokenizer
+    :param max_length: length the token ids are truncated to
+    :param text_pairs: if given, tokenize each text paired with the text at the same position in this list
+    :param batch_size: number of texts tokenized at a time
+    :return: Flat int32 array of token ids and int64 array of the offsets of each text's ids
+    """
+    lengths = []
+    batch_ids = []
+    for start in range(0, len(texts), batch_size):
+        batch = texts[start:start + batch_size]
+        if text_pairs is not None:
+            batch = list(zip(batch, text_pairs[start:start + batch_size]))
+        encoded = tokenizer.batch_encode_plus(batch,
+                                              return_attention_mask=False,
+                                              return_token_type_ids=False,
+                                              max_length=max_length,
+                                              truncation=True)['input_ids']
+        lengths.extend(len(ids) for ids in encoded)
+        batch_ids.append(np.fromiter((token_id for ids in encoded for token_id in ids), dtype=np.int32))
+    offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    token_ids = np.concatenate(batch_ids) if batch_ids else np.zeros(0, dtype=np.int32)
+
+    return token_ids, offsets
+
+
+def load_tokenized_corpus(corpus_dir: str):
+    """
+    Load a cached tokenized corpus as read-only memory maps.
+
+    :param corpus_dir: directory of the cached corpus
+    :return: TokenizedCorpus
+    """
+    with open(os.path.join(corpus_dir, CORPUS_META_FILE)) as f:
+        meta = json.load(f)
+
+    return TokenizedCorpus(token_ids=np.load(os.path.join(corpus_dir, TOKEN_IDS_FILE), mmap_mode='r'),
+                           offsets=np.load(os.path.join(corpus_dir, OFFSETS_FILE), mmap_mode='r'),
+                           pad_token_id=meta['pad_token_id'],
+                           padding_side=meta['padding_side'])
+
+
+def encode_corpus(texts: Iterable[str], tokenizer, max_length: int, cache_dir: str, text_pairs: Iterable[str] = None):
+    """
+    Tokenize a corpus of texts, or load it from the cache if it has been tokenized the same way before.
+
+    Corpora are cached by the name of the tokenizer, the maximum length and a hash of the texts, so a changed
+    data file or train/test split is tokenized again.
+
+    :param texts: texts to tokenize
+    :param tokenizer: Huggingface tokenizer
+    :param max_length: length the token ids are truncated to
+    :param cache_dir: directory of the tokenized corpus cache
+    :param text_pairs: if given, tokenize each text paired with the text at the same position, letting the
+        tokenizer insert the special tokens between them
+    :return: TokenizedCorpus, memory-mapped from the cache
+    """
+    texts = [str(text) for text in texts]
+    if text_pairs is not None:
+        text_pairs = [str(text) for text in text_pairs]
+    tokenizer_name = _tokenizer_name(tokenizer)
+    corpus_dir = os.path.join(cache_dir, tokenized_corpus_key(texts, tokenizer_name, max_length, text_pairs))
+    if os.path.exists(os.path.join(corpus_dir, CORPUS_META_FILE)):
+        return load_tokenized_corpus(corpus_dir)
+
+    token_ids, offsets = _tokenize_corpus(texts, tokenizer, max_length, text_pairs)
+    # Write to a temporary directory first, so that a partly written corpus is never loaded
+    os.makedirs(cache_dir, exist_ok=True)
+    temp_dir = tempfile.mkdtemp(dir=cache_dir)
+    np.save(os.path.join(temp_dir, TOKEN_IDS_FILE), token_ids)
+    np.save(os.path.join(temp_dir, OFFSETS_FILE), offsets)
+    with open(os.path.join(temp_dir, CORPUS_META_FILE), 'w') as f:
+        json.dump({'tokenizer': tokenizer_name, 'max_length': max_length, 'num_texts': len(texts),
+                   'pad_token_id': tokenizer.pad_token_id,
+                   'padding_side': getattr(tokenizer, 'padding_side', 'right')}, f)
+    try:
+        os.rename(temp_dir, corpus_dir)
+    except OSError:
+        # Another process cached the same corpus first
+        shutil.rmtree(temp_dir)
+
+    return load_tokenized_corpus(corpus_dir)
@@ -2,13 +2,40 @@
 
 """Code for Identifying core claims from a paragraph."""
 
-import pip._internal
+import importlib
+import sys
 
-from .extract_claims import *  # noqa:F401,F403
-from .utils import *  # noqa:F401,F403
+# Public names re-exported from the submodules. They are imported on first access, so that importing the package
+# does not load allennlp or PyTorch
+_LAZY_EXPORTS = {
+    '.extract_claims': ['load_claim_extraction_model', 'get_claim_extraction_model', 'warm_up_claim_extraction_model',
+                        'evict_claim_extraction_model', 'predict_claim_labels', 'claim_model_fingerprint',
+                        'open_claim_cache', 'find_claim_sentences', 'merge_claims', 'extract_claims'],
+    '.claim_cache': ['ClaimCache', 'ParagraphClaims'],
+    '.sharded_extraction': ['extract_claims_sharded', 'read_claim_sentences'],
+    '.utils': ['read_json', 'MODEL_PATH', 'WEIGHT_PATH'],
+}
+_EXPORT_MODULES = {name: module for module, names in _LAZY_EXPORTS.items() for name in names}
 
-try:
-    import discourse  # noqa:F401
-except Exception:
-    pip._internal.main(["install", "git+https://github.com/titipata/detecting-scientific-claim.git"])
-    import discourse  # noqa:F401
+__all__ = list(_EXPORT_MODULES)
+
+
+def __getattr__(name):
+    """Import a re-exported name from its submodule on first access."""
+    if name not in _EXPORT_MODULES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    importlib.import_module(_EXPORT_MODULES[name], __name__)
+    # Importing a submodule sets it as an attribute of the package, hiding the extract_claims function behind the
+    # extract_claims submodule, so bind the names of all submodules imported so far
+    for module_name, names in _LAZY_EXPORTS.items():
+        module = sys.modules.get(__name__ + module_name)
+        if module is not None:
+            for export in names:
+                globals()[export] = getattr(module, export)
+
+    return globals()[name]
+
+
+def __dir__():
+    """List the module attributes, including the re-exported names not imported yet."""
+    return sorted(set(globals()) | set(__all__))
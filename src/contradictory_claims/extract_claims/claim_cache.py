@@ -0,0 +1,109 @@
+"""Persistent cache of claim extraction results by paragraph, so that unchanged paragraphs are not run again."""
+
+# -*- coding: utf-8 -*-
+
+import hashlib
+import sqlite3
+from typing import Dict, Iterable, List, NamedTuple
+
+import numpy as np
+
+# Number of paragraphs looked up per query, below the sqlite limit on query parameters
+QUERY_SIZE = 500
+
+
+class ParagraphClaims(NamedTuple):
+    """Claim extraction result of one paragraph: its sentences, which of them are claims and how likely."""
+
+    spans: np.ndarray
+    labels: np.ndarray
+    probabilities: np.ndarray
+
+
+def file_fingerprint(paths: Iterable[str], block_size: int = 1 << 20):
+    """
+    Hash the contents of files, e.g. the archive and weights of a model.
+
+    :param paths: paths of the files
+    :param block_size: number of bytes read at a time
+    :return: Hex digest of the contents of the files, in order
+    """
+    files_hash = hashlib.blake2b(digest_size=16)
+    for path in paths:
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(block_size), b''):
+                files_hash.update(block)
+        files_hash.update(b'\0')
+
+    return files_hash.hexdigest()
+
+
+class ClaimCache(NamedTuple):
+    """
+    Claim extraction results stored in a sqlite database, by paragraph hash and the fingerprint of the model.
+
+    Only the path is kept, so the cache can be passed to worker processes; each read or write opens its own
+    connection.
+    """
+
+    path: str
+    fingerprint: str
+
+    def _connect(self):
+        """
+        Open a connection to the cache database, creating its table if needed.
+
+        :return: sqlite connection
+        """
+        connection = sqlite3.connect(self.path, timeout=60)
+        # Let worker processes read while another one writes
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('CREATE TABLE IF NOT EXISTS paragraph_claims ('
+                           'fingerprint TEXT, paragraph BLOB, spans BLOB, labels BLOB, probabilities BLOB, '
+                           'PRIMARY KEY (fingerprint, paragraph)) WITHOUT ROWID')
+
+        return connection
+
+    def read(self, keys: List[bytes]):
+        """
+        Look up the cached claim extraction results of paragraphs.
+
+        :param keys: paragraph keys, as sentence_tokenizer.text_key returns them
+        :return: Dictionary mapping the keys found in the cache to their ParagraphClaims
+        """
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        connection = self._connect()
+        try:
+            for start in range(0, len(keys), QUERY_SIZE):
+                batch = keys[start:start + QUERY_SIZE]
+                rows = connection.execute('SELECT paragraph, spans, labels, probabilities FROM paragraph_claims '
+                                          f'WHERE fingerprint = ? AND paragraph IN ({",".join("?" * len(batch))})',
+                                          [self.fingerprint] + batch)
+                for key, spans, labels, probabilities in rows:
+                    found[key] = ParagraphClaims(spans=np.frombuffer(spans, dtype=np.int64).reshape(-1, 2),
+                                                 labels=np.frombuffer(labels, dtype=np.int8),
+                                                 probabilities=np.frombuffer(probabilities, dtype=np.float32))
+        finally:
+            connection.close()
+
+        return found
+
+    def write(self, paragraph_claims: Dict[bytes, ParagraphClaims]):
+        """
+        Store the claim extraction results of paragraphs.
+
+        :param paragraph_claims: dictionary mapping paragraph keys to their ParagraphClaims
+        """
+        connection = self._connect()
+        try:
+            with connection:
+                connection.executemany(
+                    'INSERT OR REPLACE INTO paragraph_claims VALUES (?, ?, ?, ?, ?)',
+                    ((self.fingerprint, key,
+                      np.ascontiguousarray(claims.spans, dtype=np.int64).tobytes(),
+                      np.ascontiguousarray(claims.labels, dtype=np.int8).tobytes(),
+                      np.ascontiguousarray(claims.probabilities, dtype=np.float32).tobytes())
+                     for key, claims in paragraph_claims.items()))
+        finally:
+            connection.close()
@@ -1,14 +1,13 @@
 """Function to extract Claims."""
 
+from typing import Iterable
 
 try:
     import discourse  # noqa:F401
-except Exception:
-    import pip
-    pip._internal.main(["install", "git+https://github.com/titipata/detecting-scientific-claim.git"])
-    import discourse  # noqa:F401
+except ImportError as e:
+    raise ImportError('Claim extraction needs the discourse package, install it with: '
+                      'pip install git+https://github.com/titipata/detecting-scientific-claim.git') from e
 
-import nltk
 import numpy as np
 import pandas as pd
 import torch
@@ -18,13 +17,17 @@ from allennlp.modules import ConditionalRandomField, TimeDistributed
 from allennlp.predictors import Predictor
 from discourse.dataset_readers import CrfPubmedRCTReader
 from discourse.models import DiscourseCrfClassifier  # noqa:F401
-from nltk import sent_tokenize
 from torch.nn import Linear
 
+from .claim_cache import ClaimCache, ParagraphClaims, file_fingerprint
 from .predictors import ClaimCrfPredictor
-from .utils import MODEL_PATH, WEIGHT_PATH
+from .utils import MODEL_PATH, WEIGHT_PATH, length_sorted_batches, pad_crf_outputs
+from ..data.sentence_tokenizer import sentence_spans, text_key
 
-nltk.download('punkt')
+# Claim extraction models loaded in this process, with their predictors, keyed by (model path, weight path)
+_claim_models = {}
+# Fingerprints of the model files, keyed by (model path, weight path)
+_model_fingerprints = {}
 
 
 def load_claim_extraction_model(model_path: str = MODEL_PATH, weight_path: str = WEIGHT_PATH):
@@ -52,10 +55,114 @@ def load_claim_extraction_model(model_path: str = MODEL_PATH, weight_path: str =
     return model
 
 
+def get_claim_extraction_model(model_path: str = MODEL_PATH, weight_path: str = WEIGHT_PATH):
+    """
+    Get a claim extraction model and its predictor, loading them on the first call in this process.
+
+    The weights are frozen and moved to shared memory, so worker processes forked after the model is loaded, or
+    sent the model through torch.multiprocessing, use the same weights instead of each loading a copy.
+
+    :param model_path: location of model, can be downloaded offline or link can be given
+    :param weight_path: location of model weight, can be downloaded offline or link can be given
+    :return: Model and ClaimCrfPredictor wrapping it
+    """
+    key = (model_path, weight_path)
+    if key not in _claim_models:
+        model = load_claim_extraction_model(model_path, weight_path)
+        model.eval()
+        model.share_memory()
+        _claim_models[key] = (model, ClaimCrfPredictor(model, dataset_reader=CrfPubmedRCTReader()))
+
+    return _claim_models[key]
+
+
+def warm_up_claim_extraction_model(model_path: str = MODEL_PATH, weight_path: str = WEIGHT_PATH):
+    """
+    Load a claim extraction model and run it once, so that the first paragraphs extracted do not pay for it.
+
+    :param model_path: location of model, can be downloaded offline or link can be given
+    :param weight_path: location of model weight, can be downloaded offline or link can be given
+    :return: Model and ClaimCrfPredictor wrapping it
+    """
+    model, claim_predictor = get_claim_extraction_model(model_path, weight_path)
+    predict_claim_labels([['Remdesivir shortened the time to recovery.']], model, claim_predictor)
+
+    return model, claim_predictor
+
+
+def evict_claim_extraction_model(model_path: str = None, weight_path: str = None):
+    """
+    Release claim extraction models loaded by get_claim_extraction_model.
+
+    :param model_path: location of the model to release. If None, all loaded models are released
+    :param weight_path: location of the model weight to release. If None, all loaded models are released
+    """
+    if model_path is None or weight_path is None:
+        _claim_models.clear()
+    else:
+        _claim_models.pop((model_path, weight_path), None)
+
+
+def predict_claim_labels(sentences: list, model, claim_predictor: ClaimCrfPredictor, batch_size: int = 32):
+    """
+    Predict which sentences of many documents are claims, in batches of documents with similar numbers of sentences.
+
+    :param sentences: list of lists of sentences, one per document
+    :param model: claim extraction model, as loaded by load_claim_extraction_model
+    :param claim_predictor: predictor wrapping the model
+    :param batch_size: number of documents per batch
+    :return: Lists with, per document, the int8 labels (1 for claims) of the best CRF path and the float32
+        probability of each sentence being a claim, from the softmax of its logits
+    """
+    labels = [np.zeros(0, dtype=np.int8) for _ in sentences]
+    probabilities = [np.zeros(0, dtype=np.float32) for _ in sentences]
+    for batch in length_sorted_batches([len(document) for document in sentences], batch_size):
+        outputs = claim_predictor.predict_batch_json([{'sentences': sentences[i]} for i in batch])
+        logits, mask = pad_crf_outputs(outputs)
+        # One Viterbi decode for the whole batch; the paths are trimmed to each document's mask
+        best_paths = model.crf.viterbi_tags(torch.from_numpy(logits), torch.from_numpy(mask))
+        exp_logits = np.exp(logits - logits.max(axis=2, keepdims=True))
+        claim_probabilities = exp_logits[:, :, 1] / exp_logits.sum(axis=2)
+        for row, i, (path, _) in zip(range(len(batch)), batch, best_paths):
+            labels[i] = np.array(path, dtype=np.int8)
+            probabilities[i] = claim_probabilities[row, :len(path)]
+
+    return labels, probabilities
+
+
+def claim_model_fingerprint(model_path: str = MODEL_PATH, weight_path: str = WEIGHT_PATH):
+    """
+    Get the fingerprint of a claim extraction model, from the contents of its archive and weight files.
+
+    :param model_path: location of model, can be downloaded offline or link can be given
+    :param weight_path: location of model weight, can be downloaded offline or link can be given
+    :return: Hex digest identifying the model
+    """
+    key = (model_path, weight_path)
+    if key not in _model_fingerprints:
+        _model_fingerprints[key] = file_fingerprint([cached_path(model_path), cached_path(weight_path)])
+
+    return _model_fingerprints[key]
+
+
+def open_claim_cache(cache_path: str, model_path: str = MODEL_PATH, weight_path: str = WEIGHT_PATH):
+    """
+    Open the cache of claim extraction results of a model.
+
+    :param cache_path: path of the sqlite cache database
+    :param model_path: location of model, can be downloaded offline or link can be given
+    :param weight_path: location of model weight, can be downloaded offline or link can be given
+    :return: ClaimCache holding the results of the model
+    """
+    return ClaimCache(path=cache_path, fingerprint=claim_model_fingerprint(model_path, weight_path))
+
+
 def extract_claims(data: pd.DataFrame(),
                    model_path: str = MODEL_PATH,
                    weight_path: str = WEIGHT_PATH,
-                   col_name: str = "sentence"):
+                   col_name: str = "sentence",
+                   batch_size: int = 32,
+                   cache_path: str = None):
     """
     Extract Claims from given columns in a dataset to extract the claim.
 
@@ -63,36 +170,97 @@ def extract_claims(data: pd.DataFrame(),
     :param model_path: location of model, can be downloaded offline or link can be given
     :param weight_path: location of model weight, can be downloaded offline or link can be given
     :param col_name: name of column on which claim is to be identified, should not be "sentences
+    :param batch_size: number of paragraphs the model predicts at a time
+    :param cache_path: if given, path of a sqlite database caching the claims of each paragraph, so that
+        paragraphs extracted before (e.g. from a previous CORD-19 release) are not run through the model again
     :return: labels, if a sentence is a claim or not
     """
-    model = load_claim_extraction_model(model_path, weight_path)
-    # print("MODEL LOADED!!!")  # noqa: T001
-    reader = CrfPubmedRCTReader()
-    claim_predictor = ClaimCrfPredictor(model, dataset_reader=reader)
-
     df = data
     if col_name not in df.columns:
         return None
-    df_sentence = df.copy()
+    model, claim_predictor = get_claim_extraction_model(model_path, weight_path)
+    claim_cache = None if cache_path is None else open_claim_cache(cache_path, model_path, weight_path)
+    claim_sentences = find_claim_sentences(df[col_name], model, claim_predictor, batch_size, claim_cache)
+
+    return merge_claims(df, claim_sentences)
 
-    # NOTE(alpha_darklord): The function returns a list of labels, whether a particular
+
+def find_claim_sentences(texts: Iterable[str], model, claim_predictor: ClaimCrfPredictor, batch_size: int = 32,
+                         claim_cache: ClaimCache = None):
+    """
+    Split paragraphs into sentences and find the sentences that are claims.
+
+    Each distinct paragraph is run through the model once. With a cache, paragraphs found in it are not run at all.
+
+    :param texts: paragraphs to extract claims from
+    :param model: claim extraction model, as loaded by load_claim_extraction_model
+    :param claim_predictor: predictor wrapping the model
+    :param batch_size: number of paragraphs the model predicts at a time
+    :param claim_cache: if given, look up the paragraphs in this cache first and add the others to it
+    :return: Dataframe with a row per claim sentence, in paragraph and sentence order: the position of its
+        paragraph in texts ("row") and the sentence ("claims")
+    """
+    texts = list(texts)
+    keys = [text_key(text) for text in texts]
+    found = {} if claim_cache is None else claim_cache.read(keys)
+    missing = {}
+    for key, text in zip(keys, texts):
+        if key not in found and key not in missing:
+            missing[key] = text
+
+    # NOTE(alpha_darklord): The model predicts a list of labels, whether a particular
     # sentence is a claim or not (0 or 1), best_paths is used to get this label,
-    # later we extract sentences which have 1 label and transfer them into a list contained in column "claims"
-    df_sentence["sentences"] = df_sentence[col_name]
-    df_sentence["sentences"] = df_sentence.sentences.apply(sent_tokenize)
-    df_sentence['pred'] = df_sentence.sentences.apply(lambda x: claim_predictor.predict_json({'sentences': x}))
-    df_sentence['best_paths'] = df_sentence.pred.apply(
-        lambda x:
-        model.crf.viterbi_tags(torch.FloatTensor(x['logits']).unsqueeze(0),
-                               torch.LongTensor(x['mask']).unsqueeze(0)))
-    df_sentence['p_claims'] = df_sentence['best_paths'].apply(lambda x: 100 * np.array(x[0][0]))
-    df_sentence['claims'] = df_sentence.apply(lambda x: np.extract(x['p_claims'], x['sentences']), axis=1)
-    df_claims = df_sentence[~ (df_sentence.claims.str.len() == 0)]
-    del df_sentence
-    # NOTE(alpha_darklord): This converts a list present inside a column to different rows
-    # containing individual items
-    df_updated = df_claims[[col_name, "claims"]].explode("claims")
-    df_updated["claim_flag"] = 1
-    df_merged = df.merge(df_updated, on=[col_name], how="left")
-    df_merged["claim_flag"].fillna(0, inplace=True)
+    # later we extract sentences which have 1 label
+    missing_texts = list(missing.values())
+    spans = sentence_spans(missing_texts)
+    sentences = [[text[start:end] for start, end in text_spans.tolist()]
+                 for text, text_spans in zip(missing_texts, spans)]
+    labels, probabilities = predict_claim_labels(sentences, model, claim_predictor, batch_size)
+    extracted = {key: ParagraphClaims(spans=text_spans, labels=text_labels, probabilities=text_probabilities)
+                 for key, text_spans, text_labels, text_probabilities in zip(missing, spans, labels, probabilities)}
+    if claim_cache is not None and extracted:
+        claim_cache.write(extracted)
+    found.update(extracted)
+
+    rows, claims = [], []
+    for row, (key, text) in enumerate(zip(keys, texts)):
+        paragraph_claims = found[key]
+        for (start, end), label in zip(paragraph_claims.spans.tolist(), paragraph_claims.labels.tolist()):
+            if label:
+                rows.append(row)
+                claims.append(text[start:end])
+
+    return pd.DataFrame({'row': np.array(rows, dtype=np.int64), 'claims': np.array(claims, dtype=object)})
+
+
+def merge_claims(df: pd.DataFrame, claim_sentences: pd.DataFrame):
+    """
+    Add the claims found in the paragraphs of a dataframe to it, one row per claim.
+
+    Claims are tied to the row they were extracted from by its position, so rows with the same paragraph text
+    each get only their own claims.
+
+    :param df: dataframe the claims were extracted from
+    :param claim_sentences: claim sentences found by find_claim_sentences, with rows indexing df
+    :return: df with each row repeated for each of its claims, in row order, with a "claims" column and a
+        "claim_flag" of 1 for the rows with a claim (0 and no claim otherwise)
+    """
+    # NOTE(alpha_darklord): Each claim becomes a row with the paragraph it was extracted from
+    order = np.argsort(claim_sentences.row.to_numpy(), kind='stable')
+    claim_rows = claim_sentences.row.to_numpy()[order]
+    num_claims = np.bincount(claim_rows, minlength=len(df))
+    # Rows without claims are kept once
+    num_rows = np.maximum(num_claims, 1)
+    row_starts = np.cumsum(num_rows) - num_rows
+    # Each claim goes to the start of its row's block plus its rank among the claims of the row
+    claim_starts = np.cumsum(num_claims) - num_claims
+    claim_positions = row_starts[claim_rows] + np.arange(len(claim_rows)) - claim_starts[claim_rows]
+
+    df_merged = df.iloc[np.repeat(np.arange(len(df)), num_rows)].reset_index(drop=True)
+    claims = np.full(len(df_merged), np.nan, dtype=object)
+    claims[claim_positions] = claim_sentences.claims.to_numpy(dtype=object)[order]
+    claim_flag = np.zeros(len(df_merged))
+    claim_flag[claim_positions] = 1
+    df_merged["claims"] = claims
+    df_merged["claim_flag"] = claim_flag
     return df_merged
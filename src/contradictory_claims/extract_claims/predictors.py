@@ -1,12 +1,23 @@
 """This file contains the predictoer required for predicting, whether it is a claim or not."""
 
 
-import en_core_web_sm
 from allennlp.common.util import JsonDict
 from allennlp.data import Instance
 from allennlp.predictors import Predictor
 
-nlp = en_core_web_sm.load()
+_nlp = None
+
+
+def __getattr__(name):
+    """Load the english spacy model as the module attribute nlp on first access."""
+    global _nlp
+    if name != 'nlp':
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    if _nlp is None:
+        import en_core_web_sm
+        _nlp = en_core_web_sm.load()
+
+    return _nlp
 
 
 class ClaimCrfPredictor(Predictor):
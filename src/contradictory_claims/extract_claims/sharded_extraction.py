@@ -0,0 +1,197 @@
+"""Claim extraction split into shards across worker processes, resumable from the shards already written."""
+
+# -*- coding: utf-8 -*-
+
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Iterable, List
+
+import numpy as np
+import pandas as pd
+import torch
+
+from .claim_cache import ClaimCache
+from .extract_claims import find_claim_sentences, get_claim_extraction_model, merge_claims, open_claim_cache
+from .utils import MODEL_PATH, WEIGHT_PATH
+
+MANIFEST_FILE = 'manifest.json'
+PART_FILE = 'part-{:05d}.parquet'
+
+# Model path and weight path of the claim extraction model used by this worker process
+_worker_model_key = None
+
+
+def _shard_key(texts: list, shard_size: int, model_path: str, weight_path: str):
+    """
+    Get the key of a sharded extraction run, so that shards are only reused for the same input and model.
+
+    :param texts: paragraphs to extract claims from
+    :param shard_size: number of paragraphs per shard
+    :param model_path: location of model
+    :param weight_path: location of model weight
+    :return: Hex digest identifying the run
+    """
+    run_hash = hashlib.blake2b(f'{model_path}\0{weight_path}\0{shard_size}'.encode('utf-8'), digest_size=16)
+    for text in texts:
+        run_hash.update(str(text).encode('utf-8'))
+        run_hash.update(b'\0')
+
+    return run_hash.hexdigest()
+
+
+def read_manifest(out_dir: str):
+    """
+    Read the manifest of a sharded extraction run.
+
+    :param out_dir: directory of the run
+    :return: Dictionary with the run key, number of shards and the finished shards, or None if there is no run
+    """
+    manifest_path = os.path.join(out_dir, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path) as f:
+        return json.load(f)
+
+
+def _write_manifest(out_dir: str, manifest: dict):
+    """
+    Write the manifest of a sharded extraction run, replacing the previous one in a single step.
+
+    :param out_dir: directory of the run
+    :param manifest: dictionary with the run key, number of shards and the finished shards
+    """
+    manifest_path = os.path.join(out_dir, MANIFEST_FILE)
+    with open(manifest_path + '.tmp', 'w') as f:
+        json.dump(manifest, f)
+    os.replace(manifest_path + '.tmp', manifest_path)
+
+
+def _init_extraction_worker(model_path: str, weight_path: str, num_threads: int = None):
+    """
+    Load the claim extraction model in a worker process.
+
+    :param model_path: location of model
+    :param weight_path: location of model weight
+    :param num_threads: if given, number of threads torch uses within the worker for each operation
+    """
+    global _worker_model_key
+    if num_threads is not None:
+        torch.set_num_threads(num_threads)
+    _worker_model_key = (model_path, weight_path)
+    get_claim_extraction_model(model_path, weight_path)
+
+
+def _extract_shard(out_dir: str, shard: int, texts: List[str], row_start: int, batch_size: int,
+                   claim_cache: ClaimCache = None):
+    """
+    Find the claim sentences of one shard of paragraphs and write them to the shard's part file.
+
+    :param out_dir: directory of the run
+    :param shard: shard number
+    :param texts: paragraphs of the shard
+    :param row_start: position of the shard's first paragraph in the input
+    :param batch_size: number of paragraphs the model predicts at a time
+    :param claim_cache: if given, cache of the claims of each paragraph
+    :return: The shard number
+    """
+    model, claim_predictor = get_claim_extraction_model(*_worker_model_key)
+    claim_sentences = find_claim_sentences(texts, model, claim_predictor, batch_size, claim_cache)
+    claim_sentences['row'] += row_start
+    # Write to a temporary file first, so that a partly written part file is never read
+    part_path = os.path.join(out_dir, PART_FILE.format(shard))
+    claim_sentences.to_parquet(part_path + '.tmp')
+    os.replace(part_path + '.tmp', part_path)
+
+    return shard
+
+
+def read_claim_sentences(out_dir: str):
+    """
+    Read the claim sentences of all shards of a finished sharded extraction run.
+
+    :param out_dir: directory of the run
+    :return: Dataframe of claim sentences, as find_claim_sentences returns them for the whole input
+    """
+    manifest = read_manifest(out_dir)
+    if manifest is None or len(manifest['finished']) < manifest['num_shards']:
+        raise ValueError(f'{out_dir} does not hold a finished sharded claim extraction run')
+    if manifest['num_shards'] == 0:
+        return pd.DataFrame({'row': np.zeros(0, dtype=np.int64), 'claims': np.zeros(0, dtype=object)})
+    parts = [pd.read_parquet(os.path.join(out_dir, PART_FILE.format(shard)))
+             for shard in range(manifest['num_shards'])]
+
+    return pd.concat(parts, ignore_index=True)
+
+
+def extract_claims_sharded(data: pd.DataFrame, out_dir: str,
+                           model_path: str = MODEL_PATH,
+                           weight_path: str = WEIGHT_PATH,
+                           col_name: str = "sentence",
+                           shard_size: int = 10000,
+                           num_workers: int = None,
+                           num_threads: int = None,
+                           batch_size: int = 32,
+                           cache_path: str = None):
+    """
+    Extract claims like extract_claims, writing the claims of each shard of paragraphs to a part file as it finishes.
+
+    A run that is interrupted is resumed by calling this again with the same arguments: only the shards not
+    listed as finished in the manifest are extracted. The merged result is the same as extract_claims returns.
+
+    :param data: dataframe with the paragraphs to extract claims from
+    :param out_dir: directory of the part files and the manifest of the run
+    :param model_path: location of model, can be downloaded offline or link can be given
+    :param weight_path: location of model weight, can be downloaded offline or link can be given
+    :param col_name: name of column on which claim is to be identified, should not be "sentences"
+    :param shard_size: number of paragraphs per shard
+    :param num_workers: if given, extract the shards across this many processes, each loading the model once
+    :param num_threads: if given, number of threads torch uses within each worker for each operation. Set it so
+        that num_workers * num_threads does not exceed the number of cores. Without workers, it applies while
+        the shards are extracted in this process
+    :param batch_size: number of paragraphs the model predicts at a time
+    :param cache_path: if given, path of a sqlite database caching the claims of each paragraph, shared by the
+        workers
+    :return: data merged with its claims, as extract_claims returns it
+    """
+    if col_name not in data.columns:
+        return None
+    texts = data[col_name].tolist()
+    num_shards = (len(texts) + shard_size - 1) // shard_size
+    run_key = _shard_key(texts, shard_size, model_path, weight_path)
+
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = read_manifest(out_dir)
+    if manifest is None or manifest['key'] != run_key:
+        # Shards of a run over other paragraphs or with another model cannot be reused
+        manifest = {'key': run_key, 'num_shards': num_shards, 'shard_size': shard_size, 'finished': []}
+        _write_manifest(out_dir, manifest)
+    finished = set(manifest['finished'])
+    claim_cache = None if cache_path is None else open_claim_cache(cache_path, model_path, weight_path)
+    tasks = [(out_dir, shard, texts[shard * shard_size:(shard + 1) * shard_size], shard * shard_size, batch_size,
+              claim_cache)
+             for shard in range(num_shards) if shard not in finished]
+
+    def mark_finished(shards: Iterable[int]):
+        # Record each shard as finished once its part file is written
+        for shard in shards:
+            finished.add(shard)
+            manifest['finished'] = sorted(finished)
+            _write_manifest(out_dir, manifest)
+
+    if num_workers is not None and len(tasks) > 1:
+        with ProcessPoolExecutor(num_workers, initializer=_init_extraction_worker,
+                                 initargs=(model_path, weight_path, num_threads)) as executor:
+            mark_finished(future.result() for future in as_completed(executor.submit(_extract_shard, *task)
+                                                                     for task in tasks))
+    elif tasks:
+        # Restore the thread count of the calling process once its shards are extracted
+        caller_num_threads = torch.get_num_threads()
+        try:
+            _init_extraction_worker(model_path, weight_path, num_threads)
+            mark_finished(_extract_shard(*task) for task in tasks)
+        finally:
+            torch.set_num_threads(caller_num_threads)
+
+    return merge_claims(data, read_claim_sentences(out_dir))
@@ -2,6 +2,9 @@
 
 import json
 import os
+from typing import List, Sequence
+
+import numpy as np
 
 MODEL_PATH = r"https://storage.googleapis.com/contradictory_claims_model_weights/model_crf.tar.gz"
 WEIGHT_PATH = r"https://storage.googleapis.com/contradictory_claims_model_weights/model_crf_tf.th"
@@ -15,3 +18,36 @@ def read_json(file_path):
         with open(file_path, 'r') as fp:
             ls = [json.loads(line) for line in fp]
         return ls
+
+
+def length_sorted_batches(lengths: Sequence[int], batch_size: int):
+    """
+    Group documents into batches of similar length, so that little padding is needed within a batch.
+
+    :param lengths: number of sentences in each document
+    :param batch_size: maximum number of documents per batch
+    :return: List of arrays with the positions of the documents in each batch. Empty documents are left out
+    """
+    lengths = np.asarray(lengths, dtype=np.int64)
+    order = np.argsort(lengths, kind='stable')
+    order = order[lengths[order] > 0]
+    return [order[start:start + batch_size] for start in range(0, len(order), batch_size)]
+
+
+def pad_crf_outputs(outputs: List[dict]):
+    """
+    Pad the per-document logits and masks predicted for a batch of documents into single arrays.
+
+    :param outputs: predictor outputs with the 'logits' (n sentences x n classes) and 'mask' of each document
+    :return: (n documents x max sentences x n classes) float32 array of logits and (n documents x max sentences)
+        int64 array of masks, both padded with zeros
+    """
+    logits = [np.asarray(output['logits'], dtype=np.float32) for output in outputs]
+    max_length = max(len(document_logits) for document_logits in logits)
+    padded_logits = np.zeros((len(logits), max_length, logits[0].shape[1]), dtype=np.float32)
+    mask = np.zeros((len(logits), max_length), dtype=np.int64)
+    for i, (document_logits, output) in enumerate(zip(logits, outputs)):
+        padded_logits[i, :len(document_logits)] = document_logits
+        mask[i, :len(document_logits)] = output['mask']
+
+    return padded_logits, mask
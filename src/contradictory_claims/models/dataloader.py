@@ -1,27 +1,60 @@
 """DataLoader and Dataclasses classes required for required for SBERT."""
 
 
-from collections import Counter
+import itertools
+from typing import Callable, Iterator
 
+import numpy as np
 import torch
-from torch.utils.data import Dataset
+from torch.utils.data import Dataset, IterableDataset, get_worker_info
+
+from ..data.label_space import NLI_LABELS, SBERT_LABELS
+from ..data.make_dataset import SentencePairBatch, shuffle_examples
+from ..data.tokenized_corpus import encode_corpus
+
+
+def _tokenize_sentence(tokenizer, text: str, max_length: int = 512):
+    """Return the tokens generated from processing the sentence, padded to max_length.
+
+    :param tokenizer: The tokenizer used in the model
+    :param text: text for which token to be calculated
+    :param max_length: length the tokens are truncated and padded to
+    :return: tokens generated from the text
+    :rtype: list
+    """
+    return tokenizer.encode_plus(text,
+                                 max_length=max_length,
+                                 pad_to_max_length=True,
+                                 truncation=True)["input_ids"]
 
 
 class ClassifierDataset(Dataset):
     """The Dataset Class used for classification task using SBERT model."""
 
-    def __init__(self, dataframe, tokenizer):
+    def __init__(self, sentence_pairs: SentencePairBatch, tokenizer, token_cache_dir: str = None,
+                 max_length: int = 512):
         """Initialize Classifier Dataset.
 
-        :param dataframe: The dataframe containing the NLI data
-        :type dataframe: Pandas DataFrame
+        :param sentence_pairs: The NLI sentence pairs and labels
+        :type sentence_pairs: SentencePairBatch
         :param tokenizer: The tokenizer used in the model
         :type tokenizer: Huggingface tokenizers
+        :param token_cache_dir: if given, tokenize all sentences up front through the tokenized corpus cache in this
+            directory, instead of tokenizing each sentence whenever it is loaded
+        :type token_cache_dir: str, optional
+        :param max_length: length the tokens are truncated and padded to
+        :type max_length: int, optional
         """
-        self.sentence1 = dataframe.sentence1.values
-        self.sentence2 = dataframe.sentence2.values
-        self.label = dataframe.label.values
+        self.sentence1 = sentence_pairs.premises
+        self.sentence2 = sentence_pairs.hypotheses
+        self.label = NLI_LABELS.to(sentence_pairs.labels, SBERT_LABELS)
         self.tokenizer = tokenizer
+        self.max_length = max_length
+        self.sentence1_tokens = None
+        self.sentence2_tokens = None
+        if token_cache_dir is not None:
+            self.sentence1_tokens = encode_corpus(self.sentence1, tokenizer, max_length, token_cache_dir)
+            self.sentence2_tokens = encode_corpus(self.sentence2, tokenizer, max_length, token_cache_dir)
 
     def __getitem__(self, index):
         """Get item method.
@@ -30,6 +63,9 @@ class ClassifierDataset(Dataset):
         :type index: int
         :return: sentence1,sentence2,label
         """
+        if self.sentence1_tokens is not None:
+            return (self.sentence1_tokens.padded_sequence(index, self.max_length),
+                    self.sentence2_tokens.padded_sequence(index, self.max_length), self.label[index])
         return (self.tokenized(self.sentence1[index])), (self.tokenized(self.sentence2[index])), self.label[index]
 
     def tokenized(self, text):
@@ -40,10 +76,7 @@ class ClassifierDataset(Dataset):
         :return: tokens generated from the text
         :rtype: list
         """
-        return self.tokenizer.encode_plus(text,
-                                          max_length=512,
-                                          pad_to_max_length=True,
-                                          truncation=True)["input_ids"]
+        return _tokenize_sentence(self.tokenizer, text, self.max_length)
 
     def class_weights(self):
         """Return the class weights to tackle skewness in data while training.
@@ -51,10 +84,8 @@ class ClassifierDataset(Dataset):
         :return: torch tensor of weights
         :rtype: torch.tensor
         """
-        target_list = self.label
-        count_dict = Counter(target_list)
-        class_count = [count_dict[i] for i in range(3)]
-        class_weights = len(target_list) / torch.tensor(class_count, dtype=torch.float)
+        class_count = np.bincount(self.label, minlength=SBERT_LABELS.num_classes)
+        class_weights = len(self.label) / torch.tensor(class_count, dtype=torch.float)
         class_weights = class_weights / class_weights.sum()
         print(class_weights)  # noqa: T001
         return class_weights
@@ -62,7 +93,7 @@ class ClassifierDataset(Dataset):
     @staticmethod
     def get_labels():
         """Get class label dictionary."""
-        return {"contradiction": 0, "neutral": 1, "entailment": 2}
+        return {name: class_id for class_id, name in enumerate(SBERT_LABELS.names)}
 
     @staticmethod
     def get_mappings():
@@ -75,6 +106,48 @@ class ClassifierDataset(Dataset):
         return len(self.label)
 
 
+class NLIIterableDataset(IterableDataset):
+    """Dataset streaming NLI sentence pairs for the SBERT model, without loading the whole corpus."""
+
+    def __init__(self, examples_fn: Callable[[], Iterator], tokenizer, max_length: int = 512,
+                 shuffle_buffer_size: int = 10000, seed: int = None):
+        """Initialize NLI Iterable Dataset.
+
+        :param examples_fn: function returning an iterator of (sentence1, sentence2, label) tuples, e.g.
+            functools.partial(iter_multi_nli, train_path)
+        :type examples_fn: Callable
+        :param tokenizer: The tokenizer used in the model
+        :type tokenizer: Huggingface tokenizers
+        :param max_length: length the tokens are truncated and padded to
+        :type max_length: int, optional
+        :param shuffle_buffer_size: number of examples in the shuffle buffer. If 0, the examples are not shuffled
+        :type shuffle_buffer_size: int, optional
+        :param seed: random seed of the shuffle
+        :type seed: int, optional
+        """
+        self.examples_fn = examples_fn
+        self.tokenizer = tokenizer
+        self.max_length = max_length
+        self.shuffle_buffer_size = shuffle_buffer_size
+        self.seed = seed
+
+    def __iter__(self):
+        """Iterate over the sentence pairs, each dataloader worker reading its share of them.
+
+        :return: iterator of sentence1,sentence2,label as ClassifierDataset returns them
+        """
+        examples = self.examples_fn()
+        worker_info = get_worker_info()
+        if worker_info is not None and worker_info.num_workers > 1:
+            examples = itertools.islice(examples, worker_info.id, None, worker_info.num_workers)
+        if self.shuffle_buffer_size:
+            examples = shuffle_examples(examples, self.shuffle_buffer_size, self.seed)
+        for sentence1, sentence2, label in examples:
+            yield (_tokenize_sentence(self.tokenizer, str(sentence1), self.max_length),
+                   _tokenize_sentence(self.tokenizer, str(sentence2), self.max_length),
+                   NLI_LABELS.to(label, SBERT_LABELS))
+
+
 def multi_acc(y_pred: torch.tensor, y_test: torch.tensor):
     """Calculate the accuracy of the output from the SBERT model.
 
@@ -102,5 +175,5 @@ def collate_fn(batch):
     sentence1 = [item[0] for item in batch]
     sentence2 = [item[1] for item in batch]
     label = [item[2] for item in batch]
-    label = torch.tensor(label)
+    label = torch.tensor(label, dtype=torch.long)
     return sentence1, sentence2, label
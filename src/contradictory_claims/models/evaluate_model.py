@@ -9,12 +9,15 @@ import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 import torch
-from contradictory_claims.models.dataloader import ClassifierDataset
-from contradictory_claims.models.train_model import regular_encode
 from sklearn.metrics import accuracy_score, auc, confusion_matrix, f1_score, precision_score, recall_score, roc_curve
 from sklearn.preprocessing import label_binarize
 from transformers import AutoTokenizer
 
+from .dataloader import ClassifierDataset
+from .train_model import encode_sentence_pairs
+from ..data.label_space import NLI_LABELS
+from ..data.make_dataset import SentencePairBatch
+
 
 def read_data_from_excel(data_path: str, active_sheet: str, drop_na: bool = True):
     """
@@ -47,22 +50,19 @@ def make_predictions(df: pd.DataFrame, model, model_name: str, max_len: int = 51
     :param method: "multiclass" or "binary"--describes setting for prediction outputs
     :return: Pandas DataFrame augmented with predictions made using trained model
     """
-    # First insert the CLS and SEP tokens
-    inputs = []
-    for i in range(len(df)):
-        # NOTE: this expects columns named "text1" and "text2" for the two claims
-        inputs.append(str('[CLS]' + df.loc[i, 'text1'] + '[SEP]' + df.loc[i, 'text2']))
+    # NOTE: this expects columns named "text1" and "text2" for the two claims
+    sentence_pairs = SentencePairBatch.from_frame(df, 'text1', 'text2')
 
     # Then make predictions
     tokenizer = AutoTokenizer.from_pretrained(model_name)
-    encoded_inputs = regular_encode(inputs, tokenizer, maxlen=max_len)
+    encoded_inputs = encode_sentence_pairs(sentence_pairs, tokenizer, maxlen=max_len)
     predictions = model.predict(encoded_inputs)
 
     if method == "multiclass":
         # NEED TO CHECK THIS!!!
-        df['predicted_con'] = predictions[:, 2]
-        df['predicted_ent'] = predictions[:, 1]
-        df['predicted_neu'] = predictions[:, 0]
+        df['predicted_con'] = predictions[:, NLI_LABELS.class_id('contradiction')]
+        df['predicted_ent'] = predictions[:, NLI_LABELS.class_id('entailment')]
+        df['predicted_neu'] = predictions[:, NLI_LABELS.class_id('neutral')]
         # Calculate predicted class as the max predicted label
         df['predicted_class'] = df[['predicted_con', 'predicted_ent', 'predicted_neu']].idxmax(axis=1)
         df.predicted_class.replace(to_replace={'predicted_con': 'contradiction',
@@ -86,13 +86,14 @@ def make_sbert_predictions(df: pd.DataFrame, model, model_name: str, max_len: in
     :param method: "multiclass" or "binary"--describes setting for prediction outputs
     :return: Pandas DataFrame augmented with predictions made using trained model
     """
+    sentence_pairs = SentencePairBatch.from_frame(df, 'text1', 'text2')
     tokenizer = AutoTokenizer.from_pretrained(model_name)
     with torch.no_grad():
-        predictions = model(tokenizer.batch_encode_plus(df['text1'],
+        predictions = model(tokenizer.batch_encode_plus(list(sentence_pairs.premises),
                                                         max_length=max_len,
                                                         pad_to_max_length=True,
                                                         truncation=True)["input_ids"],
-                            tokenizer.batch_encode_plus(df['text2'],
+                            tokenizer.batch_encode_plus(list(sentence_pairs.hypotheses),
                                                         max_length=max_len,
                                                         pad_to_max_length=True,
                                                         truncation=True)["input_ids"])
@@ -5,7 +5,6 @@ import datetime
 import os
 import shutil
 
-import numpy as np
 import torch
 import torch.optim as optim
 import wget
@@ -18,7 +17,7 @@ from transformers import AutoModel, AutoTokenizer
 
 from .dataloader import ClassifierDataset
 from .dataloader import collate_fn, multi_acc
-from ..data.make_dataset import remove_tokens_get_sentence_sbert
+from ..data.make_dataset import SentencePairBatch
 
 
 class SBERTPredictor(SentenceTransformer):
@@ -153,20 +152,15 @@ def train_sbert_model(model_name,
                       mancon_corpus=False,
                       med_nli=False,
                       multi_nli=False,
-                      multi_nli_train_x: np.ndarray = None,
-                      multi_nli_train_y: np.ndarray = None,
-                      multi_nli_test_x: np.ndarray = None,
-                      multi_nli_test_y: np.ndarray = None,
-                      med_nli_train_x: np.ndarray = None,
-                      med_nli_train_y: np.ndarray = None,
-                      med_nli_test_x: np.ndarray = None,
-                      med_nli_test_y: np.ndarray = None,
-                      man_con_train_y: np.ndarray = None,
-                      man_con_train_x: np.ndarray = None,
-                      man_con_test_x: np.ndarray = None,
-                      man_con_test_y: np.ndarray = None,
+                      multi_nli_train: SentencePairBatch = None,
+                      multi_nli_test: SentencePairBatch = None,
+                      med_nli_train: SentencePairBatch = None,
+                      med_nli_test: SentencePairBatch = None,
+                      man_con_train: SentencePairBatch = None,
+                      man_con_test: SentencePairBatch = None,
                       batch_size: int = 2,
                       num_epochs: int = 1,
+                      token_cache_dir: str = None,
                       ):
     """Train SBERT on any NLI dataset.
 
@@ -177,18 +171,25 @@ def train_sbert_model(model_name,
     :type med_nli: bool, optional
     :param multi_nli: [description], defaults to False
     :type multi_nli: bool, optional
-    :param multi_nli_train_x: [description], defaults to None
-    :type multi_nli_train_x: np.ndarray, optional
-    :param multi_nli_train_y: [description], defaults to None
-    :type multi_nli_train_y: np.ndarray, optional
-    :param multi_nli_test_x: [description], defaults to None
-    :type multi_nli_test_x: np.ndarray, optional
-    :param multi_nli_test_y: [description], defaults to None
-    :type multi_nli_test_y: np.ndarray, optional
+    :param multi_nli_train: MultiNLI training sentence pairs and labels, defaults to None
+    :type multi_nli_train: SentencePairBatch, optional
+    :param multi_nli_test: MultiNLI test sentence pairs and labels, defaults to None
+    :type multi_nli_test: SentencePairBatch, optional
+    :param med_nli_train: MedNLI training sentence pairs and labels, defaults to None
+    :type med_nli_train: SentencePairBatch, optional
+    :param med_nli_test: MedNLI test sentence pairs and labels, defaults to None
+    :type med_nli_test: SentencePairBatch, optional
+    :param man_con_train: ManConCorpus training sentence pairs and labels, defaults to None
+    :type man_con_train: SentencePairBatch, optional
+    :param man_con_test: ManConCorpus test sentence pairs and labels, defaults to None
+    :type man_con_test: SentencePairBatch, optional
     :param batch_size: [description], defaults to 2
     :type batch_size: int, optional
     :param num_epochs: [description], defaults to 1
     :type num_epochs: int, optional
+    :param token_cache_dir: if given, cache the tokenized sentences in this directory and load them from it in
+        later runs, instead of tokenizing them again, defaults to None
+    :type token_cache_dir: str, optional
     :return: [description]
     :rtype: [type]
     """
@@ -222,13 +223,12 @@ def train_sbert_model(model_name,
     # generating biobert sentence embeddings (mean pooling of sentence embedding vectors)
     sbert_model = SBERTPredictor(word_embedding_model, pooling_model)
     if multi_nli:
-        if multi_nli_train_x is not None:
+        if multi_nli_train is not None:
 
-            df_multi_train = remove_tokens_get_sentence_sbert(multi_nli_train_x, multi_nli_train_y)
-            df_multi_val = remove_tokens_get_sentence_sbert(multi_nli_test_x, multi_nli_test_y)
-
-            multi_train_dataset = ClassifierDataset(df_multi_train, tokenizer=covid_ert_tokenizer)
-            multi_val_dataset = ClassifierDataset(df_multi_val, tokenizer=covid_ert_tokenizer)
+            multi_train_dataset = ClassifierDataset(multi_nli_train, tokenizer=covid_ert_tokenizer,
+                                                    token_cache_dir=token_cache_dir)
+            multi_val_dataset = ClassifierDataset(multi_nli_test, tokenizer=covid_ert_tokenizer,
+                                                  token_cache_dir=token_cache_dir)
 
             class_weights = multi_train_dataset.class_weights()
 
@@ -240,13 +240,12 @@ def train_sbert_model(model_name,
                     class_weights=class_weights, epochs=num_epochs)
 
     if med_nli:
-        if med_nli_train_x is not None:
-
-            df_mednli_train = remove_tokens_get_sentence_sbert(med_nli_train_x, med_nli_train_y)
-            df_mednli_val = remove_tokens_get_sentence_sbert(med_nli_test_x, med_nli_test_y)
+        if med_nli_train is not None:
 
-            mednli_train_dataset = ClassifierDataset(df_mednli_train, tokenizer=covid_ert_tokenizer)
-            mednli_val_dataset = ClassifierDataset(df_mednli_val, tokenizer=covid_ert_tokenizer)
+            mednli_train_dataset = ClassifierDataset(med_nli_train, tokenizer=covid_ert_tokenizer,
+                                                     token_cache_dir=token_cache_dir)
+            mednli_val_dataset = ClassifierDataset(med_nli_test, tokenizer=covid_ert_tokenizer,
+                                                   token_cache_dir=token_cache_dir)
 
             class_weights = mednli_train_dataset.class_weights()
 
@@ -258,13 +257,12 @@ def train_sbert_model(model_name,
                     class_weights=class_weights, epochs=num_epochs)
 
     if mancon_corpus:
-        if man_con_train_x is not None:
-
-            df_mancon_train = remove_tokens_get_sentence_sbert(man_con_train_x, man_con_train_y)
-            df_mancon_val = remove_tokens_get_sentence_sbert(man_con_test_x, man_con_test_y)
+        if man_con_train is not None:
 
-            mancon_train_dataset = ClassifierDataset(df_mancon_train, tokenizer=covid_ert_tokenizer)
-            mancon_val_dataset = ClassifierDataset(df_mancon_val, tokenizer=covid_ert_tokenizer)
+            mancon_train_dataset = ClassifierDataset(man_con_train, tokenizer=covid_ert_tokenizer,
+                                                     token_cache_dir=token_cache_dir)
+            mancon_val_dataset = ClassifierDataset(man_con_test, tokenizer=covid_ert_tokenizer,
+                                                   token_cache_dir=token_cache_dir)
 
             class_weights = mancon_train_dataset.class_weights()
 
@@ -3,20 +3,24 @@
 # -*- coding: utf-8 -*-
 
 import datetime
+import itertools
 import os
 import pickle
 import shutil
+from typing import Callable, Iterator
 
 import numpy as np
 import tensorflow as tf
 import transformers
-import wandb
 from tensorflow.keras.callbacks import EarlyStopping
 from tensorflow.keras.layers import Dense, Input
 from tensorflow.keras.models import Model
 from tensorflow.keras.optimizers import Adam
 from transformers import AutoModel, AutoModelWithLMHead, AutoTokenizer, TFAutoModel
-from wandb.keras import WandbCallback
+
+from ..data.label_space import NLI_LABELS
+from ..data.make_dataset import SentencePairBatch, shuffle_examples
+from ..data.tokenized_corpus import TokenizedCorpus, encode_corpus
 
 
 def regular_encode(texts: list, tokenizer: transformers.AutoTokenizer, maxlen: int = 512):
@@ -40,6 +44,154 @@ def regular_encode(texts: list, tokenizer: transformers.AutoTokenizer, maxlen: i
     return np.array(enc_di['input_ids'])
 
 
+def encode_sentence_pairs(sentence_pairs: SentencePairBatch, tokenizer: transformers.AutoTokenizer, maxlen: int = 512,
+                          token_cache_dir: str = None):
+    """
+    Encode sentence pairs for input to Transformer models, letting the tokenizer insert the special tokens.
+
+    :param sentence_pairs: SentencePairBatch of sentence pairs to be encoded
+    :param tokenizer: tokenizer for encoding
+    :param maxlen: length of the encoded sentence pairs
+    :param token_cache_dir: if given, encode through the tokenized corpus cache in this directory
+    :return: numpy array of encoded sentence pairs. With a token cache, the memory-mapped TokenizedCorpus of the
+        sentence pairs instead, unpadded; use make_tokenized_tf_dataset to feed it to a model a batch at a time
+    """
+    if token_cache_dir is not None:
+        return encode_corpus(sentence_pairs.premises, tokenizer, maxlen, token_cache_dir,
+                             text_pairs=sentence_pairs.hypotheses)
+
+    enc_di = tokenizer.batch_encode_plus(list(zip(sentence_pairs.premises, sentence_pairs.hypotheses)),
+                                         return_attention_mask=False,
+                                         return_token_type_ids=False,
+                                         pad_to_max_length=True,
+                                         max_length=maxlen,
+                                         truncation=True)
+
+    return np.array(enc_di['input_ids'], dtype=np.int32)
+
+
+def make_nli_tf_dataset(examples_fn: Callable[[], Iterator], tokenizer: transformers.AutoTokenizer,
+                        max_len: int = 512, batch_size: int = 32, shuffle_buffer_size: int = 10000,
+                        encode_batch_size: int = 1000):
+    """
+    Stream NLI examples as a tf.data.Dataset of encoded sentence pairs and class ids.
+
+    The examples are read, shuffled and encoded a batch at a time on every pass, so memory use does not depend on
+    the size of the corpus.
+
+    :param examples_fn: function returning an iterator of (sentence1, sentence2, label) tuples, e.g.
+        functools.partial(iter_multi_nli, train_path)
+    :param tokenizer: tokenizer for encoding
+    :param max_len: length of encoded inputs
+    :param batch_size: batch size
+    :param shuffle_buffer_size: number of examples in the shuffle buffer. If 0, the examples are not shuffled
+    :param encode_batch_size: number of sentence pairs encoded at a time
+    :return: Batched dataset of (encoded sentence pairs, class ids in NLI_LABELS)
+    """
+    def generate_examples():
+        examples = examples_fn()
+        if shuffle_buffer_size:
+            examples = shuffle_examples(examples, shuffle_buffer_size)
+        while True:
+            batch = list(itertools.islice(examples, encode_batch_size))
+            if not batch:
+                return
+            sentence1, sentence2, labels = zip(*batch)
+            sentence_pairs = SentencePairBatch(premises=np.array([str(sen) for sen in sentence1], dtype=object),
+                                               hypotheses=np.array([str(sen) for sen in sentence2], dtype=object),
+                                               labels=np.array(labels, dtype=np.int8))
+            yield from zip(encode_sentence_pairs(sentence_pairs, tokenizer, max_len), sentence_pairs.labels)
+
+    dataset = tf.data.Dataset.from_generator(generate_examples, output_types=(tf.int32, tf.int8),
+                                             output_shapes=((max_len,), ()))
+
+    return dataset.batch(batch_size).prefetch(tf.data.experimental.AUTOTUNE)
+
+
+def make_tokenized_tf_dataset(tokens: TokenizedCorpus, labels: np.ndarray, max_len: int = 512,
+                              batch_size: int = 32, shuffle: bool = False):
+    """
+    Feed a memory-mapped tokenized corpus to a model as a tf.data.Dataset, padding one batch at a time.
+
+    Only the token ids of the current batch are read from the cache and padded, so the corpus is never copied
+    into a dense array.
+
+    :param tokens: TokenizedCorpus of encoded sentence pairs, as encode_sentence_pairs returns it with a token cache
+    :param labels: class id of each sentence pair
+    :param max_len: length of encoded inputs
+    :param batch_size: batch size
+    :param shuffle: if True, visit the sentence pairs in a new random order on every pass
+    :return: Dataset of (encoded sentence pairs, class ids) batches
+    """
+    def generate_batches():
+        order = np.random.permutation(tokens.num_texts) if shuffle else np.arange(tokens.num_texts)
+        for start in range(0, len(order), batch_size):
+            indices = order[start:start + batch_size]
+            yield tokens.padded_batch(indices, max_len), labels[indices]
+
+    dataset = tf.data.Dataset.from_generator(generate_batches, output_types=(tf.int32, tf.int8),
+                                             output_shapes=((None, max_len), (None,)))
+
+    return dataset.prefetch(tf.data.experimental.AUTOTUNE)
+
+
+def _fit(model, train_x, train_labels: np.ndarray, test_x, test_labels: np.ndarray, max_len: int, batch_size: int,
+         **kwargs):
+    """
+    Fit a model on encoded sentence pairs, either arrays or memory-mapped tokenized corpora.
+
+    :param model: model to fit
+    :param train_x: encoded training sentence pairs, as encode_sentence_pairs returns them
+    :param train_labels: class id of each training sentence pair
+    :param test_x: encoded validation sentence pairs, as encode_sentence_pairs returns them
+    :param test_labels: class id of each validation sentence pair
+    :param max_len: length of encoded inputs
+    :param batch_size: batch size
+    :param kwargs: other arguments to model.fit
+    :return: Training history
+    """
+    if isinstance(train_x, TokenizedCorpus):
+        return model.fit(make_tokenized_tf_dataset(train_x, train_labels, max_len, batch_size, shuffle=True),
+                         validation_data=make_tokenized_tf_dataset(test_x, test_labels, max_len, batch_size),
+                         **kwargs)
+
+    return model.fit(train_x, train_labels, batch_size=batch_size, validation_data=(test_x, test_labels), **kwargs)
+
+
+class SparseRecall(tf.keras.metrics.Recall):
+    """Recall of a softmax model over all classes, as Recall computes it from one-hot labels, given class ids."""
+
+    def update_state(self, y_true, y_pred, sample_weight=None):
+        """
+        Accumulate the true positives and false negatives of a batch.
+
+        :param y_true: class id of each example
+        :param y_pred: predicted probability of each class for each example
+        :param sample_weight: optional weight of each example
+        :return: Update op
+        """
+        # Only the labels of the batch are one-hot encoded
+        y_true = tf.one_hot(tf.cast(tf.reshape(y_true, [-1]), tf.int32), depth=tf.shape(y_pred)[-1])
+        return super().update_state(y_true, y_pred, sample_weight)
+
+
+class SparsePrecision(tf.keras.metrics.Precision):
+    """Precision of a softmax model over all classes, as Precision computes it from one-hot labels, given class ids."""
+
+    def update_state(self, y_true, y_pred, sample_weight=None):
+        """
+        Accumulate the true positives and false positives of a batch.
+
+        :param y_true: class id of each example
+        :param y_pred: predicted probability of each class for each example
+        :param sample_weight: optional weight of each example
+        :return: Update op
+        """
+        # Only the labels of the batch are one-hot encoded
+        y_true = tf.one_hot(tf.cast(tf.reshape(y_true, [-1]), tf.int32), depth=tf.shape(y_pred)[-1])
+        return super().update_state(y_true, y_pred, sample_weight)
+
+
 def build_model(transformer, max_len: int = 512, multi_class: bool = True):  # noqa: D205
     """
     Build an end-to-end Transformer model. Requires a transformer of type TFAutoBert.
@@ -47,24 +199,25 @@ def build_model(transformer, max_len: int = 512, multi_class: bool = True):  # n
 
     :param transformer: Transformer model
     :param max_len: maximum length of encoded sequence
-    :param multi_class: if True, final layer is multiclass so softmax is used. If False, final layer
-        is sigmoid and binary crossentropy is evaluated.
+    :param multi_class: if True, final layer is multiclass so softmax is used, trained on class ids with sparse
+        categorical crossentropy. If False, final layer is sigmoid and binary crossentropy is evaluated.
     :return: Constructed Transformer model
     """
     input_word_ids = Input(shape=(max_len,), dtype=tf.int32, name="input_word_ids")
     sequence_output = transformer(input_word_ids)[0]
     cls_token = sequence_output[:, 0, :]
     if multi_class:
-        out = Dense(3, activation='softmax', name='softmax')(cls_token)
+        out = Dense(NLI_LABELS.num_classes, activation='softmax', name='softmax')(cls_token)
     else:
         out = Dense(1, activation='sigmoid', name='sigmoid')(cls_token)
 
     model = Model(inputs=input_word_ids, outputs=out)
 
     if multi_class:
-        model.compile(Adam(lr=1e-6), loss='categorical_crossentropy',
-                      metrics=[tf.keras.metrics.Recall(), tf.keras.metrics.Precision(),
-                               tf.keras.metrics.CategoricalAccuracy()])
+        # Trained on the class ids of NLI_LABELS, so no one-hot copies of the labels are made. Recall and precision
+        # are the same as with one-hot labels, and keep their names in the training logs
+        model.compile(Adam(lr=1e-6), loss='sparse_categorical_crossentropy',
+                      metrics=[SparseRecall(name='recall'), SparsePrecision(name='precision'), 'accuracy'])
     else:
         model.compile(Adam(lr=1e-6), loss='binary_crossentropy',
                       metrics=[tf.keras.metrics.Recall(), tf.keras.metrics.Precision(), 'accuracy'])
@@ -101,8 +254,8 @@ def load_model(pickle_path: str, transformer_dir: str = 'transformer', max_len:
     :param pickle_path: path to pickle file containing learned weights from the last layer
     :param transformer_dir: directory of saved model
     :param max_len: maximum length of encoded sequence
-    :param multi_class: if True, final layer is multiclass so softmax is used. If False, final layer
-        is sigmoid and binary crossentropy is evaluated.
+    :param multi_class: if True, final layer is multiclass so softmax is used, trained on class ids with sparse
+        categorical crossentropy. If False, final layer is sigmoid and binary crossentropy is evaluated.
     :return: loaded model
     """  # is this function overriding the Tensorflow.keras.models function?
     transformer = TFAutoModel.from_pretrained(transformer_dir)
@@ -116,18 +269,12 @@ def load_model(pickle_path: str, transformer_dir: str = 'transformer', max_len:
     return model
 
 
-def train_model(multi_nli_train_x: np.ndarray,
-                multi_nli_train_y: np.ndarray,
-                multi_nli_test_x: np.ndarray,
-                multi_nli_test_y: np.ndarray,
-                med_nli_train_x: np.ndarray,
-                med_nli_train_y: np.ndarray,
-                med_nli_test_x: np.ndarray,
-                med_nli_test_y: np.ndarray,
-                man_con_train_x: np.ndarray,
-                man_con_train_y: np.ndarray,
-                man_con_test_x: np.ndarray,
-                man_con_test_y: np.ndarray,
+def train_model(multi_nli_train: SentencePairBatch,
+                multi_nli_test: SentencePairBatch,
+                med_nli_train: SentencePairBatch,
+                med_nli_test: SentencePairBatch,
+                man_con_train: SentencePairBatch,
+                man_con_test: SentencePairBatch,
                 drug_names: list,
                 virus_names: list,
                 model_name: str,
@@ -138,22 +285,17 @@ def train_model(multi_nli_train_x: np.ndarray,
                 use_man_con: bool = True,
                 epochs: int = 3,
                 max_len: int = 512,
-                batch_size: int = 32):
+                batch_size: int = 32,
+                token_cache_dir: str = None):
     """
     Train the Transformer model.
 
-    :param multi_nli_train_x: MultiNLI training sentence pairs
-    :param multi_nli_train_y: MultiNLI training labels
-    :param multi_nli_test_x: MultiNLI test sentence pairs
-    :param multi_nli_test_y: MultiNLI test labels
-    :param med_nli_train_x: MedNLI training sentence pairs
-    :param med_nli_train_y: MedNLI training labels
-    :param med_nli_test_x: MedNLI test sentence pairs
-    :param med_nli_test_y: MedNLI test labels
-    :param man_con_train_x: ManConCorpus training sentence pairs
-    :param man_con_train_y: ManConCorpus training labels
-    :param man_con_test_x: ManConCorpus test sentence pairs
-    :param man_con_test_y: ManConCorpus test labels
+    :param multi_nli_train: MultiNLI training sentence pairs and labels
+    :param multi_nli_test: MultiNLI test sentence pairs and labels
+    :param med_nli_train: MedNLI training sentence pairs and labels
+    :param med_nli_test: MedNLI test sentence pairs and labels
+    :param man_con_train: ManConCorpus training sentence pairs and labels
+    :param man_con_test: ManConCorpus test sentence pairs and labels
     :param drug_names: drug lexicon list
     :param virus_names: virus lexicon list
     :param model_name: model name to load from the pre-trained Transformers package. Expecting either
@@ -169,6 +311,9 @@ def train_model(multi_nli_train_x: np.ndarray,
     :param epochs: number of epochs for training
     :param max_len: length of encoded inputs
     :param batch_size: batch size
+    :param token_cache_dir: if given, cache the encoded sentence pairs in this directory and load them from it
+        in later runs, instead of encoding them again. The cached token ids are memory-mapped and padded a batch
+        at a time
     :return: fine-tuned Transformer model
     """
     if model_name != 'deepset/covid_bert_base':
@@ -181,27 +326,21 @@ def train_model(multi_nli_train_x: np.ndarray,
     # NOTE: We're ignoring adding tokens for drug and virus names now because this becomes prohibitive at training time.
     # TODO: Find out if this is okay....
 
-    multi_nli_train_x_str = [str(sen) for sen in multi_nli_train_x]
-    multi_nli_train_x = regular_encode(multi_nli_train_x_str, tokenizer, maxlen=max_len)
-    print("Done with multi_nli_train_x_str")  # noqa: T001
+    multi_nli_train_x = encode_sentence_pairs(multi_nli_train, tokenizer, max_len, token_cache_dir)
+    print("Done with multi_nli_train_x")  # noqa: T001
 
-    multi_nli_test_x_str = [str(sen) for sen in multi_nli_test_x]
-    multi_nli_test_x = regular_encode(multi_nli_test_x_str, tokenizer, maxlen=max_len)
-    print("Done with multi_nli_test_x_str")  # noqa: T001
+    multi_nli_test_x = encode_sentence_pairs(multi_nli_test, tokenizer, max_len, token_cache_dir)
+    print("Done with multi_nli_test_x")  # noqa: T001
 
-    med_nli_train_x_str = [str(sen) for sen in med_nli_train_x]
-    med_nli_train_x = regular_encode(med_nli_train_x_str, tokenizer, maxlen=max_len)
-    print("Done with med_nli_train_x_str")  # noqa: T001
+    med_nli_train_x = encode_sentence_pairs(med_nli_train, tokenizer, max_len, token_cache_dir)
+    print("Done with med_nli_train_x")  # noqa: T001
 
-    med_nli_test_x_str = [str(sen) for sen in med_nli_test_x]
-    med_nli_test_x = regular_encode(med_nli_test_x_str, tokenizer, maxlen=max_len)
-    print("Done with med_nli_test_x_str")  # noqa: T001
+    med_nli_test_x = encode_sentence_pairs(med_nli_test, tokenizer, max_len, token_cache_dir)
+    print("Done with med_nli_test_x")  # noqa: T001
 
-    man_con_train_x_str = [str(sen) for sen in man_con_train_x]
-    man_con_train_x = regular_encode(man_con_train_x_str, tokenizer, maxlen=max_len)
+    man_con_train_x = encode_sentence_pairs(man_con_train, tokenizer, max_len, token_cache_dir)
 
-    man_con_test_x_str = [str(sen) for sen in man_con_test_x]
-    man_con_test_x = regular_encode(man_con_test_x_str, tokenizer, maxlen=max_len)
+    man_con_test_x = encode_sentence_pairs(man_con_test, tokenizer, max_len, token_cache_dir)
 
     es = EarlyStopping(monitor='val_accuracy',
                        min_delta=0.001,
@@ -245,35 +384,26 @@ def train_model(multi_nli_train_x: np.ndarray,
         print("Please install GPU version of TF")  # noqa: T001
 
     # Initialize WandB for tracking the training progress
+    import wandb
+    from wandb.keras import WandbCallback
+
     wandb.init(dir="./wandb_artifacts")
 
     # Fine tune on MultiNLI
-    train_history = model.fit(multi_nli_train_x,
-                              multi_nli_train_y,
-                              batch_size=batch_size,
-                              validation_data=(multi_nli_test_x, multi_nli_test_y),
-                              callbacks=[es, WandbCallback()],
-                              epochs=epochs)
+    train_history = _fit(model, multi_nli_train_x, multi_nli_train.labels, multi_nli_test_x, multi_nli_test.labels,
+                         max_len, batch_size, callbacks=[es, WandbCallback()], epochs=epochs)
 
     print("passed the multiNLI train. Now the history:")  # noqa: T001
     print(train_history)  # noqa: T001
 
     # Fine tune on MedNLI
     if use_med_nli:
-        train_history = model.fit(med_nli_train_x,
-                                  med_nli_train_y,
-                                  batch_size=batch_size,
-                                  validation_data=(med_nli_test_x, med_nli_test_y),
-                                  callbacks=[es, WandbCallback()],
-                                  epochs=epochs)
+        train_history = _fit(model, med_nli_train_x, med_nli_train.labels, med_nli_test_x, med_nli_test.labels,
+                             max_len, batch_size, callbacks=[es, WandbCallback()], epochs=epochs)
 
     # Fine tune on ManConCorpus
     if use_man_con:
-        train_history = model.fit(man_con_train_x,
-                                  man_con_train_y,
-                                  batch_size=batch_size,
-                                  validation_data=(man_con_test_x, man_con_test_y),
-                                  callbacks=[es, WandbCallback()],
-                                  epochs=epochs)
+        train_history = _fit(model, man_con_train_x, man_con_train.labels, man_con_test_x, man_con_test.labels,
+                             max_len, batch_size, callbacks=[es, WandbCallback()], epochs=epochs)
 
     return model, train_history
@@ -0,0 +1,35 @@
+"""Claims and a stand-in nlp object shared by the claim pairing tests."""
+
+# -*- coding: utf-8 -*-
+
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+
+
+def letter_count_doc(text: str):
+    """Embed text as its letter counts, standing in for a scispacy doc in pairing tests."""
+    vector = np.zeros(26, dtype=np.float32)
+    for char in text:
+        if 'a' <= char <= 'z':
+            vector[ord(char) - ord('a')] += 1
+    return SimpleNamespace(vector=vector)
+
+
+letter_count_nlp = SimpleNamespace(make_doc=letter_count_doc)
+
+
+def make_pairing_claims():
+    """Make a small set of claims from several papers mentioning a handful of drugs."""
+    return pd.DataFrame({
+        'cord_uid': ['a', 'a', 'b', 'b', 'c', 'c', 'd'],
+        'drug_terms_used': ['remdesivir,lopinavir', 'remdesivir', 'remdesivir,ritonavir', 'lopinavir,ritonavir',
+                            'remdesivir', 'lopinavir,ritonavir', 'chloroquine'],
+        'claims': ['remdesivir shortened recovery time in hospitalized patients',
+                   'lopinavir and remdesivir were both well tolerated',
+                   'remdesivir did not shorten recovery time in hospitalized patients',
+                   'lopinavir with ritonavir showed no benefit over standard care',
+                   'remdesivir reduced viral load in the lower respiratory tract',
+                   'ritonavir boosted lopinavir exposure in patients',
+                   'chloroquine inhibited viral replication in vitro']})
@@ -0,0 +1,102 @@
+"""Tests for extending, rescoring and loading claim pair stores."""
+
+# -*- coding: utf-8 -*-
+
+import tempfile
+import unittest
+
+import pandas as pd
+from contradictory_claims.data.claim_pair_store import load_claim_pair_tables, pair_new_claims
+from contradictory_claims.data.process_claims import pair_similar_claims
+
+from .pairing_claims import letter_count_nlp, make_pairing_claims
+
+
+class TestClaimPairStore(unittest.TestCase):
+    """Tests for extending, rescoring and loading claim pair stores."""
+
+    def setUp(self) -> None:
+        """Set up the claims and nlp stand-in shared by the pairing tests."""
+        self.claims_df = make_pairing_claims()
+        self.nlp = letter_count_nlp
+
+    def test_1_pair_store(self):
+        """Test that pairs written to the pair store are read back with drug and similarity filters."""
+        tables = pair_similar_claims(self.claims_df, self.nlp, threshold=None, return_tables=True)
+        with tempfile.TemporaryDirectory() as out_dir:
+            self.assertIsNone(pair_similar_claims(self.claims_df, self.nlp, threshold=None, out_dir=out_dir))
+
+            stored_tables = load_claim_pair_tables(out_dir)
+            pd.testing.assert_frame_equal(stored_tables.papers, tables.papers)
+            self.assertEqual(list(stored_tables.claims.drug_terms_mention), list(tables.claims.drug_terms_mention))
+            sort_columns = ['claim_i', 'claim_j']
+            pd.testing.assert_frame_equal(
+                stored_tables.pairs.sort_values(sort_columns).reset_index(drop=True),
+                tables.pairs.sort_values(sort_columns).reset_index(drop=True))
+
+            self.assertEqual(len(load_claim_pair_tables(out_dir, drugs=['lopinavir']).pairs), 3)
+            self.assertEqual(len(load_claim_pair_tables(out_dir, drugs=['remdesivir']).pairs), 5)
+            similar_pairs = load_claim_pair_tables(out_dir, drugs=['remdesivir'], min_similarity=0.8).pairs
+            self.assertTrue((similar_pairs.similarity >= 0.8).all())
+            self.assertEqual(len(similar_pairs), (tables.pairs.similarity >= 0.8).sum()
+                             - len(load_claim_pair_tables(out_dir, drugs=['lopinavir'], min_similarity=0.8).pairs))
+
+    def test_2_pair_new_claims(self):
+        """Test that incrementally pairing new claims gives the same pairs as pairing all claims at once."""
+        claims_df = pd.concat([self.claims_df, pd.DataFrame({
+            'cord_uid': ['d', 'e'],
+            'drug_terms_used': ['chloroquine', 'hydroxychloroquine'],
+            'claims': ['chloroquine was compared with hydroxychloroquine in vitro',
+                       'hydroxychloroquine did not reduce viral replication'],
+        })], ignore_index=True)
+        old_claims_df = claims_df.iloc[[0, 1, 4, 6, 7]]
+        new_claims_df = claims_df.iloc[[0, 2, 3, 5, 8]]
+
+        def stored_claim_text_pairs(out_dir):
+            tables = load_claim_pair_tables(out_dir)
+            claims = tables.claims.claims.to_numpy()
+            pairs = zip(claims[tables.pairs.claim_i], claims[tables.pairs.claim_j])
+            return sorted(tuple(sorted(pair)) for pair in pairs)
+
+        with tempfile.TemporaryDirectory() as out_dir, tempfile.TemporaryDirectory() as all_out_dir:
+            pair_similar_claims(old_claims_df, self.nlp, threshold=None, out_dir=out_dir)
+            num_old_pairs = len(load_claim_pair_tables(out_dir).pairs)
+            num_new_pairs = pair_new_claims(new_claims_df, self.nlp, out_dir, threshold=None)
+            pair_similar_claims(claims_df, self.nlp, threshold=None, out_dir=all_out_dir)
+
+            self.assertEqual(len(load_claim_pair_tables(out_dir).pairs), num_old_pairs + num_new_pairs)
+            self.assertEqual(stored_claim_text_pairs(out_dir), stored_claim_text_pairs(all_out_dir))
+            stored_tables = load_claim_pair_tables(out_dir)
+            self.assertEqual(len(stored_tables.claims), len(claims_df))
+            self.assertEqual(sorted(stored_tables.papers.cord_uid), ['a', 'b', 'c', 'd', 'e'])
+            # The new drug term is also looked up in the old claims
+            self.assertIn('hydroxychloroquine', stored_tables.claims.drug_terms_mention.iloc[4])
+            self.assertEqual(pair_new_claims(new_claims_df, self.nlp, out_dir, threshold=None), 0)
+
+    def test_3_pair_new_claims_expanded(self):
+        """Test that new drug terms are matched in the expanded text of the stored claims, as in a full run."""
+        old_claims_df = pd.DataFrame({'cord_uid': ['a', 'b'],
+                                      'drug_terms_used': ['remdesivir', 'remdesivir'],
+                                      'claims': ['remdesivir and HCQ shortened recovery',
+                                                 'remdesivir did not shorten recovery']})
+        new_claims_df = pd.DataFrame({'cord_uid': ['c'],
+                                      'drug_terms_used': ['hydroxychloroquine'],
+                                      'claims': ['hydroxychloroquine shortened recovery']})
+        abbreviation_maps = {'a': {'HCQ': 'hydroxychloroquine'}}
+
+        with tempfile.TemporaryDirectory() as out_dir:
+            pair_similar_claims(old_claims_df, self.nlp, threshold=None, out_dir=out_dir,
+                                abbreviation_maps=abbreviation_maps)
+            pair_new_claims(new_claims_df, self.nlp, out_dir, threshold=None,
+                            abbreviation_maps=abbreviation_maps)
+            stored_tables = load_claim_pair_tables(out_dir)
+        all_tables = pair_similar_claims(pd.concat([old_claims_df, new_claims_df], ignore_index=True),
+                                         self.nlp, threshold=None, return_tables=True,
+                                         abbreviation_maps=abbreviation_maps)
+
+        # New drug terms get the drug ids after the stored ones, so only the sets of drug terms match
+        self.assertEqual([sorted(drugs) for drugs in stored_tables.claims.drug_terms_mention],
+                         [sorted(drugs) for drugs in all_tables.claims.drug_terms_mention])
+        self.assertEqual(stored_tables.claims.expanded_claims.tolist(), all_tables.claims.expanded_claims.tolist())
+        pd.testing.assert_frame_equal(stored_tables.pairs.sort_values(['claim_i', 'claim_j']).reset_index(drop=True),
+                                      all_tables.pairs.sort_values(['claim_i', 'claim_j']).reset_index(drop=True))
@@ -0,0 +1,58 @@
+"""Tests for collapsing near-duplicate claims."""
+
+# -*- coding: utf-8 -*-
+
+import unittest
+
+import numpy as np
+import pandas as pd
+from contradictory_claims.data.deduplicate_claims import collapse_near_duplicate_claims, group_near_duplicates,\
+    minhash_signatures
+
+
+class TestDeduplicateClaims(unittest.TestCase):
+    """Tests for collapsing near-duplicate claims."""
+
+    def test_1_minhash_signatures(self):
+        """Test that identical texts get identical signatures and unrelated texts rarely agree."""
+        texts = ['Remdesivir shortened recovery time in hospitalized patients.',
+                 'remdesivir shortened recovery time in hospitalized patients',
+                 'Chloroquine inhibited viral replication in vitro.',
+                 '']
+        signatures = minhash_signatures(texts, num_perm=32)
+        self.assertEqual(signatures.shape, (4, 32))
+        self.assertEqual(signatures.dtype, np.uint32)
+        np.testing.assert_array_equal(signatures[0], signatures[1])
+        self.assertLess((signatures[0] == signatures[2]).mean(), 0.5)
+        # Chunking the hashing does not change the signatures
+        np.testing.assert_array_equal(minhash_signatures(texts, num_perm=32, chunk_size=3), signatures)
+
+    def test_2_group_near_duplicates(self):
+        """Test that texts are grouped with the representative they match, numbered by first appearance."""
+        signatures = np.array([[1, 2, 3, 4], [5, 6, 7, 8], [1, 2, 3, 4], [1, 2, 3, 9], [5, 0, 0, 0]], dtype=np.uint32)
+        groups = group_near_duplicates(signatures, threshold=0.75, bands=2)
+        self.assertEqual(list(groups), [0, 1, 0, 0, 2])
+        # The last text only matches the second, not their representative, so matches are not chained
+        signatures = np.array([[1, 2, 3, 4], [1, 2, 3, 9], [5, 2, 3, 9]], dtype=np.uint32)
+        groups = group_near_duplicates(signatures, threshold=0.75, bands=2)
+        self.assertEqual(list(groups), [0, 0, 1])
+
+    def test_3_collapse_near_duplicate_claims(self):
+        """Test that near-duplicate claims are collapsed into representatives keeping their provenance."""
+        claims_df = pd.DataFrame({
+            'cord_uid': ['a', 'b', 'c', 'c', 'd'],
+            'drug_terms_used': ['remdesivir', 'lopinavir,remdesivir', 'remdesivir', 'chloroquine', 'remdesivir'],
+            'claims': ['Remdesivir shortened the time to recovery in adults hospitalized with Covid-19.',
+                       'Remdesivir shortened the time to recovery in adults hospitalized with COVID-19',
+                       'remdesivir shortened the time to recovery in adults hospitalized with covid-19 .',
+                       'Chloroquine inhibited viral replication in vitro.',
+                       'Remdesivir did not improve clinical outcomes in patients with severe disease.']})
+        representatives = collapse_near_duplicate_claims(claims_df)
+
+        self.assertEqual(list(representatives.claims), list(claims_df.claims.iloc[[0, 3, 4]]))
+        self.assertEqual(list(representatives.cord_uids), [['a', 'b', 'c'], ['c'], ['d']])
+        self.assertEqual(list(representatives.cord_uid), ['a', 'c', 'd'])
+        self.assertEqual(list(representatives.drug_terms_used), ['remdesivir,lopinavir', 'chloroquine', 'remdesivir'])
+
+        with self.assertRaises(ValueError):
+            collapse_near_duplicate_claims(claims_df, num_perm=64, bands=10)
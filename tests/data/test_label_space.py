@@ -0,0 +1,39 @@
+"""Tests for label spaces."""
+
+# -*- coding: utf-8 -*-
+
+import unittest
+
+import numpy as np
+from contradictory_claims.data.label_space import LabelSpace, NLI_LABELS, SBERT_LABELS
+
+
+class TestLabelSpace(unittest.TestCase):
+    """Tests for label spaces."""
+
+    def test_1_class_ids(self):
+        """Test that class names are mapped to int8 class ids, with an optional default class."""
+        class_ids = NLI_LABELS.class_ids(['contradiction', 'neutral', 'entailment', 'contradiction'])
+        self.assertEqual(class_ids.dtype, np.int8)
+        self.assertEqual(list(class_ids), [2, 0, 1, 2])
+        self.assertEqual(list(NLI_LABELS.class_ids(['-', 'entailment'], default='neutral')), [0, 1])
+        self.assertEqual(NLI_LABELS.class_id('-', default='neutral'), 0)
+        with self.assertRaises(ValueError):
+            NLI_LABELS.class_ids(['contradiction', '-'])
+        self.assertEqual(list(NLI_LABELS.names_of(class_ids[:2])), ['contradiction', 'neutral'])
+
+    def test_2_convert(self):
+        """Test that class ids are converted to the ids of the same classes in other label spaces."""
+        class_ids = np.array([0, 1, 2], dtype=np.int8)
+        sbert_ids = NLI_LABELS.to(class_ids, SBERT_LABELS)
+        self.assertEqual(list(sbert_ids), [1, 2, 0])
+        self.assertEqual(list(SBERT_LABELS.names_of(sbert_ids)), list(NLI_LABELS.names_of(class_ids)))
+        self.assertEqual(list(SBERT_LABELS.to(sbert_ids, NLI_LABELS)), [0, 1, 2])
+        with self.assertRaises(ValueError):
+            NLI_LABELS.to(class_ids, LabelSpace(('entailment', 'not entailment')))
+
+    def test_3_categorical(self):
+        """Test that categorical targets have a 1 in the column of each class id."""
+        targets = NLI_LABELS.categorical(np.array([2, 0], dtype=np.int8))
+        self.assertEqual(targets.dtype, np.int8)
+        self.assertEqual(targets.tolist(), [[0, 0, 1], [1, 0, 0]])
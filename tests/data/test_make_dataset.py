@@ -2,11 +2,16 @@
 
 # -*- coding: utf-8 -*-
 
+import json
 import os
+import tempfile
 import unittest
 
-from contradictory_claims.data.make_dataset import load_drug_virus_lexicons, load_mancon_corpus_from_sent_pairs, \
-    load_med_nli, load_multi_nli
+import numpy as np
+import pandas as pd
+from contradictory_claims.data.make_dataset import SentencePairBatch, iter_mancon_corpus_from_sent_pairs, \
+    iter_med_nli, iter_multi_nli, load_drug_virus_lexicons, load_mancon_corpus_from_sent_pairs, load_med_nli, \
+    load_multi_nli, read_jsonl_columns, shuffle_examples
 
 from .constants import drug_lex_path, mancon_sent_pairs, mednli_dev_path, mednli_test_path, mednli_train_path, \
     multinli_test_path, multinli_train_path, sample_drug_lex_path, sample_mancon_sent_pairs, \
@@ -42,50 +47,121 @@ class TestMakeDataset(unittest.TestCase):
     @unittest.skip("This test can be used locally to check that MultiNLI loads properly")
     def test_load_multi_nli(self):
         """Test that MultiNLI is loaded as expected."""
-        x_train, y_train, x_test, y_test = load_multi_nli(multinli_train_path, multinli_test_path)
+        train_pairs, test_pairs = load_multi_nli(multinli_train_path, multinli_test_path)
 
-        self.assertEqual(len(x_train), 391165)
-        self.assertEqual(y_train.shape, (391165, 3))
-        self.assertEqual(len(x_test), 9897)
-        self.assertEqual(y_test.shape, (9897, 3))
+        self.assertEqual(train_pairs.num_pairs, 391165)
+        self.assertEqual(train_pairs.labels.shape, (391165,))
+        self.assertEqual(test_pairs.num_pairs, 9897)
+        self.assertEqual(test_pairs.labels.shape, (9897,))
 
     def test_load_multi_nli_sample(self):
         """Test that MultiNLI SAMPLE DATA are loaded as expected."""
-        x_train, y_train, x_test, y_test = load_multi_nli(sample_multinli_train_path, sample_multinli_test_path)
+        train_pairs, test_pairs = load_multi_nli(sample_multinli_train_path, sample_multinli_test_path)
 
-        self.assertEqual(len(x_train), 49)
-        self.assertEqual(y_train.shape, (49, 3))
-        self.assertEqual(len(x_test), 49)
-        self.assertEqual(y_test.shape, (49, 3))
+        self.assertEqual(train_pairs.num_pairs, 49)
+        self.assertEqual(train_pairs.labels.shape, (49,))
+        self.assertEqual(test_pairs.num_pairs, 49)
+        self.assertEqual(test_pairs.labels.shape, (49,))
 
     @unittest.skip("This test can be used locally to check that MedNLI loads properly")
     def test_load_med_nli(self):
         """Test that MedNLI is loaded as expected."""
-        x_train, y_train, x_test, y_test = load_med_nli(mednli_train_path, mednli_dev_path, mednli_test_path)
-
-        self.assertEqual(len(x_train), 12627)
-        self.assertEqual(y_train.shape, (12627, 3))
-        self.assertEqual(len(x_test), 1422)
-        self.assertEqual(y_test.shape, (1422, 3))
+        train_pairs, test_pairs = load_med_nli(mednli_train_path, mednli_dev_path, mednli_test_path)
+
+        self.assertEqual(train_pairs.num_pairs, 12627)
+        self.assertEqual(train_pairs.labels.shape, (12627,))
+        self.assertEqual(test_pairs.num_pairs, 1422)
+        self.assertEqual(test_pairs.labels.shape, (1422,))
+
+    def test_sentence_pair_batch(self):
+        """Test that sentence pairs are kept as columns with compact labels."""
+        pairs_df = pd.DataFrame({'sentence1': ['a', 'b', 'c'], 'sentence2': ['d', 'e', 3],
+                                 'gold_label': ['contradiction', 'neutral', 'entailment']})
+        sentence_pairs = SentencePairBatch.from_frame(pairs_df, label_column='gold_label')
+
+        self.assertEqual(sentence_pairs.num_pairs, 3)
+        self.assertEqual(list(sentence_pairs.hypotheses), ['d', 'e', '3'])
+        self.assertEqual(sentence_pairs.labels.dtype, np.int8)
+        self.assertEqual(list(sentence_pairs.labels), [2, 0, 1])
+
+        subset = sentence_pairs.take([2, 0])
+        self.assertEqual(list(subset.premises), ['c', 'a'])
+        self.assertEqual(list(subset.labels), [1, 2])
+        self.assertIsNone(SentencePairBatch.from_frame(pairs_df).labels)
+
+    def test_read_jsonl_columns(self):
+        """Test that selected fields of a JSON lines file are read into columns, one row per line."""
+        records = [{'sentence1': 'Labs were notable for Cr 1.7.', 'sentence2': 'Patient has normal Cr',
+                    'gold_label': 'contradiction', 'pairID': '1'},
+                   {'sentence1': 'He was started on heparin.', 'sentence2': 'The patient is anticoagulated.',
+                    'gold_label': 'entailment', 'pairID': '2'},
+                   {'sentence1': 'No acute distress.', 'sentence2': 'The patient has a fever.'}]
+        with tempfile.TemporaryDirectory() as temp_dir:
+            jsonl_path = os.path.join(temp_dir, 'mednli.jsonl')
+            with open(jsonl_path, 'w', encoding='utf-8') as f:
+                f.write('\n'.join(json.dumps(record) for record in records) + '\n\n')
+            mednli_df = read_jsonl_columns(jsonl_path, ['sentence1', 'sentence2', 'gold_label'])
+
+        self.assertEqual(list(mednli_df.columns), ['sentence1', 'sentence2', 'gold_label'])
+        self.assertEqual(list(mednli_df.sentence2), [record['sentence2'] for record in records])
+        self.assertEqual(list(mednli_df.gold_label), ['contradiction', 'entailment', None])
 
     @unittest.skip("This test can be used locally to check that ManConCorpus loads properly")
     def test_load_mancon_corpus_from_sent_pairs(self):
         """Test that ManConCorpus is loaded as expected."""
-        x_train, y_train, x_test, y_test = load_mancon_corpus_from_sent_pairs(mancon_sent_pairs)
+        train_pairs, test_pairs = load_mancon_corpus_from_sent_pairs(mancon_sent_pairs)
 
-        self.assertEqual(len(x_train), 14328)
-        self.assertEqual(y_train.shape, (14328, 3))
-        self.assertEqual(len(x_test), 3583)
-        self.assertEqual(y_test.shape, (3583, 3))
+        self.assertEqual(train_pairs.num_pairs, 14328)
+        self.assertEqual(train_pairs.labels.shape, (14328,))
+        self.assertEqual(test_pairs.num_pairs, 3583)
+        self.assertEqual(test_pairs.labels.shape, (3583,))
 
     def test_load_mancon_corpus_from_sent_pairs_sample(self):
         """Test that ManConCorpus is loaded as expected."""
-        x_train, y_train, x_test, y_test = load_mancon_corpus_from_sent_pairs(sample_mancon_sent_pairs)
-
-        self.assertEqual(len(x_train), 39)
-        self.assertEqual(y_train.shape, (39, 3))
-        self.assertEqual(len(x_test), 10)
-        self.assertEqual(y_test.shape, (10, 3))
+        train_pairs, test_pairs = load_mancon_corpus_from_sent_pairs(sample_mancon_sent_pairs)
+
+        self.assertEqual(train_pairs.num_pairs, 39)
+        self.assertEqual(train_pairs.labels.shape, (39,))
+        self.assertEqual(test_pairs.num_pairs, 10)
+        self.assertEqual(test_pairs.labels.shape, (10,))
+
+    def test_iter_multi_nli_sample(self):
+        """Test that MultiNLI SAMPLE DATA are streamed in file order, a chunk of rows at a time."""
+        examples = list(iter_multi_nli(sample_multinli_train_path, chunk_size=10))
+        multinli_df = pd.read_csv(sample_multinli_train_path, sep='\t')
+
+        self.assertEqual(len(examples), 49)
+        self.assertEqual([sentence1 for sentence1, _, _ in examples], list(multinli_df.sentence1))
+        self.assertEqual(examples[0][2], 0)
+        self.assertEqual(examples[1][2], 1)
+
+    def test_iter_med_nli(self):
+        """Test that MedNLI sentence pairs are streamed from several JSON lines files in order."""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            paths = [os.path.join(temp_dir, 'train.jsonl'), os.path.join(temp_dir, 'dev.jsonl')]
+            for path, label in zip(paths, ['contradiction', 'entailment']):
+                with open(path, 'w', encoding='utf-8') as f:
+                    f.write(json.dumps({'sentence1': path, 'sentence2': 'b', 'gold_label': label}) + '\n')
+            self.assertEqual(list(iter_med_nli(*paths)), [(paths[0], 'b', 2), (paths[1], 'b', 1)])
+
+    def test_iter_mancon_corpus_from_sent_pairs_sample(self):
+        """Test that the ManConCorpus train and test streams split the SAMPLE DATA the same way on every pass."""
+        train_examples = list(iter_mancon_corpus_from_sent_pairs(sample_mancon_sent_pairs))
+        test_examples = list(iter_mancon_corpus_from_sent_pairs(sample_mancon_sent_pairs, split='test'))
+
+        self.assertEqual(len(train_examples) + len(test_examples), 49)
+        self.assertGreater(len(train_examples), len(test_examples))
+        self.assertEqual(list(iter_mancon_corpus_from_sent_pairs(sample_mancon_sent_pairs, split='test')),
+                         test_examples)
+        with self.assertRaises(ValueError):
+            list(iter_mancon_corpus_from_sent_pairs(sample_mancon_sent_pairs, split='dev'))
+
+    def test_shuffle_examples(self):
+        """Test that a shuffle buffer emits every example once, in a different order."""
+        shuffled = list(shuffle_examples(range(100), buffer_size=10, seed=0))
+        self.assertEqual(sorted(shuffled), list(range(100)))
+        self.assertNotEqual(shuffled, list(range(100)))
+        self.assertEqual(list(shuffle_examples(range(100), buffer_size=10, seed=0)), shuffled)
 
     def test_load_drug_virus_lexicons(self):
         """Test that the virus and drug lexicons are loaded properly."""
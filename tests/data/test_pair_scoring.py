@@ -0,0 +1,29 @@
+"""Tests for generating and scoring cross-paper claim pairs."""
+
+# -*- coding: utf-8 -*-
+
+import unittest
+from itertools import combinations
+
+import numpy as np
+from contradictory_claims.data.pair_scoring import iter_cross_paper_pairs
+
+
+class TestPairScoring(unittest.TestCase):
+    """Tests for generating and scoring cross-paper claim pairs."""
+
+    def test_1_iter_cross_paper_pairs(self):
+        """Test that streamed candidate pairs are the unique cross-paper pairs sharing a drug term."""
+        drug_claim_index = {'chloroquine': np.array([0, 1, 2, 4]),
+                            'lopinavir': np.array([1, 2, 3, 4]),
+                            'remdesivir': np.array([0, 3, 4])}
+        paper_ids = np.array([0, 0, 1, 2, 2])
+        expected_pairs = set()
+        for claim_ids in drug_claim_index.values():
+            expected_pairs.update((i, j) for i, j in combinations(claim_ids, 2) if paper_ids[i] != paper_ids[j])
+
+        for chunk_size in [1, 4, 1000]:
+            pairs = [(i, j) for _, claim_i, claim_j in iter_cross_paper_pairs(drug_claim_index, paper_ids, chunk_size)
+                     for i, j in zip(claim_i, claim_j)]
+            self.assertEqual(len(pairs), len(expected_pairs))
+            self.assertEqual(set(pairs), expected_pairs)
@@ -0,0 +1,47 @@
+"""Tests for planning claim pairing runs."""
+
+# -*- coding: utf-8 -*-
+
+import unittest
+
+import numpy as np
+import pandas as pd
+from contradictory_claims.data.pairing_plan import plan_claim_pairing
+from contradictory_claims.data.process_claims import pair_similar_claims
+
+from .pairing_claims import letter_count_nlp, make_pairing_claims
+
+
+class TestPairingPlan(unittest.TestCase):
+    """Tests for planning claim pairing runs."""
+
+    def setUp(self) -> None:
+        """Set up the claims and nlp stand-in shared by the pairing tests."""
+        self.claims_df = make_pairing_claims()
+        self.nlp = letter_count_nlp
+
+    def test_1_plan_claim_pairing(self):
+        """Test that the pairing plan counts the candidate pairs of each drug term exactly as they are scored."""
+        pairing_plan = plan_claim_pairing(self.claims_df, chunk_size=1)
+        drug_pairs = pairing_plan['drug_pairs'].set_index('drug')
+
+        self.assertEqual(pairing_plan['num_claims'], 7)
+        self.assertEqual(pairing_plan['num_drugs'], 4)
+        self.assertEqual(drug_pairs.loc['remdesivir'].tolist(), [4, 3, 5])
+        self.assertEqual(drug_pairs.loc['lopinavir'].tolist(), [3, 3, 3])
+        # The one cross-paper ritonavir pair also mentions lopinavir, so it is only scored in that block
+        self.assertEqual(drug_pairs.loc['ritonavir'].tolist(), [2, 2, 0])
+        self.assertEqual(drug_pairs.loc['chloroquine'].tolist(), [1, 1, 0])
+        self.assertEqual(pairing_plan['candidate_pairs'], 8)
+        all_pairs = pair_similar_claims(self.claims_df, self.nlp, threshold=None, return_tables=True).pairs
+        self.assertEqual(pairing_plan['candidate_pairs'], len(all_pairs))
+        # Claims mentioning random subsets of the drug terms share many of them
+        rng = np.random.RandomState(0)
+        drugs = ['remdesivir', 'lopinavir', 'ritonavir', 'chloroquine']
+        random_claims = [' and '.join(d for d in drugs if rng.rand() < 0.6) + ' were studied' for _ in range(40)]
+        random_claims_df = pd.DataFrame({'cord_uid': rng.randint(0, 6, 40).astype(str),
+                                         'drug_terms_used': ','.join(drugs), 'claims': random_claims})
+        random_pairs = pair_similar_claims(random_claims_df, self.nlp, threshold=None, return_tables=True).pairs
+        self.assertEqual(plan_claim_pairing(random_claims_df, chunk_size=7)['candidate_pairs'], len(random_pairs))
+        self.assertEqual(pairing_plan['strategy'], 'exact blocked')
+        self.assertEqual(plan_claim_pairing(self.claims_df, memory_budget=0)['strategy'], 'top-k')
@@ -2,17 +2,24 @@
 
 # -*- coding: utf-8 -*-
 
+import tempfile
 import unittest
 
+import numpy as np
 import pandas as pd
-from contradictory_claims.data.process_claims import add_cord_metadata,\
+from contradictory_claims.data.claim_pair_store import load_claim_pair_tables, pair_new_claims,\
+    rematerialize_claim_pairs
+from contradictory_claims.data.pairing_plan import plan_claim_pairing
+from contradictory_claims.data.process_claims import ClaimPairTables, add_cord_metadata, build_drug_claim_index,\
+    expand_abbreviations, extract_drug_terms, get_drug_terms_mention, pair_similar_claims,\
     split_papers_on_claim_presence, tokenize_section_text
-#    initialize_nlp, pair_similar_claims
 
 from .constants import sample_metadata_path, sample_no_claims_df_path,\
     sample_paired_claims_df_path, sample_raw_claims_df_path
+from .pairing_claims import letter_count_nlp, make_pairing_claims
 #    sample_virus_lex_path
 
+
 # Disable sorting of test methods so they run in the same order as defined below,
 # since we want a sequential data flow between the tests
 # unittest.TestLoader.sortTestMethodsUsing = None
@@ -21,12 +28,10 @@ from .constants import sample_metadata_path, sample_no_claims_df_path,\
 class TestProcessClaims(unittest.TestCase):
     """Tests for processing CORD-19 claims."""
 
-#    def setUp(self) -> None:
-#        """Set up class variables to pass between test functions."""
-#        self.__class__.claims_df = pd.read_csv(sample_raw_claims_df_path)
-#        self.__class__.claims_data = pd.DataFrame()
-#        self.__class__.no_claims_data = pd.DataFrame()
-#        self.__class__.claims_paired_df = pd.DataFrame()
+    def setUp(self) -> None:
+        """Set up the claims and nlp stand-in shared by the pairing tests."""
+        self.claims_df = make_pairing_claims()
+        self.nlp = letter_count_nlp
 
     def test_1_split_papers_on_claim_presence(self):
         """Test that papers are split correctly based on claim presence."""
@@ -56,3 +61,181 @@ class TestProcessClaims(unittest.TestCase):
         claims_paired_df = pd.read_csv(sample_paired_claims_df_path)
         claims_paired_meta_df = add_cord_metadata(claims_paired_df, sample_metadata_path)
         self.assertEqual(len(claims_paired_meta_df.columns), 11)
+
+    def test_5_build_drug_claim_index(self):
+        """Test that the drug-claim index matches substring search of each drug term in each claim."""
+        claims_df = pd.read_csv(sample_raw_claims_df_path)
+        claims_df = claims_df[claims_df.claims.notna()].reset_index(drop=True)
+        drug_terms = extract_drug_terms(claims_df)
+        self.assertIn('acei/arb', drug_terms)
+        self.assertEqual(drug_terms, sorted(set(drug_terms)))
+
+        claim_positions, drug_claim_index = build_drug_claim_index(claims_df.claims, drug_terms)
+        expected_positions = [i for i, c in enumerate(claims_df.claims) if any(d in c for d in drug_terms)]
+        self.assertEqual(claim_positions.tolist(), expected_positions)
+        for drug, claim_ids in drug_claim_index.items():
+            expected_ids = [k for k, i in enumerate(expected_positions) if drug in claims_df.claims[i]]
+            self.assertEqual(claim_ids.tolist(), expected_ids)
+
+        drug_terms_mention = get_drug_terms_mention(drug_claim_index, len(claim_positions))
+        for claim_id, drugs in enumerate(drug_terms_mention):
+            claim = claims_df.claims[claim_positions[claim_id]]
+            self.assertEqual(drugs, [d for d in drug_terms if d in claim])
+
+    def test_6_build_drug_claim_index_overlapping_terms(self):
+        """Test that drug terms sharing a prefix or nested in each other are all found."""
+        claims = ["hydroxychloroquine was not effective", "no drug mentioned", "ace inhibitors and acei/arb"]
+        claim_positions, drug_claim_index = build_drug_claim_index(
+            claims, ['ace', 'acei', 'acei/arb', 'chloroquine', 'hydroxychloroquine'])
+        self.assertTrue(np.array_equal(claim_positions, [0, 2]))
+        self.assertEqual({d: ids.tolist() for d, ids in drug_claim_index.items()},
+                         {'ace': [1], 'acei': [1], 'acei/arb': [1], 'chloroquine': [0], 'hydroxychloroquine': [0]})
+
+    def test_7_pair_similar_claims_top_k(self):
+        """Test that top-k pairing keeps the best partners of each claim out of the thresholded pairs."""
+        all_pairs = pair_similar_claims(self.claims_df, self.nlp, threshold=None)
+        self.assertEqual(len(all_pairs.columns), 7)
+        self.assertEqual(len(all_pairs), 8)
+        self.assertTrue((all_pairs.paper1_cord_uid != all_pairs.paper2_cord_uid).all())
+
+        threshold_pairs = pair_similar_claims(self.claims_df, self.nlp, threshold=0.9)
+        self.assertTrue((threshold_pairs.similarity_score >= 0.9).all())
+        self.assertEqual(len(threshold_pairs), (all_pairs.similarity_score >= 0.9).sum())
+
+        top_pairs = pair_similar_claims(self.claims_df, self.nlp, threshold=None, top_k=1)
+        # Each claim keeps its single most similar partner
+        claims_in_pairs = set(all_pairs.text1) | set(all_pairs.text2)
+        self.assertLessEqual(len(top_pairs), len(claims_in_pairs))
+        self.assertEqual(set(top_pairs.text1) | set(top_pairs.text2), claims_in_pairs)
+        for claim in claims_in_pairs:
+            partners = all_pairs[(all_pairs.text1 == claim) | (all_pairs.text2 == claim)]
+            top_partners = top_pairs[(top_pairs.text1 == claim) | (top_pairs.text2 == claim)]
+            self.assertAlmostEqual(top_partners.similarity_score.max(), partners.similarity_score.max(), places=5)
+
+    def test_8_claim_pair_tables(self):
+        """Test that the normalized pair tables reference claims by id and join back to the pairs dataframe."""
+        self.claims_df['cord_uid'] = self.claims_df.cord_uid.map({'a': 'ug7v899j', 'b': '02tnwd4m',
+                                                                  'c': 'not_in_metadata', 'd': 'ejv2xln0'})
+        tables = pair_similar_claims(self.claims_df, self.nlp, threshold=None, return_tables=True)
+        self.assertIsInstance(tables, ClaimPairTables)
+        self.assertEqual(list(tables.pairs.columns), ['claim_i', 'claim_j', 'similarity'])
+        self.assertEqual(tables.pairs.claim_i.dtype, np.int32)
+        self.assertEqual(tables.pairs.similarity.dtype, np.float32)
+        self.assertEqual(len(tables.claims), 7)
+        self.assertEqual(len(tables.papers), 4)
+
+        claims_paired_df = pair_similar_claims(self.claims_df, self.nlp, threshold=None)
+        pd.testing.assert_frame_equal(tables.to_frame(), claims_paired_df)
+        chunks = list(tables.iter_frames(chunk_size=3))
+        self.assertEqual([len(c) for c in chunks], [3, 3, 2])
+
+        tables = add_cord_metadata(tables, sample_metadata_path)
+        claims_paired_meta_df = tables.to_frame()
+        self.assertEqual(len(claims_paired_meta_df.columns), 11)
+        # Pairs with a claim from the paper missing in the metadata are dropped
+        self.assertEqual(len(claims_paired_meta_df), 3)
+        self.assertTrue(claims_paired_meta_df.title1.notna().all())
+
+    def test_9_pair_similar_claims_in_parallel(self):
+        """Test that pairing across worker processes gives the same pairs as pairing serially."""
+        tables = pair_similar_claims(self.claims_df, self.nlp, threshold=None, return_tables=True)
+        parallel_tables = pair_similar_claims(self.claims_df, self.nlp, threshold=None, return_tables=True,
+                                              num_workers=2)
+        sort_columns = ['claim_i', 'claim_j']
+        pd.testing.assert_frame_equal(
+            parallel_tables.pairs.sort_values(sort_columns).reset_index(drop=True),
+            tables.pairs.sort_values(sort_columns).reset_index(drop=True))
+
+        with self.assertRaises(ValueError):
+            pair_similar_claims(self.claims_df, self.nlp, top_k=1, num_workers=2)
+
+    def test_10_similarity_histogram(self):
+        """Test that the similarity histogram counts the pairs of any threshold, and pairs can be rescored."""
+        tables = pair_similar_claims(self.claims_df, self.nlp, threshold=0.8, return_tables=True)
+        all_pairs = pair_similar_claims(self.claims_df, self.nlp, threshold=None, return_tables=True).pairs
+        histogram = tables.similarity_histogram
+
+        self.assertEqual(histogram.count_pairs().sum(), len(all_pairs))
+        self.assertEqual(histogram.count_pairs(0.8).sum(), len(tables.pairs))
+        thresholds = [0.0, 0.5, 0.7, 0.9]
+        sweep = histogram.sweep(thresholds)
+        self.assertEqual(list(sweep.columns), thresholds)
+        self.assertEqual(sweep.sum().tolist(), [(all_pairs.similarity >= t).sum() for t in thresholds])
+        self.assertEqual(histogram.count_pairs(0.5).tolist(), sweep[0.5].tolist())
+        parallel_histogram = pair_similar_claims(self.claims_df, self.nlp, threshold=0.8, return_tables=True,
+                                                 num_workers=2).similarity_histogram
+        np.testing.assert_array_equal(parallel_histogram.counts, histogram.counts)
+
+        with tempfile.TemporaryDirectory() as out_dir:
+            pair_similar_claims(self.claims_df, self.nlp, threshold=0.8, out_dir=out_dir)
+            np.testing.assert_array_equal(load_claim_pair_tables(out_dir).similarity_histogram.counts,
+                                          histogram.counts)
+            self.assertEqual(rematerialize_claim_pairs(out_dir, threshold=None), len(all_pairs))
+            stored_tables = load_claim_pair_tables(out_dir)
+            self.assertEqual(len(stored_tables.pairs), len(all_pairs))
+            np.testing.assert_array_equal(stored_tables.similarity_histogram.counts, histogram.counts)
+
+    def test_11_pair_similar_claims_tfidf(self):
+        """Test that the TF-IDF backend pairs the same candidates as the scispacy backend, with TF-IDF similarities."""
+        tables = pair_similar_claims(self.claims_df, self.nlp, threshold=None, return_tables=True)
+        tfidf_tables = pair_similar_claims(self.claims_df, None, threshold=None, return_tables=True, backend='tfidf')
+
+        self.assertEqual(list(tfidf_tables.pairs.columns), list(tables.pairs.columns))
+        self.assertEqual(tfidf_tables.pairs.claim_i.tolist(), tables.pairs.claim_i.tolist())
+        self.assertEqual(tfidf_tables.pairs.claim_j.tolist(), tables.pairs.claim_j.tolist())
+        self.assertTrue(((tfidf_tables.pairs.similarity >= 0) & (tfidf_tables.pairs.similarity <= 1 + 1e-6)).all())
+        self.assertEqual(list(pair_similar_claims(self.claims_df, None, backend='tfidf').columns),
+                         list(tables.to_frame().columns))
+
+        threshold_pairs = pair_similar_claims(self.claims_df, None, threshold=0.2, return_tables=True,
+                                              backend='tfidf').pairs
+        self.assertEqual(len(threshold_pairs), (tfidf_tables.pairs.similarity >= 0.2).sum())
+        with tempfile.TemporaryDirectory() as out_dir:
+            pair_similar_claims(self.claims_df, None, threshold=0.2, out_dir=out_dir, backend='tfidf', num_workers=2)
+            self.assertEqual(len(load_claim_pair_tables(out_dir).pairs), len(threshold_pairs))
+            self.assertEqual(rematerialize_claim_pairs(out_dir, threshold=None), len(tfidf_tables.pairs))
+
+        with self.assertRaises(ValueError):
+            pair_similar_claims(self.claims_df, None, backend='word2vec')
+
+    def test_12_expand_abbreviations(self):
+        """Test that claims are matched and embedded with the abbreviations of their paper expanded."""
+        abbreviation_maps = {'a': {'RDV': 'remdesivir', 'LPV/r': 'lopinavir/ritonavir'},
+                             'b': {'HCQ': 'hydroxychloroquine'}}
+        claims = ['RDV shortened recovery, unlike LPV/r', 'HCQ and RDV were compared', 'RDVs were compared']
+        self.assertEqual(expand_abbreviations(claims, ['a', 'b', 'a'], abbreviation_maps),
+                         ['remdesivir shortened recovery, unlike lopinavir/ritonavir', 'hydroxychloroquine and RDV '
+                          'were compared', 'RDVs were compared'])
+
+        claims_df = self.claims_df.copy()
+        claims_df.loc[1, 'claims'] = 'lopinavir and RDV were both well tolerated'
+        claims_df.loc[4, 'claims'] = 'RDV reduced viral load in the lower respiratory tract'
+        tables = pair_similar_claims(self.claims_df, self.nlp, threshold=None, return_tables=True)
+        expanded_tables = pair_similar_claims(claims_df, self.nlp, threshold=None, return_tables=True,
+                                              abbreviation_maps={'a': {'RDV': 'remdesivir'},
+                                                                 'c': {'RDV': 'remdesivir'}})
+        pd.testing.assert_frame_equal(expanded_tables.pairs, tables.pairs)
+        self.assertEqual(expanded_tables.claims.claims.iloc[4], claims_df.claims.iloc[4])
+        unexpanded_tables = pair_similar_claims(claims_df, self.nlp, threshold=None, return_tables=True)
+        self.assertLess(len(unexpanded_tables.pairs), len(tables.pairs))
+
+    def test_13_pair_collapsed_claims(self):
+        """Test that a claim collapsed from several papers is paired with the claims of each of its papers."""
+        claims_df = pd.DataFrame({'cord_uid': ['a', 'a', 'a'],
+                                  'cord_uids': [['a', 'b'], ['a'], ['a']],
+                                  'drug_terms_used': ['remdesivir'] * 3,
+                                  'claims': ['remdesivir shortened recovery', 'remdesivir did not shorten recovery',
+                                             'remdesivir reduced viral load']})
+        new_claims_df = pd.DataFrame({'cord_uid': ['a'], 'drug_terms_used': ['remdesivir'],
+                                      'claims': ['remdesivir was well tolerated']})
+
+        tables = pair_similar_claims(claims_df, self.nlp, threshold=None, return_tables=True)
+        # The second and third claims are only from the same paper
+        self.assertEqual(list(zip(tables.pairs.claim_i, tables.pairs.claim_j)), [(0, 1), (0, 2)])
+        self.assertEqual(plan_claim_pairing(claims_df)['candidate_pairs'], 2)
+        with tempfile.TemporaryDirectory() as out_dir:
+            pair_similar_claims(claims_df, self.nlp, threshold=None, out_dir=out_dir)
+            self.assertEqual(pair_new_claims(new_claims_df, self.nlp, out_dir, threshold=None), 1)
+            self.assertEqual(rematerialize_claim_pairs(out_dir, threshold=None), 3)
+            self.assertEqual([list(cord_uids) for cord_uids in load_claim_pair_tables(out_dir).claims.cord_uids],
+                             [['a', 'b'], ['a'], ['a'], ['a']])
@@ -0,0 +1,36 @@
+"""Tests for batched sentence tokenization."""
+
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from contradictory_claims.data import sentence_tokenizer
+from contradictory_claims.data.sentence_tokenizer import sentence_spans, split_sentences
+from nltk import sent_tokenize
+
+
+class TestSentenceTokenizer(unittest.TestCase):
+    """Tests for batched sentence tokenization."""
+
+    def setUp(self) -> None:
+        """Set up texts to tokenize."""
+        self.texts = ['Remdesivir shortened recovery. It was well tolerated by most patients.',
+                      'Dr. Smith et al. reported no benefit of lopinavir. Further trials are needed!',
+                      'Remdesivir shortened recovery. It was well tolerated by most patients.',
+                      'No sentence boundary here']
+
+    def test_1_split_sentences(self):
+        """Test that sentences are split as nltk.sent_tokenize splits them."""
+        self.assertEqual(split_sentences(self.texts), [sent_tokenize(text) for text in self.texts])
+        self.assertEqual(split_sentences(self.texts, num_workers=2), [sent_tokenize(text) for text in self.texts])
+        self.assertEqual(split_sentences([]), [])
+
+    def test_2_sentence_spans(self):
+        """Test that sentence offsets slice the sentences out of the texts, and repeated texts are cached."""
+        sentence_tokenizer._span_cache.clear()
+        text_spans = sentence_spans(self.texts)
+        self.assertEqual(len(sentence_tokenizer._span_cache), 3)
+        for text, spans in zip(self.texts, text_spans):
+            self.assertEqual(spans.shape[1], 2)
+            self.assertEqual([text[start:end] for start, end in spans], sent_tokenize(text))
+        self.assertIs(sentence_spans(self.texts[:1])[0], text_spans[0])
@@ -0,0 +1,68 @@
+"""Tests for sharing word vectors between processes."""
+
+# -*- coding: utf-8 -*-
+
+import tempfile
+import unittest
+
+import numpy as np
+import spacy
+import thinc.extra.load_nlp
+from contradictory_claims.data.shared_vectors import attach_shared_vectors, export_shared_vectors,\
+    has_shared_vectors, load_model_with_shared_vectors
+
+
+class TestSharedVectors(unittest.TestCase):
+    """Tests for sharing word vectors between processes."""
+
+    def test_1_export_attach_shared_vectors(self):
+        """Test that an attached vector table is memory-mapped and keeps vectors set after loading."""
+        nlp = spacy.blank('en')
+        nlp.vocab.set_vector('remdesivir', np.arange(4, dtype=np.float32))
+        nlp.vocab.set_vector('coronavirus', np.ones(4, dtype=np.float32))
+
+        with tempfile.TemporaryDirectory() as vectors_dir:
+            self.assertFalse(has_shared_vectors(vectors_dir))
+            export_shared_vectors(nlp, vectors_dir)
+            self.assertTrue(has_shared_vectors(vectors_dir))
+
+            worker_nlp = spacy.blank('en')
+            worker_nlp.vocab.set_vector('remdesivir', np.arange(4, dtype=np.float32))
+            attach_shared_vectors(worker_nlp, vectors_dir)
+
+            self.assertIsInstance(worker_nlp.vocab.vectors.data, np.memmap)
+            np.testing.assert_array_equal(worker_nlp.vocab.get_vector('remdesivir'), np.arange(4))
+            np.testing.assert_array_equal(worker_nlp.vocab.get_vector('coronavirus'), np.ones(4))
+            np.testing.assert_array_equal(worker_nlp('coronavirus').vector, np.ones(4))
+
+    def test_2_load_model_with_shared_vectors(self):
+        """Test that a model loaded with an exported vector table does not load its own, and runs on the shared one."""
+        nlp = spacy.blank('en')
+        rng = np.random.RandomState(0)
+        for word in ['remdesivir', 'shortened', 'the', 'recovery', 'virus', 'spread']:
+            nlp.vocab.set_vector(word, rng.standard_normal(4).astype(np.float32))
+        nlp.vocab.vectors.name = 'test_model.vectors'
+        # A tagger trained on the vectors looks them up through the vector table registered with thinc
+        tagger = nlp.create_pipe('tagger')
+        tagger.add_label('N')
+        tagger.add_label('V')
+        nlp.add_pipe(tagger)
+        optimizer = nlp.begin_training()
+        for _ in range(10):
+            nlp.update(['remdesivir shortened the recovery', 'the virus spread'],
+                       [{'tags': ['N', 'V', 'N', 'N']}, {'tags': ['N', 'N', 'V']}], sgd=optimizer)
+
+        with tempfile.TemporaryDirectory() as model_dir, tempfile.TemporaryDirectory() as vectors_dir:
+            nlp.to_disk(model_dir)
+            nlp = spacy.load(model_dir)
+            nlp.vocab.set_vector('coronavirus', np.ones(4, dtype=np.float32))
+            export_shared_vectors(nlp, vectors_dir)
+
+            worker_nlp = load_model_with_shared_vectors(model_dir, vectors_dir)
+            vectors = worker_nlp.vocab.vectors
+            self.assertIsInstance(vectors.data, np.memmap)
+            self.assertTrue(np.shares_memory(thinc.extra.load_nlp.VECTORS[('cpu', vectors.name)], vectors.data))
+            np.testing.assert_array_equal(worker_nlp.vocab.get_vector('remdesivir'), nlp.vocab.get_vector('remdesivir'))
+            np.testing.assert_array_equal(worker_nlp('coronavirus').vector, np.ones(4))
+            text = 'remdesivir shortened the virus spread'
+            self.assertEqual([token.tag_ for token in worker_nlp(text)], [token.tag_ for token in nlp(text)])
@@ -0,0 +1,75 @@
+"""Tests for the tokenized corpus cache."""
+
+# -*- coding: utf-8 -*-
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+from contradictory_claims.data.tokenized_corpus import encode_corpus, load_tokenized_corpus
+
+
+class WordTokenizer:
+    """Tokenizer mapping each word to its length, with a start and end token, counting its calls."""
+
+    name_or_path = 'word-length'
+    pad_token_id = 1
+    padding_side = 'right'
+
+    def __init__(self):
+        """Initialize the call counter."""
+        self.num_calls = 0
+
+    def batch_encode_plus(self, texts, max_length, truncation, **kwargs):
+        """Encode texts as the word lengths between a start token (0) and an end token (2)."""
+        self.num_calls += 1
+        input_ids = [[0] + [len(word) + 10 for word in text.split()][:max_length - 2] + [2] for text in texts]
+        return {'input_ids': input_ids}
+
+
+class TestTokenizedCorpus(unittest.TestCase):
+    """Tests for the tokenized corpus cache."""
+
+    def test_1_encode_corpus(self):
+        """Test that a corpus is tokenized once and then loaded memory-mapped from the cache."""
+        texts = ['Remdesivir shortened recovery', '', 'Chloroquine had no effect on viral load in patients']
+        tokenizer = WordTokenizer()
+        with tempfile.TemporaryDirectory() as cache_dir:
+            corpus = encode_corpus(texts, tokenizer, 6, cache_dir)
+            self.assertEqual(corpus.num_texts, 3)
+            self.assertIsInstance(corpus.token_ids, np.memmap)
+            self.assertEqual(corpus.token_ids.dtype, np.int32)
+            self.assertEqual(corpus.sequence(0).tolist(), [0, 20, 19, 18, 2])
+            self.assertEqual(corpus.sequence(1).tolist(), [0, 2])
+            self.assertEqual(corpus.padded_sequence(1, 6), [0, 2, 1, 1, 1, 1])
+
+            cached_corpus = encode_corpus(texts, tokenizer, 6, cache_dir)
+            self.assertEqual(tokenizer.num_calls, 1)
+            np.testing.assert_array_equal(cached_corpus.token_ids, corpus.token_ids)
+
+            # A different maximum length or different texts are tokenized again
+            encode_corpus(texts, tokenizer, 8, cache_dir)
+            encode_corpus(texts[:2], tokenizer, 6, cache_dir)
+            self.assertEqual(tokenizer.num_calls, 3)
+            self.assertEqual(len(os.listdir(cache_dir)), 3)
+
+    def test_2_padded(self):
+        """Test that padding the whole corpus matches padding each text."""
+        texts = ['a bb ccc', 'dddd', 'ee f gg hhh iiii', '']
+        with tempfile.TemporaryDirectory() as cache_dir:
+            corpus = encode_corpus(texts, WordTokenizer(), 5, cache_dir)
+            padded = corpus.padded(5)
+            self.assertEqual(padded.shape, (4, 5))
+            self.assertEqual(padded.tolist(), [corpus.padded_sequence(i, 5) for i in range(4)])
+            self.assertEqual(padded[2].tolist(), [0, 12, 11, 12, 2])
+
+            left_corpus = load_tokenized_corpus(os.path.join(cache_dir, os.listdir(cache_dir)[0]))
+            left_corpus = left_corpus._replace(padding_side='left', pad_token_id=5)
+            self.assertEqual(left_corpus.padded(5)[1].tolist(), [5, 5, 0, 14, 2])
+            self.assertEqual(left_corpus.padded(5).tolist(), [left_corpus.padded_sequence(i, 5) for i in range(4)])
+            self.assertEqual(left_corpus.padded_batch([3, 1], 5).tolist(),
+                             [left_corpus.padded_sequence(i, 5) for i in [3, 1]])
+            self.assertEqual(corpus.padded_batch([2, 0, 2], 5).tolist(),
+                             [corpus.padded_sequence(i, 5) for i in [2, 0, 2]])
+            self.assertEqual(corpus.padded_batch([], 5).shape, (0, 5))
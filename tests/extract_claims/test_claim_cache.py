@@ -0,0 +1,45 @@
+"""Test case for the cache of claim extraction results."""
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+from contradictory_claims.data.sentence_tokenizer import text_key
+from contradictory_claims.extract_claims.claim_cache import ClaimCache, ParagraphClaims, file_fingerprint
+
+
+class TestClaimCache(unittest.TestCase):
+    """Test for the cache of claim extraction results."""
+
+    def test_read_write(self):
+        """Test that cached results are read back for the same model only."""
+        claims = ParagraphClaims(spans=np.array([[0, 17], [18, 35]]), labels=np.array([0, 1], dtype=np.int8),
+                                 probabilities=np.array([0.2, 0.9], dtype=np.float32))
+        key = text_key('Remdesivir helps. Remdesivir works.')
+        with tempfile.TemporaryDirectory() as cache_dir:
+            claim_cache = ClaimCache(path=os.path.join(cache_dir, 'claims.db'), fingerprint='model')
+            self.assertEqual(claim_cache.read([key]), {})
+            claim_cache.write({key: claims, text_key(''): ParagraphClaims(
+                spans=np.zeros((0, 2), dtype=np.int64), labels=np.zeros(0, dtype=np.int8),
+                probabilities=np.zeros(0, dtype=np.float32))})
+
+            found = claim_cache.read([key, text_key('Not cached.'), key, text_key('')])
+            self.assertEqual(set(found), {key, text_key('')})
+            np.testing.assert_array_equal(found[key].spans, claims.spans)
+            np.testing.assert_array_equal(found[key].labels, claims.labels)
+            np.testing.assert_array_equal(found[key].probabilities, claims.probabilities)
+            self.assertEqual(found[text_key('')].spans.shape, (0, 2))
+            self.assertEqual(claim_cache._replace(fingerprint='other model').read([key]), {})
+
+    def test_file_fingerprint(self):
+        """Test that file fingerprints change with the contents of the files."""
+        with tempfile.TemporaryDirectory() as model_dir:
+            weight_path = os.path.join(model_dir, 'weights.th')
+            with open(weight_path, 'wb') as f:
+                f.write(b'weights')
+            fingerprint = file_fingerprint([weight_path])
+            self.assertEqual(file_fingerprint([weight_path], block_size=2), fingerprint)
+            with open(weight_path, 'wb') as f:
+                f.write(b'new weights')
+            self.assertNotEqual(file_fingerprint([weight_path]), fingerprint)
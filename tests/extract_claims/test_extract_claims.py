@@ -1,6 +1,8 @@
 """Testing claim extraction functions."""
 
 
+import os
+import tempfile
 import unittest
 
 import pandas as pd
@@ -18,6 +20,14 @@ class TestExtractClaims(unittest.TestCase):
         self.model = extract_claims.load_claim_extraction_model(model_path=MODEL_PATH, weight_path=WEIGHT_PATH)
         self.assertIsNotNone(self.model)
 
+    def test_get_claim_extraction_model(self) -> None:
+        """Check that a model is loaded once per process until it is evicted."""
+        model, claim_predictor = extract_claims.get_claim_extraction_model(MODEL_PATH, WEIGHT_PATH)
+        self.assertIs(extract_claims.get_claim_extraction_model(MODEL_PATH, WEIGHT_PATH)[0], model)
+        self.assertIs(extract_claims.warm_up_claim_extraction_model(MODEL_PATH, WEIGHT_PATH)[1], claim_predictor)
+        extract_claims.evict_claim_extraction_model(MODEL_PATH, WEIGHT_PATH)
+        self.assertIsNot(extract_claims.get_claim_extraction_model(MODEL_PATH, WEIGHT_PATH)[0], model)
+
     def test_extract_claims(self):
         """Check if it indeed returns claims."""
         df_test = pd.DataFrame({
@@ -87,3 +97,24 @@ class TestExtractClaims(unittest.TestCase):
         self.assertTrue("claims" in df_final.columns)
         self.assertGreaterEqual(df_final['claim_flag'].sum(), 1)  # check if any semtemce has a claim_flag found
         self.assertGreaterEqual(df_final.shape[0], df_test.shape[0])
+
+        # Repeated paragraphs each get their own claims, instead of the claims of every row with the same text
+        df_repeated = extract_claims.extract_claims(pd.concat([df_test, df_test], ignore_index=True), col_name="text")
+        self.assertEqual(df_repeated.shape[0], 2 * df_final.shape[0])
+        pd.testing.assert_frame_equal(df_repeated.iloc[df_final.shape[0]:].reset_index(drop=True), df_final)
+
+        # Extracting in shards gives the same result, also when resuming from the finished shards
+        with tempfile.TemporaryDirectory() as out_dir:
+            df_sharded = extract_claims.extract_claims_sharded(df_test, out_dir, col_name="text", shard_size=1)
+            pd.testing.assert_frame_equal(df_sharded, df_final)
+            resumed = extract_claims.extract_claims_sharded(df_test, out_dir, col_name="text", shard_size=1)
+            pd.testing.assert_frame_equal(resumed, df_final)
+            df_empty = extract_claims.extract_claims_sharded(df_test.iloc[:0], os.path.join(out_dir, 'empty'),
+                                                             col_name="text")
+            pd.testing.assert_frame_equal(df_empty, extract_claims.extract_claims(df_test.iloc[:0], col_name="text"))
+
+            # Paragraphs found in the cache give the same claims as running the model
+            cache_path = os.path.join(out_dir, 'claims.db')
+            for _ in range(2):
+                df_cached = extract_claims.extract_claims(df_test, col_name="text", cache_path=cache_path)
+                pd.testing.assert_frame_equal(df_cached, df_final)
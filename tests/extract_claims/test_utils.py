@@ -2,7 +2,8 @@
 
 import unittest
 
-from contradictory_claims.extract_claims.utils import read_json  # noqa: F401
+import numpy as np
+from contradictory_claims.extract_claims.utils import length_sorted_batches, pad_crf_outputs, read_json  # noqa: F401
 
 
 class TestUtils(unittest.TestCase):
@@ -11,3 +12,20 @@ class TestUtils(unittest.TestCase):
     def test_read_json(self):
         """Test of read_json function."""
         pass
+
+    def test_length_sorted_batches(self):
+        """Test that documents are batched in order of length, leaving out empty documents."""
+        batches = length_sorted_batches([3, 1, 0, 5, 1], batch_size=2)
+        self.assertEqual([batch.tolist() for batch in batches], [[1, 4], [0, 3]])
+        self.assertEqual(length_sorted_batches([0, 0], batch_size=2), [])
+
+    def test_pad_crf_outputs(self):
+        """Test that the logits and masks of a batch of documents are padded with zeros."""
+        outputs = [{'logits': [[0.1, 0.9]], 'mask': [1]},
+                   {'logits': [[0.2, 0.8], [0.7, 0.3], [0.4, 0.6]], 'mask': [1, 1, 1]}]
+        logits, mask = pad_crf_outputs(outputs)
+        self.assertEqual(logits.shape, (2, 3, 2))
+        self.assertEqual(logits.dtype, np.float32)
+        np.testing.assert_allclose(logits[0], [[0.1, 0.9], [0, 0], [0, 0]])
+        np.testing.assert_allclose(logits[1], outputs[1]['logits'])
+        self.assertEqual(mask.tolist(), [[1, 0, 0], [1, 1, 1]])
@@ -0,0 +1,87 @@
+"""Benchmarks for the time taken to import the package and start the command line interface."""
+
+# -*- coding: utf-8 -*-
+
+import json
+import subprocess
+import sys
+import unittest
+
+# Modules that must only be imported when the functions that need them are called
+HEAVY_MODULES = ['allennlp', 'keras', 'nltk', 'pandas', 'scispacy', 'sklearn', 'spacy', 'tensorflow', 'torch',
+                 'transformers', 'wandb']
+
+# Upper bound on the time taken to import the package or its command line interface, relative to importing click,
+# its one required dependency. Lenient enough for noisy machines, while importing any of the heavy modules
+# eagerly takes many times longer than click
+MAX_IMPORT_RATIO = 5.0
+
+
+def _run_python(code: str):
+    """
+    Run python code in a fresh interpreter.
+
+    :param code: python code to run
+    :return: standard output of the code
+    """
+    result = subprocess.run([sys.executable, '-c', code], stdout=subprocess.PIPE, check=True)
+    return result.stdout.decode()
+
+
+def _import_times(modules: list):
+    """
+    Import modules in a fresh interpreter, one after the other, and measure the time each import takes.
+
+    :param modules: names of the modules to import
+    :return: Dictionary mapping each module to the cumulative time taken to import it, in seconds, not counting
+        the modules imported before it, as reported by python -X importtime
+    """
+    code = '\n'.join(f'import {module}' for module in modules)
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], stderr=subprocess.PIPE, check=True)
+    import_times = {}
+    for line in result.stderr.decode().splitlines():
+        # Lines are "import time: self [us] | cumulative | imported package", nested modules indented
+        fields = line.split('|')
+        if line.startswith('import time:') and len(fields) == 3 and fields[1].strip().isdigit():
+            import_times.setdefault(fields[2].strip(), int(fields[1]) / 1e6)
+
+    return {module: import_times[module] for module in modules}
+
+
+class TestImportTime(unittest.TestCase):
+    """Benchmarks for the time taken to import the package and start the command line interface."""
+
+    def test_1_import_is_lazy(self):
+        """Test that importing the package does not import the heavy dependencies."""
+        code = ('import json, sys\n'
+                'import contradictory_claims, contradictory_claims.extract_claims\n'
+                f'print(json.dumps(sorted(m for m in {HEAVY_MODULES!r} if m in sys.modules)))')
+        output = _run_python(code)
+        self.assertEqual(json.loads(output), [])
+
+    def test_2_import_time(self):
+        """Test that importing the package and the command line interface is fast, relative to importing click."""
+        import_times = _import_times(['click', 'contradictory_claims', 'contradictory_claims.cli'])
+        budget = MAX_IMPORT_RATIO * import_times['click']
+        self.assertLess(import_times['contradictory_claims'], budget)
+        self.assertLess(import_times['contradictory_claims.cli'], budget)
+
+    def test_3_cli_help_is_lazy(self):
+        """Test that printing the command line help does not import the heavy dependencies."""
+        code = ('import json, sys\n'
+                'from contradictory_claims.cli import main\n'
+                'try:\n'
+                '    main(["--help"])\n'
+                'except SystemExit:\n'
+                '    pass\n'
+                f'print(json.dumps(sorted(m for m in {HEAVY_MODULES!r} if m in sys.modules)))')
+        output = _run_python(code)
+        self.assertEqual(json.loads(output.splitlines()[-1]), [])
+
+    def test_4_lazy_exports(self):
+        """Test that the re-exported functions are listed without importing their submodules."""
+        import contradictory_claims
+        self.assertIn('load_med_nli', dir(contradictory_claims))
+        self.assertIn('train_model', contradictory_claims.__all__)
+        with self.assertRaises(AttributeError):
+            contradictory_claims.not_a_function